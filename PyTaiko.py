@@ -1,10 +1,10 @@
 import logging
+import multiprocessing
 import os
 from pathlib import Path
 import sys
 import argparse
 
-import sqlite3
 
 import pyray as ray
 from raylib.defines import (
@@ -16,6 +16,7 @@ from raylib.defines import (
 
 from libs.audio import audio
 from libs.global_data import PlayerNum
+from libs.score_store import score_store
 from libs.screen import Screen
 from libs.tja import TJAParser
 from libs.utils import (
@@ -116,26 +117,8 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 def create_song_db():
     """Create the scores database if it doesn't exist"""
-    with sqlite3.connect('scores.db') as con:
-        cursor = con.cursor()
-        create_table_query = '''
-        CREATE TABLE IF NOT EXISTS Scores (
-            hash TEXT PRIMARY KEY,
-            en_name TEXT NOT NULL,
-            jp_name TEXT NOT NULL,
-            diff INTEGER,
-            score INTEGER,
-            good INTEGER,
-            ok INTEGER,
-            bad INTEGER,
-            drumroll INTEGER,
-            combo INTEGER,
-            clear INTEGER
-        );
-        '''
-        cursor.execute(create_table_query)
-        con.commit()
-        logger.info("Scores database created successfully")
+    score_store.create_table()
+    logger.info("Scores database created successfully")
 
 def update_camera_for_window_size(camera, virtual_width, virtual_height):
     """Update camera zoom, offset, scale, and rotation to maintain aspect ratio"""
@@ -241,7 +224,7 @@ def main():
             parser.error(f"Song file not found: {args.song_path}")
         else:
             path = Path(os.path.abspath(path))
-            tja = TJAParser(path)
+            tja = TJAParser(path, metadata_only=True)
             if args.difficulty is not None:
                 if args.difficulty not in tja.metadata.course_data.keys():
                     parser.error(f"Invalid difficulty: {args.difficulty}. Available: {list(tja.metadata.course_data.keys())}")
@@ -372,4 +355,5 @@ def main():
     logger.info("Window closed and audio device shut down")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
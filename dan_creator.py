@@ -2,8 +2,11 @@ import json
 import sys
 from pathlib import Path
 
+from libs.song_index import SongIndex
+
 
 def create_dan(cache_path: Path):
+    index = SongIndex(cache_path / "song_index.db")
     dan_data = {}
     dan_data["title"] = input("Enter the title: ")
     dan_data["color"] = int(input("Enter the color (0 10th Kyuu, 1 5th Kyuu, 2 Shodan, 3 6th Dan, 4 Kurouto, 5 Tatsujin, 6 Gaidan): "))
@@ -23,13 +26,13 @@ def create_dan(cache_path: Path):
     for i in range(3):
         chart = dict()
         chart_path = Path(input(f"Enter chart path {i+1}: "))
-        with open(f"{cache_path}/path_to_hash.json", encoding='utf-8') as f:
-            hash_directory = json.load(f)
-            chart["hash"] = hash_directory.get(chart_path)
-        with open(f"{cache_path}/song_hashes.json", encoding='utf-8') as f:
-            hash_directory = json.load(f)
-            chart["title"] = hash_directory[chart["hash"]][0]["title"]["en"]
-            chart["subtitle"] = hash_directory[chart["hash"]][0]["subtitle"]["en"]
+        song = index.get_song_by_path(chart_path)
+        if song is None:
+            print(f"Chart is not in the song index: {chart_path}")
+            return
+        chart["hash"] = song.hash
+        chart["title"] = song.title["en"]
+        chart["subtitle"] = song.subtitle["en"]
         chart["difficulty"] = int(input(f"Enter chart difficulty {i+1}: "))
         dan_data["charts"].append(chart)
     with open("dan.json", "w", encoding="utf-8") as f:
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+from libs.song_index import SongIndex
+
+
+def print_report(cache_path: Path):
+    index = SongIndex(cache_path / "song_index.db")
+    failures = index.get_failures()
+    for path, error in failures:
+        print(f"{path}\n    {error}")
+    print(f"{index.song_count()} songs indexed, {len(failures)} charts failed to parse.")
+    if failures:
+        print("Failed charts are skipped on launch until the file is modified.")
+
+def main():
+    print_report(Path(sys.argv[1]) if len(sys.argv) > 1 else Path("cache"))
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,8 @@ class GeneralConfig(TypedDict):
     log_level: int
     fake_online: bool
     practice_mode_bar_delay: int
+    index_workers: int
+    library_poll_interval: int
 
 class NameplateConfig(TypedDict):
     name: str
@@ -39,6 +41,7 @@ class KeysConfig(TypedDict):
     pause_key: int
     back_key: int
     restart_key: int
+    search_key: int
 
 class Keys1PConfig(TypedDict):
     left_kat: list[int]
@@ -1,3 +1,4 @@
+import bisect
 from dataclasses import dataclass
 import json
 import logging
@@ -7,14 +8,21 @@ from typing import Optional, Union
 from libs.audio import audio
 from libs.animation import Animation, MoveAnimation
 from libs.global_data import Crown, Difficulty
-from libs.tja import TJAParser, test_encodings
+from libs.score_store import score_store
+from libs.song_hash import SongStream
+from libs.song_index import CourseEntry, FileStat, SongEntry, song_index
+from libs.song_library import LibraryChanges, song_library
+from libs.tja import NoteColumns, TJAParser, decode_file
 from libs.texture import tex
 from libs.utils import OutlinedText, get_current_ms, global_data
 from datetime import datetime, timedelta
-import sqlite3
 import pyray as ray
 
 BOX_CENTER = 594 * tex.screen_scale
+# Virtual folder holding the results of a song search
+SEARCH_PATH = Path('<search>')
+# Most songs shown for a search, the rest are reached by typing more of the query
+SEARCH_RESULT_LIMIT = 200
 
 logger = logging.getLogger(__name__)
 
@@ -165,28 +173,10 @@ class SongBox(BaseBox):
         self.text_loaded = True
 
     def get_scores(self):
-        with sqlite3.connect('scores.db') as con:
-            cursor = con.cursor()
-            # Batch database query for all diffs at once
-            if self.tja.metadata.course_data:
-                hash_values = [self.hash[diff] for diff in self.tja.metadata.course_data if diff in self.hash]
-                placeholders = ','.join('?' * len(hash_values))
-
-                batch_query = f"""
-                    SELECT hash, score, good, ok, bad, drumroll, clear
-                    FROM Scores
-                    WHERE hash IN ({placeholders})
-                """
-                cursor.execute(batch_query, hash_values)
-
-                hash_to_score = {row[0]: row[1:] for row in cursor.fetchall()}
-
-                for diff in self.tja.metadata.course_data:
-                    if diff not in self.hash:
-                        continue
-                    diff_hash = self.hash[diff]
-                    self.scores[diff] = hash_to_score.get(diff_hash)
-                self.score_history = None
+        if self.tja.metadata.course_data:
+            self.scores.update(score_store.get_scores(
+                {diff: self.hash[diff] for diff in self.tja.metadata.course_data if diff in self.hash}))
+            self.score_history = None
 
     def update(self, current_time: float, is_diff_select: bool):
         super().update(current_time, is_diff_select)
@@ -256,6 +246,12 @@ class FolderBox(BaseBox):
         self.tja_count_text = OutlinedText(str(self.tja_count), tex.skin_config['song_tja_count'].font_size, ray.WHITE, outline_thickness=5)
         self.text_loaded = True
 
+    def set_tja_count(self, tja_count: int):
+        self.tja_count = tja_count
+        if self.text_loaded:
+            self.tja_count_text.unload()
+            self.tja_count_text = OutlinedText(str(self.tja_count), tex.skin_config['song_tja_count'].font_size, ray.WHITE, outline_thickness=5)
+
     def update(self, current_time: float, is_diff_select: bool):
         super().update(current_time, is_diff_select)
         is_open_prev = self.is_open
@@ -536,6 +532,23 @@ class YellowBox:
 
         self._draw_text(song_box, name)
 
+def count_dan_notes(songs: list[tuple[TJAParser, int, int, int]]) -> int:
+    """Count the notes of every song in a dan course from the song index"""
+    total_notes = 0
+    for song, genre_index, difficulty, level in songs:
+        stats = song_index.get_course_stats(song.file_path, difficulty)
+        if stats is not None:
+            total_notes += stats.note_count
+            continue
+        # Every indexed course has statistics, only a chart missing from the index gets here
+        logger.warning(f"{song.file_path} is not indexed, parsing it to count its notes")
+        notes, branch_m, branch_e, branch_n = song.notes_to_position(difficulty)
+        note_columns = NoteColumns(notes.play_notes)
+        for branch in branch_m + branch_e + branch_n:
+            note_columns.extend(branch.play_notes)
+        total_notes += note_columns.count_notes()
+    return total_notes
+
 class DanBox(BaseBox):
     def __init__(self, name, color: int, songs: list[tuple[TJAParser, int, int, int]], exams: list['Exam']):
         super().__init__(name, color)
@@ -544,15 +557,7 @@ class DanBox(BaseBox):
         self.song_text: list[tuple[OutlinedText, OutlinedText]] = []
         self.total_notes = 0
         self.yellow_box = None
-        for song, genre_index, difficulty, level in self.songs:
-            notes, branch_m, branch_e, branch_n = song.notes_to_position(difficulty)
-            self.total_notes += sum(1 for note in notes.play_notes if note.type < 5)
-            for branch in branch_m:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
-            for branch in branch_e:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
-            for branch in branch_n:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
+        self.total_notes = count_dan_notes(self.songs)
 
     def load_text(self):
         super().load_text()
@@ -815,29 +820,28 @@ def parse_box_def(path: Path):
     name = path.name
     genre = ''
     collection = None
-    encoding = test_encodings(path / "box.def")
 
     try:
-        with open(path / "box.def", 'r', encoding=encoding) as box_def:
-            for line in box_def:
-                line = line.strip()
-                if line.startswith("#GENRE:"):
-                    genre = line.split(":", 1)[1].strip()
-                    texture_index = FileSystemItem.GENRE_MAP.get(genre, SongBox.DEFAULT_INDEX)
-                    if texture_index == SongBox.DEFAULT_INDEX:
-                        texture_index = FileSystemItem.GENRE_MAP_2.get(genre, SongBox.DEFAULT_INDEX)
-                elif line.startswith("#TITLE:"):
+        box_def, _ = decode_file(path / "box.def")
+        for line in box_def.splitlines():
+            line = line.strip()
+            if line.startswith("#GENRE:"):
+                genre = line.split(":", 1)[1].strip()
+                texture_index = FileSystemItem.GENRE_MAP.get(genre, SongBox.DEFAULT_INDEX)
+                if texture_index == SongBox.DEFAULT_INDEX:
+                    texture_index = FileSystemItem.GENRE_MAP_2.get(genre, SongBox.DEFAULT_INDEX)
+            elif line.startswith("#TITLE:"):
+                name = line.split(":", 1)[1].strip()
+            elif line.startswith("#TITLEJA:"):
+                if global_data.config['general']['language'] == 'ja':
                     name = line.split(":", 1)[1].strip()
-                elif line.startswith("#TITLEJA:"):
-                    if global_data.config['general']['language'] == 'ja':
-                        name = line.split(":", 1)[1].strip()
-                elif line.startswith("#COLLECTION"):
-                    collection = line.split(":", 1)[1].strip()
-                if name == '':
-                    if genre:
-                        name = genre
-                    else:
-                        name = path.name
+            elif line.startswith("#COLLECTION"):
+                collection = line.split(":", 1)[1].strip()
+            if name == '':
+                if genre:
+                    name = genre
+                else:
+                    name = path.name
     except Exception as e:
         logger.error(f"Error parsing box.def in {path}: {e}")
 
@@ -898,18 +902,32 @@ class Directory(FileSystemItem):
 
 class SongFile(FileSystemItem):
     """Represents a song file (TJA) in the navigation system"""
-    def __init__(self, path: Path, name: str, texture_index: int, tja=None, name_texture_index: Optional[int]=None):
+    def __init__(self, path: Path, name: str, texture_index: int, tja=None, name_texture_index: Optional[int]=None,
+                 entry: Optional[SongEntry]=None):
         super().__init__(path, name)
-        self.is_recent = (datetime.now() - datetime.fromtimestamp(path.stat().st_mtime)) <= timedelta(days=7)
-        self.tja = tja or TJAParser(path)
+        if entry is None:
+            entry = song_index.get_song_by_path(path)
+        if entry is None:
+            raise KeyError(f"Song is not indexed: {path}")
+        mtime = entry.stat.mtime_ns / 1e9 if entry.stat.mtime_ns >= 0 else path.stat().st_mtime
+        self.is_recent = (datetime.now() - datetime.fromtimestamp(mtime)) <= timedelta(days=7)
+        self.hash = entry.hash
+        self.courses: dict[int, CourseEntry] = entry.courses
+        if tja is None and entry.metadata is not None:
+            tja = TJAParser(path, metadata=entry.metadata, ex_data=entry.ex_data, encoding=entry.encoding)
+        self.tja = tja or TJAParser(path, metadata_only=True, encoding=entry.encoding)
         if self.is_recent:
             self.tja.ex_data.new = True
         title = self.tja.metadata.title.get(global_data.config['general']['language'].lower(), self.tja.metadata.title['en'])
-        self.hash = global_data.song_paths[path]
         self.box = SongBox(title, texture_index, self.tja, name_texture_index=name_texture_index if name_texture_index is not None else texture_index)
-        self.box.hash = global_data.song_hashes[self.hash][0]["diff_hashes"]
+        self.box.hash = entry.diff_hashes
         self.box.get_scores()
 
+    def get_level(self, diff: int) -> Optional[int]:
+        """Get the number of stars of a course, or None if the song does not have it"""
+        course = self.courses.get(diff)
+        return course.level if course is not None else None
+
 @dataclass
 class Exam:
     type: str
@@ -932,13 +950,18 @@ class DanCourse(FileSystemItem):
                 #chart_title = chart["title"]
                 #chart_subtitle = chart["subtitle"]
                 difficulty = chart["difficulty"]
-                if hash in global_data.song_hashes:
-                    path = Path(global_data.song_hashes[hash][0]["file_path"])
-                    if (path.parent.parent / "box.def").exists():
+                entry = song_index.get_song(hash)
+                if entry is not None:
+                    path = entry.file_path
+                    genre_dir = song_library.get(path.parent.parent)
+                    if genre_dir is not None and genre_dir.has_box_def:
                         _, genre_index, _ = parse_box_def(path.parent.parent)
                     else:
                         genre_index = 9
-                    tja = TJAParser(path)
+                    if entry.metadata is not None:
+                        tja = TJAParser(path, metadata=entry.metadata, ex_data=entry.ex_data, encoding=entry.encoding)
+                    else:
+                        tja = TJAParser(path, metadata_only=True, encoding=entry.encoding)
                     self.charts.append((tja, genre_index, difficulty, tja.metadata.course_data[difficulty].level))
                 else:
                     pass
@@ -958,9 +981,14 @@ class FileNavigator:
         self.all_song_files: dict[str, Union[SongFile, DanCourse]] = {}    # path -> SongFile
         self.directory_contents: dict[str, list[Union[Directory, SongFile]]] = {}  # path -> list of items
 
-        # OPTION 2: Lazy crown calculation with caching
-        self.directory_crowns: dict[str, dict] = dict()  # path -> crown list
-        self.crown_cache_dirty: set[str] = set()  # directories that need crown recalculation
+        # Crown counters, kept up to date as songs and scores change
+        self.crown_counters: dict[str, dict[int, list[int]]] = dict()  # path -> diff -> [songs, clears, FCs, DFCs]
+        self.song_crowns: dict[str, dict[int, int]] = dict()  # song path -> crown counted for each diff
+        self.crown_folders: dict[str, list[str]] = dict()  # song path -> folders the song is counted in
+        self._crown_folder_cache: dict[str, list[str]] = dict()
+
+        # Parsed song_list.txt files with the file state they were read at
+        self.song_lists: dict[str, tuple[FileStat, list[tuple[str, str, str]]]] = dict()
 
         # Navigation state - simplified without root-specific state
         self.current_dir = Path()  # Empty path represents virtual root
@@ -971,27 +999,108 @@ class FileNavigator:
         self.selected_index = 0
         self.diff_sort_diff = Difficulty.URA
         self.diff_sort_level = 10
-        self.diff_sort_statistics = dict()
+        # Songs in box.def folders by (course, level), each list sorted by path
+        self.diff_sort_index: dict[tuple[int, int], list[SongFile]] = dict()
+        self._diff_sort_statistics: Optional[dict[int, dict[int, list[int]]]] = None
+        self._diff_sort_scores_version = -1
+        self.search_results: list[SongFile] = []
         self.history = []
         self.box_open = False
         self.genre_bg = None
         self.song_count = 0
         self.in_dan_select = False
+        self.song_stream: Optional[SongStream] = None
+        # Set once the first folder is complete, songs still being indexed are then deferred
+        self.indexing_stream: Optional[SongStream] = None
+        self.deferred_songs: list[Path] = []
+        self.deferred_song_lists: list[Path] = []
+        self.initial_scores_version = 0
         logger.info("FileNavigator initialized")
 
-    def initialize(self, root_dirs: list[Path]):
+    def initialize(self, root_dirs: list[Path], song_stream: Optional[SongStream] = None):
+        """Generate every object for the song folders.
+
+        With a song stream, the songs are only waited for until the first box.def folder
+        is complete. The songs, dan courses and song_list.txt folders still being indexed
+        after that are left out, for take_deferred_changes to hand to apply_library_changes.
+
+        Args:
+            root_dirs (list[Path]): The song folders.
+            song_stream (SongStream, optional): Songs being indexed at the same time, otherwise
+                the songs are read from the song index.
+        """
         self.root_dirs = [Path(p) if not isinstance(p, Path) else p for p in root_dirs]
-        self._generate_all_objects()
+        if not song_library.is_scanned:
+            song_library.scan(self.root_dirs)
+        self.song_stream = song_stream
+        self.indexing_stream = None
+        self.deferred_songs = []
+        self.deferred_song_lists = []
+        self.initial_scores_version = score_store.version
+        try:
+            self._generate_all_objects()
+        finally:
+            self.song_stream = None
+        if song_stream is not None and self.indexing_stream is None:
+            # TJAPlayer3 scores are imported once indexing is done, possibly after the boxes read theirs
+            song_stream.finished.wait()
+            if score_store.version != self.initial_scores_version:
+                self.refresh_scores()
         self._create_virtual_root()
         self.load_current_directory()
         logger.info(f"FileNavigator initialized with root_dirs: {self.root_dirs}")
 
+    def take_deferred_changes(self) -> LibraryChanges:
+        """Wait until the songs left out by initialize are indexed and return them.
+
+        Returns:
+            LibraryChanges: The deferred songs and song lists, and whether scores were imported
+                after the songs read theirs, for apply_library_changes on the main thread.
+        """
+        indexing_stream = self.indexing_stream
+        if indexing_stream is None:
+            return LibraryChanges(song_library)
+        indexing_stream.finished.wait()
+        changes = LibraryChanges(song_library, added=sorted(set(self.deferred_songs)),
+                                 song_lists=list(self.deferred_song_lists),
+                                 scores_changed=score_store.version != self.initial_scores_version)
+        self.indexing_stream = None
+        self.deferred_songs = []
+        self.deferred_song_lists = []
+        logger.info(f"Adding {len(changes.added)} songs and {len(changes.song_lists)} song lists indexed after song select opened")
+        return changes
+
+    def _is_deferring(self) -> bool:
+        """Whether songs still being indexed are left out instead of waited for"""
+        return self.indexing_stream is not None and not self.indexing_stream.finished.is_set()
+
+    def refresh_scores(self):
+        """Read the scores of every song again, and recount the crowns built from them"""
+        for song_obj in list(self.all_song_files.values()) + self.new_items:
+            if isinstance(song_obj, SongFile):
+                self.update_song_crowns(song_obj)
+
+    def _get_song_entry(self, tja_path: Path) -> Optional[SongEntry]:
+        """Get the index entry of a TJA file, waiting for it if it is still being indexed"""
+        if self.song_stream is not None:
+            if self._is_deferring() and self.song_stream.is_pending(tja_path):
+                self.deferred_songs.append(tja_path)
+                return None
+            return self.song_stream.get(tja_path)
+        return song_index.get_song_by_path(tja_path)
+
+    def _wait_for_songs(self):
+        """Wait for the whole index, needed before looking songs up by hash or title"""
+        if self.song_stream is not None:
+            self.song_stream.wait()
+
     def _create_virtual_root(self):
         """Create a virtual root directory containing all root directories"""
         virtual_root_items = []
 
         for root_path in self.root_dirs:
-            if not root_path.exists():
+            root_dir = song_library.get(root_path)
+            if root_dir is None:
                 continue
 
             root_key = str(root_path)
@@ -1000,15 +1109,13 @@ class FileNavigator:
                 virtual_root_items.append(self.all_directories[root_key])
             else:
                 # Root doesn't have box.def, add its immediate children with box.def
-                for child_path in sorted(root_path.iterdir()):
-                    if child_path.is_dir():
-                        child_key = str(child_path)
-                        if child_key in self.all_directories:
-                            virtual_root_items.append(self.all_directories[child_key])
+                for child_dir in root_dir.children:
+                    child_key = str(child_dir.path)
+                    if child_key in self.all_directories:
+                        virtual_root_items.append(self.all_directories[child_key])
 
                 # Also add direct TJA files from root
-                all_tja_files = self._find_tja_files_recursive(root_path)
-                for tja_path in sorted(all_tja_files):
+                for tja_path in sorted(root_dir.song_files()):
                     song_key = str(tja_path)
                     if song_key in self.all_song_files:
                         virtual_root_items.append(self.all_song_files[song_key])
@@ -1022,35 +1129,41 @@ class FileNavigator:
 
         # Generate objects for each root directory
         for root_path in self.root_dirs:
-            if not root_path.exists():
+            if song_library.get(root_path) is None:
                 logging.warning(f"Root directory does not exist: {root_path}")
                 continue
 
             self._generate_objects_recursive(root_path)
 
-        if self.favorite_folder is not None:
-            song_list = self._read_song_list(self.favorite_folder.path)
-            for song_obj in song_list:
-                if str(song_obj) in self.all_song_files:
-                    box = self.all_song_files[str(song_obj)].box
-                    if isinstance(box, DanBox):
-                        logger.warning(f"Cannot favorite DanCourse: {song_obj}")
-                    else:
-                        box.is_favorite = True
+        self._mark_favorites()
 
         logging.info(f"Object generation complete. "
                     f"Directories: {len(self.all_directories)}, "
                     f"Songs: {len(self.all_song_files)}")
 
+    def _mark_favorites(self):
+        """Mark the boxes of the songs listed in the favorites folder"""
+        if self.favorite_folder is None:
+            return
+        song_list = self._read_song_list(self.favorite_folder.path)
+        for song_obj in song_list:
+            if str(song_obj) in self.all_song_files:
+                box = self.all_song_files[str(song_obj)].box
+                if isinstance(box, DanBox):
+                    logger.warning(f"Cannot favorite DanCourse: {song_obj}")
+                else:
+                    box.is_favorite = True
+
     def _generate_objects_recursive(self, dir_path: Path):
         """Recursively generate Directory and SongFile objects for a directory"""
-        if not dir_path.is_dir():
+        library_dir = song_library.get(dir_path)
+        if library_dir is None:
             return
 
         dir_key = str(dir_path)
 
         # Check for box.def
-        has_box_def = (dir_path / "box.def").exists()
+        has_box_def = library_dir.has_box_def
 
         # Only create Directory objects for directories with box.def
         if has_box_def:
@@ -1061,9 +1174,8 @@ class FileNavigator:
             collection = None
 
             name, texture_index, collection = parse_box_def(dir_path)
-            box_png_path = dir_path / "box.png"
-            if box_png_path.exists():
-                box_texture = str(box_png_path)
+            if library_dir.has_box_png:
+                box_texture = str(dir_path / "box.png")
 
             # Count TJA files for this directory
             tja_count = self._count_tja_files(dir_path)
@@ -1090,88 +1202,41 @@ class FileNavigator:
             content_items = []
 
             # Add child directories that have box.def
-            child_dirs = []
-            for item_path in dir_path.iterdir():
-                if item_path.is_dir():
-                    child_has_box_def = (item_path / "box.def").exists()
-                    if child_has_box_def:
-                        child_dirs.append(item_path)
-                        # Recursively generate objects for child directory
-                        self._generate_objects_recursive(item_path)
-
-            # Sort and add child directories
-            for child_path in sorted(child_dirs):
-                child_key = str(child_path)
+            child_dirs = library_dir.box_def_children
+            for child_dir in child_dirs:
+                # Recursively generate objects for child directory
+                self._generate_objects_recursive(child_dir.path)
+
+            # Add child directories
+            for child_dir in child_dirs:
+                child_key = str(child_dir.path)
                 if child_key in self.all_directories:
                     content_items.append(self.all_directories[child_key])
 
-            # Get TJA files for this directory
-            tja_files = self._get_tja_files_for_directory(dir_path)
-
-            # Create SongFile objects
-            for tja_path in sorted(tja_files):
-                song_key = str(tja_path)
-                if song_key not in self.all_song_files and tja_path.name == "dan.json":
-                    valid_dan = True
-                    with open(tja_path, 'r', encoding='utf-8') as file:
-                        dan_data = json.load(file)
-                        for chart in dan_data["charts"]:
-                            hash = chart["hash"]
-                            if hash not in global_data.song_hashes:
-                                valid_dan = False
-                    if valid_dan:
-                        song_obj = DanCourse(tja_path, tja_path.name)
-                        self.all_song_files[song_key] = song_obj
-                elif song_key not in self.all_song_files and tja_path in global_data.song_paths:
-                    song_obj = SongFile(tja_path, tja_path.name, texture_index)
-                    song_obj.box.get_scores()
-                    for course in song_obj.tja.metadata.course_data:
-                        level = song_obj.tja.metadata.course_data[course].level
-
-                        scores = song_obj.box.scores.get(course)
-                        if scores is not None:
-                            is_cleared = scores[4] >= Crown.CLEAR if scores[4] is not None else False
-                            is_full_combo = scores[4] == Crown.FC if scores[4] is not None else False
-                        else:
-                            is_cleared = False
-                            is_full_combo = False
-
-                        if course not in self.diff_sort_statistics:
-                            self.diff_sort_statistics[course] = {}
-
-                        if level not in self.diff_sort_statistics[course]:
-                            self.diff_sort_statistics[course][level] = [1, int(is_full_combo), int(is_cleared)]
-                        else:
-                            self.diff_sort_statistics[course][level][0] += 1
-                            if is_full_combo:
-                                self.diff_sort_statistics[course][level][1] += 1
-                            elif is_cleared:
-                                self.diff_sort_statistics[course][level][2] += 1
-                    if song_obj.is_recent:
-                        self.new_items.append(SongFile(tja_path, tja_path.name, SongBox.DEFAULT_INDEX, name_texture_index=texture_index))
-                    self.song_count += 1
-                    global_data.song_progress = self.song_count / global_data.total_songs
-                    self.all_song_files[song_key] = song_obj
-
-                if song_key in self.all_song_files:
-                    content_items.append(self.all_song_files[song_key])
-
-            self.directory_contents[dir_key] = content_items
-            self.crown_cache_dirty.add(dir_key)
+            content_items.extend(self._directory_songs(dir_path, texture_index))
+            self._set_directory_contents(dir_key, content_items)
+            if self.song_stream is not None and self.indexing_stream is None:
+                # The first folder is complete, song select can open without waiting for the rest
+                self.indexing_stream = self.song_stream
 
         else:
             # For directories without box.def, still process their children
-            for item_path in dir_path.iterdir():
-                if item_path.is_dir():
-                    self._generate_objects_recursive(item_path)
+            for child_dir in library_dir.children:
+                self._generate_objects_recursive(child_dir.path)
 
             # Create SongFile objects for TJA files in non-boxed directories
-            tja_files = self._find_tja_files_in_directory_only(dir_path)
+            tja_files = library_dir.song_files()
             for tja_path in tja_files:
                 song_key = str(tja_path)
                 if song_key not in self.all_song_files:
+                    if tja_path.name != "dan.json":
+                        entry = self._get_song_entry(tja_path)
+                        if entry is None:
+                            continue
+                    else:
+                        entry = None
                     try:
-                        song_obj = SongFile(tja_path, tja_path.name, SongBox.DEFAULT_INDEX)
+                        song_obj = SongFile(tja_path, tja_path.name, SongBox.DEFAULT_INDEX, entry=entry)
                         self.song_count += 1
                         global_data.song_progress = self.song_count / global_data.total_songs
                         self.all_song_files[song_key] = song_obj
@@ -1179,21 +1244,136 @@ class FileNavigator:
                         logger.error(f"Error creating SongFile for {tja_path}: {e}")
                         continue
 
+    def _directory_songs(self, dir_path: Path, texture_index: int) -> list[Union[SongFile, DanCourse]]:
+        """Get the objects for the song files of a box.def folder, creating the missing ones"""
+        songs = []
+        for tja_path in sorted(self._get_tja_files_for_directory(dir_path)):
+            song_key = str(tja_path)
+            if song_key not in self.all_song_files:
+                song_obj = self._create_song_file(tja_path, texture_index)
+                if song_obj is not None:
+                    self.all_song_files[song_key] = song_obj
+
+            if song_key in self.all_song_files:
+                songs.append(self.all_song_files[song_key])
+        return songs
+
+    def _reload_song_list(self, dir_path: Path):
+        """Read the song_list.txt of a box.def folder again and replace the songs it lists"""
+        directory = self.all_directories.get(str(dir_path))
+        if directory is None:
+            return
+        dir_key = str(dir_path)
+        folders = [item for item in self.directory_contents.get(dir_key, []) if isinstance(item, Directory)]
+        self._set_directory_contents(dir_key, folders + self._directory_songs(dir_path, directory.box.texture_index))
+
+    def _create_song_file(self, tja_path: Path, texture_index: int) -> Optional[Union[SongFile, DanCourse]]:
+        """Create the object for a song file inside a box.def folder, or None if it is not playable"""
+        if tja_path.name == "dan.json":
+            if self._is_deferring():
+                # Its charts are looked up by hash, which needs every song indexed
+                self.deferred_songs.append(tja_path)
+                return None
+            self._wait_for_songs()
+            with open(tja_path, 'r', encoding='utf-8') as file:
+                dan_data = json.load(file)
+                for chart in dan_data["charts"]:
+                    if not song_index.has_hash(chart["hash"]):
+                        return None
+            return DanCourse(tja_path, tja_path.name)
+        entry = self._get_song_entry(tja_path)
+        if entry is None:
+            return None
+        song_obj = SongFile(tja_path, tja_path.name, texture_index, entry=entry)
+        song_obj.box.get_scores()
+        self._add_to_diff_sort_index(song_obj)
+        if song_obj.is_recent:
+            self.new_items.append(SongFile(tja_path, tja_path.name, SongBox.DEFAULT_INDEX, name_texture_index=texture_index, entry=entry))
+        self.song_count += 1
+        global_data.song_progress = self.song_count / global_data.total_songs
+        return song_obj
+
+    def _add_to_diff_sort_index(self, song_obj: SongFile):
+        """Add a song under each of its courses in the difficulty sort index"""
+        for course in song_obj.tja.metadata.course_data:
+            songs = self.diff_sort_index.setdefault((course, song_obj.get_level(course)), [])
+            bisect.insort(songs, song_obj, key=lambda item: item.path)
+        self._diff_sort_statistics = None
+
+    def _remove_from_diff_sort_index(self, song_obj: SongFile):
+        """Take a song out of the difficulty sort index"""
+        for course in song_obj.tja.metadata.course_data:
+            key = (course, song_obj.get_level(course))
+            songs = self.diff_sort_index.get(key)
+            if songs is None:
+                continue
+            i = bisect.bisect_left(songs, song_obj.path, key=lambda item: item.path)
+            if i < len(songs) and songs[i] is song_obj:
+                del songs[i]
+            if not songs:
+                del self.diff_sort_index[key]
+        self._diff_sort_statistics = None
+
+    @property
+    def diff_sort_statistics(self) -> dict[int, dict[int, list[int]]]:
+        """Song, full combo and clear counts by course and level, for the difficulty sort menu.
+        Counted from the difficulty sort index and kept until the index or a score changes."""
+        if self._diff_sort_statistics is None or self._diff_sort_scores_version != score_store.version:
+            statistics: dict[int, dict[int, list[int]]] = dict()
+            for (course, level), songs in sorted(self.diff_sort_index.items()):
+                scores = score_store.get_scores({i: song_obj.box.hash[course] for i, song_obj in enumerate(songs)
+                                                 if course in song_obj.box.hash})
+                crowns = [score[5] for score in scores.values() if score is not None and score[5] is not None]
+                full_combos = sum(1 for crown in crowns if crown >= Crown.FC)
+                clears = sum(1 for crown in crowns if crown >= Crown.CLEAR)
+                statistics.setdefault(course, dict())[level] = [len(songs), full_combos, clears]
+            self._diff_sort_statistics = statistics
+            self._diff_sort_scores_version = score_store.version
+        return self._diff_sort_statistics
+
     def is_at_root(self) -> bool:
         """Check if currently at the virtual root"""
         return self.current_dir == Path()
 
+    def is_in_search(self) -> bool:
+        """Check if currently showing search results"""
+        return self.current_dir == SEARCH_PATH
+
+    def search(self, query: str):
+        """Show the songs matching a search query in a virtual folder, replacing the boxes on screen"""
+        if not self.is_in_search():
+            if self.box_open:
+                self.go_back()
+            self.history.append((self.current_dir, self.selected_index))
+            self.current_dir = SEARCH_PATH
+        self.search_results = []
+        for song_path in song_index.search_songs(query, SEARCH_RESULT_LIMIT):
+            song_obj = self.all_song_files.get(str(song_path))
+            if isinstance(song_obj, SongFile):
+                self.search_results.append(song_obj)
+        self.load_current_directory()
+        # Highlight the first match instead of the back box
+        if self.search_results:
+            self.selected_index = 1
+            self.calculate_box_positions()
+        logger.info(f"Search for {query!r} found {len(self.search_results)} songs")
+
+    def exit_search(self):
+        """Leave the search results, returning to where the search was started"""
+        if self.is_in_search():
+            self.go_back()
+
     def load_current_directory(self, selected_item: Optional[Directory] = None):
         """Load pre-generated items for the current directory (unified for root and subdirs)"""
         dir_key = str(self.current_dir)
 
         # Determine if current directory has child directories with box.def
         has_children = False
-        if self.is_at_root() or selected_item and selected_item.box.texture_index == 13:
+        if self.is_at_root() or self.is_in_search() or selected_item and selected_item.box.texture_index == 13:
             has_children = True  # Root always has "children" (the root directories)
         else:
-            has_children = any(item.is_dir() and (item / "box.def").exists()
-                             for item in self.current_dir.iterdir())
+            current_dir = song_library.get(self.current_dir)
+            has_children = current_dir is not None and bool(current_dir.box_def_children)
 
         self.genre_bg = None
         self.in_favorites = False
@@ -1213,6 +1393,9 @@ class FileNavigator:
                 start_box = back_dir.box
             self.items.insert(self.selected_index, back_dir)
 
+        if self.is_in_search():
+            self.items.extend(self.search_results)
+
         # Add pre-generated content for this directory
         if dir_key in self.directory_contents:
             content_items = self.directory_contents[dir_key]
@@ -1232,34 +1415,23 @@ class FileNavigator:
                     if self.favorite_folder is None:
                         raise Exception("tried to enter favorite folder without favorites")
                     self._generate_objects_recursive(self.favorite_folder.path)
-                    tja_files = self._get_tja_files_for_directory(self.favorite_folder.path)
-                    self._calculate_directory_crowns(dir_key, tja_files)
                     if not isinstance(selected_item.box, BackBox):
                         selected_item.box.tja_count = self._count_tja_files(self.favorite_folder.path)
                     content_items = self.directory_contents[dir_key]
                     self.in_favorites = True
                 elif selected_item.collection == Directory.COLLECTIONS[3]:
-                    content_items = []
-                    parent_dir = selected_item.path.parent
-                    for sibling_path in parent_dir.iterdir():
-                        if sibling_path.is_dir() and sibling_path != selected_item.path:
-                            sibling_key = str(sibling_path)
-                            if sibling_key in self.directory_contents:
-                                for item in self.directory_contents[sibling_key]:
-                                    if isinstance(item, SongFile) and item:
-                                        if self.diff_sort_diff in item.tja.metadata.course_data and item.tja.metadata.course_data[self.diff_sort_diff].level == self.diff_sort_level:
-                                            if item not in content_items:
-                                                content_items.append(item)
+                    # Songs of the folders next to the difficulty sort folder, in path order
+                    parent_parts = selected_item.path.parent.parts
+                    content_items = [item for item in self.diff_sort_index.get((self.diff_sort_diff, self.diff_sort_level), [])
+                                     if item.path.parts[:len(parent_parts)] == parent_parts]
                 elif selected_item.collection == Directory.COLLECTIONS[4]:
-                    parent_dir = selected_item.path.parent
                     temp_items = []
-                    for sibling_path in parent_dir.iterdir():
-                        if sibling_path.is_dir() and sibling_path != selected_item.path:
-                            sibling_key = str(sibling_path)
-                            if sibling_key in self.directory_contents:
-                                for item in self.directory_contents[sibling_key]:
-                                    if not isinstance(item, Directory) and isinstance(item, SongFile):
-                                        temp_items.append(item)
+                    for sibling_path in self._sibling_directories(selected_item.path):
+                        sibling_key = str(sibling_path)
+                        if sibling_key in self.directory_contents:
+                            for item in self.directory_contents[sibling_key]:
+                                if not isinstance(item, Directory) and isinstance(item, SongFile):
+                                    temp_items.append(item)
                     content_items = random.sample(temp_items, min(10, len(temp_items)))
 
             if content_items == []:
@@ -1291,7 +1463,7 @@ class FileNavigator:
             if isinstance(item, Directory):
                 item_key = str(item.path)
                 if isinstance(item.box, FolderBox):
-                    item.box.crown = self._get_directory_crowns_cached(item_key)
+                    item.box.crown = self.get_directory_crowns(item_key)
 
         self.calculate_box_positions()
 
@@ -1346,102 +1518,131 @@ class FileNavigator:
 
     def _count_tja_files(self, folder_path: Path):
         """Count TJA files in directory"""
-        tja_count = 0
-
-        # Find all song_list.txt files recursively
-        song_list_files = list(folder_path.rglob("song_list.txt"))
+        library_dir = song_library.get(folder_path)
+        if library_dir is None:
+            return 0
 
-        if song_list_files:
-            # Process all song_list.txt files found
-            for song_list_path in song_list_files:
-                with open(song_list_path, 'r', encoding='utf-8-sig') as song_list_file:
-                    tja_count += len([line for line in song_list_file.readlines() if line.strip()])
-        # Fallback: Use recursive counting of .tja or dan.json files
-        tja_count += sum(1 for _ in list(folder_path.rglob("*.tja")) + list(folder_path.rglob("dan.json")))
+        # Count songs listed in every song_list.txt in the tree
+        tja_count = 0
+        for directory in library_dir.walk():
+            if directory.has_song_list:
+                tja_count += len(self._get_song_list(directory.path))
+        # Plus the .tja and dan.json files counted during the library scan
+        tja_count += library_dir.tja_count
 
         return tja_count
 
-    def _get_directory_crowns_cached(self, dir_key: str) -> dict:
-        """Get crowns for a directory, calculating only if needed"""
-        if dir_key in self.crown_cache_dirty or dir_key not in self.directory_crowns:
-            # Calculate crowns on-demand
-            tja_files = self.directory_contents[dir_key]
-            self._calculate_directory_crowns(dir_key, tja_files)
-            self.crown_cache_dirty.discard(dir_key)
-
-        return self.directory_crowns.get(dir_key, dict())
-
-    def _calculate_directory_crowns(self, dir_key: str, tja_files: list):
-        """Pre-calculate crowns for a directory"""
-        all_scores = dict()
+    def _song_crowns(self, song_obj: SongFile) -> dict[int, int]:
+        """Get the crown of each course of a song, Crown.NONE if it has no score"""
         crowns = dict()
+        for diff, score in song_obj.box.scores.items():
+            crowns[diff] = score[5] if score is not None and score[5] is not None else Crown.NONE
+        return crowns
+
+    def _crown_folders(self, dir_key: str) -> list[str]:
+        """Get a folder and every box.def folder above it"""
+        folders = self._crown_folder_cache.get(dir_key)
+        if folders is None:
+            folders = [dir_key] + [str(parent) for parent in Path(dir_key).parents if str(parent) in self.all_directories]
+            self._crown_folder_cache[dir_key] = folders
+        return folders
+
+    def _count_crowns(self, dir_key: str, crowns: dict[int, int], delta: int):
+        """Add a song's crowns to the counters of a folder and of its ancestors, or take them out with a delta of -1"""
+        for folder_key in self._crown_folders(dir_key):
+            counters = self.crown_counters.setdefault(folder_key, dict())
+            for diff, crown in crowns.items():
+                counter = counters.setdefault(diff, [0, 0, 0, 0])
+                counter[0] += delta
+                counter[1] += delta * (crown >= Crown.CLEAR)
+                counter[2] += delta * (crown >= Crown.FC)
+                counter[3] += delta * (crown >= Crown.DFC)
+                if counter[0] == 0:
+                    del counters[diff]
+
+    def _add_crown_song(self, dir_key: str, song_obj: SongFile):
+        """Count a song listed in a folder"""
+        song_key = str(song_obj.path)
+        if song_key not in self.song_crowns:
+            self.song_crowns[song_key] = self._song_crowns(song_obj)
+        self.crown_folders.setdefault(song_key, []).append(dir_key)
+        self._count_crowns(dir_key, self.song_crowns[song_key], 1)
+
+    def _remove_crown_song(self, dir_key: str, song_obj: SongFile):
+        """Stop counting a song that was listed in a folder"""
+        song_key = str(song_obj.path)
+        folders = self.crown_folders.get(song_key)
+        if folders is None or dir_key not in folders:
+            return
+        self._count_crowns(dir_key, self.song_crowns[song_key], -1)
+        folders.remove(dir_key)
+        if not folders:
+            del self.crown_folders[song_key]
+            del self.song_crowns[song_key]
+
+    def _set_directory_contents(self, dir_key: str, content_items: list[Union[Directory, SongFile]]):
+        """Replace the items of a folder, moving its songs in and out of the crown counters"""
+        for item in self.directory_contents.get(dir_key, []):
+            if isinstance(item, SongFile):
+                self._remove_crown_song(dir_key, item)
+        self.directory_contents[dir_key] = content_items
+        for item in content_items:
+            if isinstance(item, SongFile):
+                self._add_crown_song(dir_key, item)
+
+    def update_song_crowns(self, song_obj: SongFile):
+        """Read a song's scores again and update the crown counters of every folder listing it"""
+        song_obj.box.get_scores()
+        song_key = str(song_obj.path)
+        old_crowns = self.song_crowns.get(song_key)
+        if old_crowns is None:
+            return
+        crowns = self._song_crowns(song_obj)
+        if crowns == old_crowns:
+            return
+        for dir_key in self.crown_folders[song_key]:
+            self._count_crowns(dir_key, old_crowns, -1)
+            self._count_crowns(dir_key, crowns, 1)
+        self.song_crowns[song_key] = crowns
 
-        for tja_path in tja_files:
-            song_key = str(tja_path)
-            if song_key in self.all_song_files:
-                song_obj = self.all_song_files[song_key]
-                if not isinstance(song_obj, SongFile):
-                    continue
-                for diff in song_obj.box.scores:
-                    if diff not in all_scores:
-                        all_scores[diff] = []
-                    all_scores[diff].append(song_obj.box.scores[diff])
-
-        for diff in all_scores:
-            if all(score is not None and score[5] == Crown.DFC for score in all_scores[diff]):
+    def get_directory_crowns(self, dir_key: str) -> dict[int, str]:
+        """Get the crown of each course shared by every song in a folder and its subfolders"""
+        crowns = dict()
+        for diff, (songs, clears, full_combos, donderful_combos) in self.crown_counters.get(dir_key, dict()).items():
+            if donderful_combos == songs:
                 crowns[diff] = 'DFC'
-            elif all(score is not None and score[5] == Crown.FC for score in all_scores[diff]):
+            elif full_combos == songs:
                 crowns[diff] = 'FC'
-            elif all(score is not None and score[5] >= Crown.CLEAR for score in all_scores[diff]):
+            elif clears == songs:
                 crowns[diff] = 'CLEAR'
-
-        self.directory_crowns[dir_key] = crowns
+        return crowns
 
     def _get_tja_files_for_directory(self, directory: Path):
         """Get TJA files for a specific directory"""
-        if (directory / 'song_list.txt').exists():
+        library_dir = song_library.get(directory)
+        if library_dir is None:
+            return []
+        if library_dir.has_song_list:
             return self._read_song_list(directory)
         else:
-            return self._find_tja_files_in_directory_only(directory)
-
-    def _find_tja_files_in_directory_only(self, directory: Path):
-        """Find TJA files only in the specified directory, not recursively in subdirectories with box.def"""
-        tja_files: list[Path] = []
+            return library_dir.song_files()
 
-        for path in directory.iterdir():
-            if (path.is_file() and path.suffix.lower() == ".tja") or path.name == "dan.json":
-                tja_files.append(path)
-            elif path.is_dir():
-                # Only recurse into subdirectories that don't have box.def
-                sub_dir_has_box_def = (path / "box.def").exists()
-                if not sub_dir_has_box_def:
-                    tja_files.extend(self._find_tja_files_in_directory_only(path))
-
-        return tja_files
-
-    def _find_tja_files_recursive(self, directory: Path, box_def_dirs_only=True):
-        tja_files: list[Path] = []
-
-        has_box_def = (directory / "box.def").exists()
-        if box_def_dirs_only and has_box_def and directory != self.current_dir:
+    def _sibling_directories(self, path: Path) -> list[Path]:
+        """Get the other directories next to a directory"""
+        parent_dir = song_library.get(path.parent)
+        if parent_dir is None:
             return []
-
-        for path in directory.iterdir():
-            if path.is_file() and path.suffix.lower() == ".tja":
-                tja_files.append(path)
-            elif path.is_dir():
-                sub_dir_has_box_def = (path / "box.def").exists()
-                if not sub_dir_has_box_def:
-                    tja_files.extend(self._find_tja_files_recursive(path, box_def_dirs_only))
-
-        return tja_files
-
-    def _read_song_list(self, path: Path):
-        """Read and process song_list.txt file"""
-        tja_files: list[Path] = []
-        updated_lines = []
-        file_updated = False
-        with open(path / 'song_list.txt', 'r', encoding='utf-8-sig') as song_list:
+        return [child.path for child in parent_dir.children if child.path != path]
+
+    def _get_song_list(self, path: Path) -> list[tuple[str, str, str]]:
+        """Get the (hash, title, subtitle) entries of a song_list.txt, only reading the file again once it changes"""
+        list_path = path / 'song_list.txt'
+        stat = FileStat.from_stat(list_path.stat())
+        cached = self.song_lists.get(str(list_path))
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+        entries = []
+        with open(list_path, 'r', encoding='utf-8-sig') as song_list:
             for line in song_list:
                 line = line.strip()
                 if not line:
@@ -1450,36 +1651,53 @@ class FileNavigator:
                 parts = line.split('|')
                 if len(parts) < 3:
                     continue
+                entries.append((parts[0], parts[1], parts[2]))
+        self.song_lists[str(list_path)] = (stat, entries)
+        return entries
 
-                hash_val, title, subtitle = parts[0], parts[1], parts[2]
-                original_hash = hash_val
-
-                if hash_val in global_data.song_hashes:
-                    file_path = Path(global_data.song_hashes[hash_val][0]["file_path"])
-                    if file_path.exists() and file_path not in tja_files:
-                        tja_files.append(file_path)
-                else:
-                    # Try to find by title and subtitle
-                    for key, value in global_data.song_hashes.items():
-                        for i in range(len(value)):
-                            song = value[i]
-                            if (song["title"]["en"] == title and
-                                song["subtitle"]["en"] == subtitle and
-                                Path(song["file_path"]).exists()):
-                                hash_val = key
-                                tja_files.append(Path(global_data.song_hashes[hash_val][i]["file_path"]))
-                                break
-
-                if hash_val != original_hash:
-                    file_updated = True
-                updated_lines.append(f"{hash_val}|{title}|{subtitle}")
+    def _read_song_list(self, path: Path):
+        """Read and process song_list.txt file"""
+        if self._is_deferring():
+            # Entries are looked up by hash and title, which needs every song indexed
+            if path not in self.deferred_song_lists:
+                self.deferred_song_lists.append(path)
+            return []
+        self._wait_for_songs()
+        lookup = song_index.get_lookup()
+        tja_files: list[Path] = []
+        listed: set[Path] = set()
+        updated_entries = []
+        file_updated = False
+        for hash_val, title, subtitle in self._get_song_list(path):
+            original_hash = hash_val
+
+            if hash_val in lookup.paths:
+                tja_path = lookup.paths[hash_val][0]
+                if str(tja_path) in song_library.tja_stats and tja_path not in listed:
+                    tja_files.append(tja_path)
+                    listed.add(tja_path)
+            else:
+                # Try to find by title and subtitle
+                for song_hash, tja_path in lookup.titles.get((title, subtitle), []):
+                    if str(tja_path) in song_library.tja_stats:
+                        hash_val = song_hash
+                        tja_files.append(tja_path)
+                        listed.add(tja_path)
+                        break
+
+            if hash_val != original_hash:
+                file_updated = True
+            updated_entries.append((hash_val, title, subtitle))
 
         # Write back updated song list if needed
         if file_updated:
-            with open(path / 'song_list.txt', 'w', encoding='utf-8-sig') as song_list:
-                for line in updated_lines:
+            list_path = path / 'song_list.txt'
+            with open(list_path, 'w', encoding='utf-8-sig') as song_list:
+                for entry in updated_entries:
+                    line = '|'.join(entry)
                     logger.info(f"updated: {line}")
                     song_list.write(line + '\n')
+            self.song_lists[str(list_path)] = (FileStat.from_stat(list_path.stat()), updated_entries)
 
         return tja_files
 
@@ -1533,17 +1751,6 @@ class FileNavigator:
                 else:
                     box.draw(box.position + int(move_away_attribute), tex.skin_config["boxes"].y, is_ura, inner_fade_override=diff_fade_out_attribute, outer_fade_override=fade)
 
-    def mark_crowns_dirty_for_song(self, song_file: SongFile):
-        """Mark directories as needing crown recalculation when a song's score changes"""
-        song_path = song_file.path
-
-        # Find all directories that contain this song and mark them as dirty
-        for dir_key, content_items in self.directory_contents.items():
-            for item in content_items:
-                if isinstance(item, SongFile) and item.path == song_path:
-                    self.crown_cache_dirty.add(dir_key)
-                    break
-
     def navigate_left(self):
         """Move selection left with wrap-around"""
         if self.items:
@@ -1575,6 +1782,12 @@ class FileNavigator:
             if song.box.yellow_box is not None:
                 song.box.yellow_box.create_anim()
 
+    def _mark_song_list(self, path: Path):
+        """Record a song_list.txt created after the library scan"""
+        library_dir = song_library.get(path)
+        if library_dir is not None:
+            library_dir.has_song_list = True
+
     def add_recent(self):
         """Add the current song to the recent list"""
         song = self.get_current_item()
@@ -1584,6 +1797,7 @@ class FileNavigator:
             return
 
         recents_path = self.recent_folder.path / 'song_list.txt'
+        self._mark_song_list(self.recent_folder.path)
         new_entry = f'{song.hash}|{song.tja.metadata.title["en"]}|{song.tja.metadata.subtitle["en"]}\n'
         existing_entries = []
         if recents_path.exists():
@@ -1608,6 +1822,7 @@ class FileNavigator:
         lines = []
         if not Path(favorites_path).exists():
             Path(favorites_path).touch()
+            self._mark_song_list(self.favorite_folder.path)
         with open(favorites_path, 'r', encoding='utf-8-sig') as song_list:
             for line in song_list:
                 line = line.strip()
@@ -1630,4 +1845,146 @@ class FileNavigator:
             logger.info(f"Added Favorite: {song.hash} {song.tja.metadata.title['en']} {song.tja.metadata.subtitle['en']}")
         return True
 
+    def rebuild(self):
+        """Regenerate every object from the current library scan and return to the root"""
+        self.all_directories = {}
+        self.all_song_files = {}
+        self.directory_contents = {}
+        self.crown_counters = dict()
+        self.song_crowns = dict()
+        self.crown_folders = dict()
+        self._crown_folder_cache = dict()
+        self.new_items = []
+        self.favorite_folder = None
+        self.recent_folder = None
+        self.diff_sort_index = dict()
+        self._diff_sort_statistics = None
+        self.song_count = 0
+        self.current_dir = Path()
+        self.items = []
+        self.selected_index = 0
+        self.history = []
+        self.box_open = False
+        global_data.total_songs = len(song_library.tja_stats)
+        self._generate_all_objects()
+        self._create_virtual_root()
+        self.load_current_directory()
+
+    def apply_library_changes(self, changes: LibraryChanges):
+        """Update the objects for song files added, changed or removed while the game is running"""
+        song_library.replace(changes.library)
+        if changes.structure_changed:
+            logger.info("Song folders changed, rebuilding navigator")
+            self.rebuild()
+            return
+
+        for song_path in changes.removed + changes.changed:
+            self._remove_song_file(song_path)
+        for song_path in changes.changed + changes.added:
+            self._add_song_file(song_path)
+        for dir_path in changes.song_lists:
+            self._reload_song_list(dir_path)
+        if changes.scores_changed:
+            self.refresh_scores()
+        if changes.added or changes.song_lists:
+            self._mark_favorites()
+
+        for directory in self.all_directories.values():
+            if not isinstance(directory.box, FolderBox):
+                continue
+            if directory.collection == Directory.COLLECTIONS[0]:
+                tja_count = len(self.new_items)
+            elif directory.collection is None:
+                tja_count = self._count_tja_files(directory.path)
+            else:
+                continue
+            if tja_count != directory.tja_count:
+                directory.tja_count = tja_count
+                directory.box.set_tja_count(tja_count)
+
+        self._refresh_items(set(changes.removed), set(changes.changed))
+
+    def _song_folder(self, song_path: Path) -> Optional[Directory]:
+        """Get the closest box.def folder containing a song file, or None if it is shown at the root"""
+        for parent in song_path.parents:
+            if str(parent) in self.all_directories:
+                return self.all_directories[str(parent)]
+            if parent in self.root_dirs:
+                break
+        return None
+
+    def _remove_song_file(self, song_path: Path):
+        song_obj = self.all_song_files.pop(str(song_path), None)
+        if song_obj is None:
+            return
+        for dir_key, content_items in self.directory_contents.items():
+            if song_obj in content_items:
+                content_items.remove(song_obj)
+                if isinstance(song_obj, SongFile):
+                    self._remove_crown_song(dir_key, song_obj)
+        self.new_items = [item for item in self.new_items if item.path != song_path]
+        if isinstance(song_obj, SongFile):
+            self.song_count -= 1
+            self._remove_from_diff_sort_index(song_obj)
+        logger.info(f"Removed song {song_path}")
+
+    def _add_song_file(self, song_path: Path):
+        song_key = str(song_path)
+        folder = self._song_folder(song_path)
+        if folder is None:
+            dir_key = "."
+            entry = None
+            if song_path.name != "dan.json":
+                entry = self._get_song_entry(song_path)
+                if entry is None:
+                    return
+            try:
+                song_obj = SongFile(song_path, song_path.name, SongBox.DEFAULT_INDEX, entry=entry)
+                self.song_count += 1
+            except Exception as e:
+                logger.error(f"Error creating SongFile for {song_path}: {e}")
+                return
+        else:
+            dir_key = str(folder.path)
+            library_dir = song_library.get(folder.path)
+            # Folders with a song_list.txt only show the songs listed in it
+            if library_dir is None or library_dir.has_song_list:
+                return
+            song_obj = self._create_song_file(song_path, folder.box.texture_index)
+            if song_obj is None:
+                return
+        self.all_song_files[song_key] = song_obj
+        content_items = self.directory_contents.setdefault(dir_key, [])
+        bisect.insort(content_items, song_obj, key=lambda item: (not isinstance(item, Directory), item.path))
+        # Songs at the root are not counted in any folder's crowns, as in _create_virtual_root
+        if isinstance(song_obj, SongFile) and folder is not None:
+            self._add_crown_song(dir_key, song_obj)
+        logger.info(f"Added song {song_path}")
+
+    def _refresh_items(self, removed: set[Path], changed: set[Path]):
+        """Drop removed songs from the boxes on screen and swap in the new objects for changed ones"""
+        for i in reversed(range(len(self.items))):
+            item = self.items[i]
+            if isinstance(item, Directory) or (item.path not in removed and item.path not in changed):
+                continue
+            song_obj = self.all_song_files.get(str(item.path))
+            if item.path in removed or song_obj is None:
+                del self.items[i]
+                if i < self.selected_index:
+                    self.selected_index -= 1
+            else:
+                song_obj.box.texture_index = item.box.texture_index
+                song_obj.box.position = item.box.position
+                song_obj.box.target_position = item.box.target_position
+                self.items[i] = song_obj
+
+        if not self.items:
+            self.current_dir = Path()
+            self.history = []
+            self.box_open = False
+            self.load_current_directory()
+            return
+        self.selected_index = min(self.selected_index, len(self.items) - 1)
+        self.calculate_box_positions()
+
 navigator = FileNavigator()
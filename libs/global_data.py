@@ -136,8 +136,6 @@ class GlobalData:
     Attributes:
         songs_played (int): The number of songs played.
         config (dict): The configuration settings.
-        song_hashes (dict[str, list[dict]]): A dictionary mapping song hashes to their metadata.
-        song_paths (dict[Path, str]): A dictionary mapping song paths to their hashes.
         song_progress (float): The progress of the loading bar.
         total_songs (int): The total number of songs.
         hit_sound (list[int]): The indices of the hit sounds currently used.
@@ -151,8 +149,6 @@ class GlobalData:
     font: ray.Font = ray.get_font_default()
     font_codepoints = set()
     config: Config = field(default_factory=dict)
-    song_hashes: dict[str, list[dict]] = field(default_factory=lambda: dict()) #Hash to path
-    song_paths: dict[Path, str] = field(default_factory=lambda: dict()) #path to hash
     song_progress: float = 0.0
     total_songs: int = 0
     hit_sound: list[int] = field(default_factory=lambda: [0, 0, 0])
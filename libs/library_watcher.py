@@ -0,0 +1,77 @@
+import logging
+import queue
+import threading
+
+from libs.config import get_config
+from libs.song_hash import index_song_files
+from libs.song_index import song_index
+from libs.song_library import LibraryChanges, SongLibrary, song_library
+
+logger = logging.getLogger(__name__)
+
+class LibraryWatcher:
+    """Polls the song folders for added, changed and removed songs while the game runs.
+
+    Scanning and indexing happen on a background thread. The changes are queued
+    and applied to the navigator from the main thread, since the navigator's
+    objects hold textures.
+    """
+    def __init__(self):
+        self.library = SongLibrary()
+        self.changes: queue.Queue[LibraryChanges] = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling, using the library scanned during loading as the baseline."""
+        interval = get_config()["general"].get("library_poll_interval", 10)
+        if interval <= 0 or self._thread is not None:
+            return
+        self.library.replace(song_library)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+        logger.info(f"Watching song library every {interval} seconds")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Song library poll failed: {e}")
+
+    def poll(self):
+        """Scan the song folders once and index whatever changed since the last scan."""
+        library = SongLibrary()
+        library.scan(self.library.root_dirs, quiet=True)
+        changes = self.library.diff(library)
+        self.library = library
+        if not changes:
+            return
+        logger.info(f"Song library changed: {len(changes.added)} added, {len(changes.changed)} changed, "
+                    f"{len(changes.removed)} removed")
+
+        removed_tja = [str(path) for path in changes.removed if path.name != 'dan.json']
+        if removed_tja:
+            song_index.remove_paths(removed_tja)
+        index_song_files([path for path in changes.added + changes.changed if path.name != 'dan.json'],
+                         library.tja_stats, report_progress=False)
+        self.changes.put(changes)
+
+    def poll_changes(self) -> list[LibraryChanges]:
+        """Return every change found since the last call, oldest first."""
+        changes = []
+        while True:
+            try:
+                changes.append(self.changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+library_watcher = LibraryWatcher()
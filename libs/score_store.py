@@ -0,0 +1,151 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SCORES_PATH = Path('scores.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS Scores (
+    hash TEXT PRIMARY KEY,
+    en_name TEXT NOT NULL,
+    jp_name TEXT NOT NULL,
+    diff INTEGER,
+    score INTEGER,
+    good INTEGER,
+    ok INTEGER,
+    bad INTEGER,
+    drumroll INTEGER,
+    combo INTEGER,
+    clear INTEGER
+);
+'''
+
+# A cached score row: (score, good, ok, bad, drumroll, clear)
+ScoreRow = tuple[Optional[int], Optional[int], Optional[int], Optional[int], Optional[int], Optional[int]]
+
+class ScoreStore:
+    """scores.db behind one long-lived connection, with every row cached in memory.
+
+    All rows are read with a single SELECT the first time a score is needed, and
+    lookups are served from memory afterwards. Every write goes through the store,
+    so the cache always matches the database.
+    """
+    def __init__(self, db_path: Path = SCORES_PATH):
+        self.db_path = Path(db_path)
+        # The navigator reads scores on its loading thread while the indexer imports them
+        self._lock = threading.RLock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._scores: Optional[dict[str, ScoreRow]] = None
+        # Bumped on every write, so holders of copied scores can tell they are out of date
+        self.version = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._connection is None:
+                con = sqlite3.connect(self.db_path, check_same_thread=False)
+                con.execute('PRAGMA journal_mode = WAL')
+                con.execute('PRAGMA synchronous = NORMAL')
+                con.executescript(SCHEMA)
+                self._connection = con
+            return self._connection
+
+    def create_table(self):
+        """Create scores.db if it does not exist."""
+        self.connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._scores = None
+
+    def preload(self):
+        """Read every score into memory."""
+        with self._lock:
+            rows = self.connection.execute('SELECT hash, score, good, ok, bad, drumroll, clear FROM Scores').fetchall()
+            self._scores = {row[0]: row[1:] for row in rows}
+            logger.info(f"Loaded {len(self._scores)} scores")
+
+    def get(self, diff_hash: str) -> Optional[ScoreRow]:
+        """Return the best score of a course, or None if it has not been played."""
+        with self._lock:
+            if self._scores is None:
+                self.preload()
+            return self._scores.get(diff_hash)
+
+    def get_scores(self, diff_hashes: dict[int, str]) -> dict[int, Optional[ScoreRow]]:
+        """Return the best scores of the courses of a song, accessed by diff number."""
+        with self._lock:
+            if self._scores is None:
+                self.preload()
+            return {diff: self._scores.get(diff_hash) for diff, diff_hash in diff_hashes.items()}
+
+    def write_score(self, diff_hash: str, en_name: str, jp_name: str, diff: int, score: int, good: int,
+                    ok: int, bad: int, drumroll: int, combo: int, clear: int):
+        """Replace the score of a course."""
+        with self._lock:
+            con = self.connection
+            with con:
+                con.execute('''
+                    INSERT OR REPLACE INTO Scores (hash, en_name, jp_name, diff, score, good, ok, bad, drumroll, combo, clear)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (diff_hash, en_name, jp_name, diff, score, good, ok, bad, drumroll, combo, clear))
+            if self._scores is not None:
+                self._scores[diff_hash] = (score, good, ok, bad, drumroll, clear)
+            self.version += 1
+
+    def write_crown(self, diff_hash: str, clear: int):
+        """Replace the crown of a course that already has a score."""
+        with self._lock:
+            con = self.connection
+            with con:
+                con.execute('UPDATE Scores SET clear = ? WHERE hash = ?', (clear, diff_hash))
+            if self._scores is not None and diff_hash in self._scores:
+                self._scores[diff_hash] = self._scores[diff_hash][:5] + (clear,)
+            self.version += 1
+
+    def import_scores(self, score_imports: list[tuple], db_updates: list[tuple]):
+        """Apply TJAPlayer3 score imports and difficulty hash changes in one transaction.
+
+        Args:
+            score_imports (list[tuple]): (hash, en_name, jp_name, diff, score, clear, bad) rows,
+                only written when they beat the stored score.
+            db_updates (list[tuple]): (hash, en_name, jp_name, diff) rows, re-keying existing
+                scores of a chart whose note hash changed.
+        """
+        with self._lock:
+            con = self.connection
+            with con:
+                con.execute("CREATE INDEX IF NOT EXISTS scores_name_diff ON Scores (en_name, jp_name, diff)")
+                changes = con.total_changes
+                con.executemany("""
+                    INSERT INTO Scores (hash, en_name, jp_name, diff, score, clear, bad)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (hash) DO UPDATE SET
+                        en_name = excluded.en_name, jp_name = excluded.jp_name, diff = excluded.diff,
+                        score = excluded.score, clear = excluded.clear, bad = excluded.bad,
+                        good = NULL, ok = NULL, drumroll = NULL, combo = NULL
+                    WHERE excluded.score > Scores.score OR Scores.score IS NULL
+                """, score_imports)
+                imported = con.total_changes - changes
+                # Update existing entries that match by name and difficulty
+                con.executemany("""
+                    UPDATE OR IGNORE Scores
+                    SET hash = ?
+                    WHERE en_name = ? AND jp_name = ? AND diff = ? AND hash != ?
+                """, [(*update, update[0]) for update in db_updates])
+                rekeyed = con.total_changes - changes - imported
+            # Re-keyed rows can move anywhere, read everything again on the next lookup
+            if imported or rekeyed:
+                self._scores = None
+                self.version += 1
+        logger.info(f"Database update completed. Imported {imported} of {len(score_imports)} TJAPlayer3 scores, "
+                    f"processed {len(db_updates)} difficulty hash updates.")
+
+score_store = ScoreStore()
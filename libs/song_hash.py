@@ -1,34 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import configparser
 import logging
-import json
+import multiprocessing
+import os
 import sqlite3
-import time
+import threading
 from pathlib import Path
+from typing import Iterable, Iterator, Optional
 
 from libs.global_data import Crown
-from libs.tja import NoteList, TJAParser, test_encodings
+from libs.score_store import score_store
+from libs.song_index import CourseEntry, CourseStats, FileStat, SongEntry, song_index
+from libs.song_library import song_library
+from libs.tja import NoteColumns, NoteList, NoteType, TimelineFlag, TJAParser, decode_file
 from libs.utils import global_data
 from libs.config import get_config
 
 logger = logging.getLogger(__name__)
 
-def diff_hashes_object_hook(obj):
-    if "diff_hashes" in obj:
-        obj["diff_hashes"] = {
-            int(key): value
-            for key, value in obj["diff_hashes"].items()
-        }
-    return obj
-
-class DiffHashesDecoder(json.JSONDecoder):
-    def __init__(self, *args, **kwargs):
-        super().__init__(object_hook=diff_hashes_object_hook, *args, **kwargs)
-
 def read_tjap3_score(input_file: Path):
     """Read a TJAPlayer3 score.ini file and return the scores and clears."""
     score_ini = configparser.ConfigParser()
-    encoding = test_encodings(input_file)
-    score_ini.read(input_file, encoding=encoding)
+    text, _ = decode_file(input_file)
+    score_ini.read_string(text, source=str(input_file))
     scores = [int(score_ini['HiScore.Drums']['HiScore1']),
               int(score_ini['HiScore.Drums']['HiScore2']),
               int(score_ini['HiScore.Drums']['HiScore3']),
@@ -39,13 +33,13 @@ def read_tjap3_score(input_file: Path):
               int(score_ini['HiScore.Drums'].get('Clear2', 0)),
               int(score_ini['HiScore.Drums'].get('Clear3', 0)),
               int(score_ini['HiScore.Drums'].get('Clear4', 0))]
-    if score_ini['HiScore.Drums']['PerfectRange'] != 25:
+    if int(score_ini['HiScore.Drums']['PerfectRange']) != 25:
         return [0],[0], None
-    if score_ini['HiScore.Drums']['GoodRange'] != 75:
+    if int(score_ini['HiScore.Drums']['GoodRange']) != 75:
         return [0],[0], None
-    if score_ini['HiScore.Drums']['PoorRange'] != 108:
+    if int(score_ini['HiScore.Drums']['PoorRange']) != 108:
         return [0],[0], None
-    if score_ini['HiScore.Drums']['Perfect'] != 0:
+    if int(score_ini['HiScore.Drums'].get('Perfect', 0)) != 0:
         good = score_ini['HiScore.Drums'].get('Perfect', 0)
         ok = score_ini['HiScore.Drums'].get('Great', 0)
         bad = score_ini['HiScore.Drums'].get('Miss', 0)
@@ -53,131 +47,230 @@ def read_tjap3_score(input_file: Path):
     else:
         return scores, clears, None
 
-def build_song_hashes(output_dir=Path("cache")):
-    """Build a dictionary of song hashes and save it to a file."""
-    if not output_dir.exists():
-        output_dir.mkdir()
-    song_hashes: dict[str, list[dict]] = dict()
-    path_to_hash: dict[str, str] = dict()  # New index for O(1) path lookups
-    output_path = Path(output_dir / "song_hashes.json")
-    index_path = Path(output_dir / "path_to_hash.json")
-
-    # Load existing data
-    if output_path.exists():
-        with open(output_path, "r", encoding="utf-8") as f:
-            song_hashes = json.load(f, cls=DiffHashesDecoder)
-    if index_path.exists():
-        with open(index_path, "r", encoding="utf-8") as f:
-            path_to_hash = json.load(f)
-
-    saved_timestamp = 0.0
-    current_timestamp = time.time()
-    if (output_dir / 'timestamp.txt').exists():
-        with open(output_dir / 'timestamp.txt', 'r') as f:
-            saved_timestamp = float(f.read())
-
-    tja_paths = get_config()["paths"]["tja_path"]
-    all_tja_files: list[Path] = []
-    for root_dir in tja_paths:
-        root_path = Path(root_dir)
-        found_tja_files = root_path.rglob("*.tja", recurse_symlinks=True)
-        all_tja_files.extend(found_tja_files)
-
-    global_data.total_songs = len(all_tja_files)
-    files_to_process = []
-
-    for tja_path in all_tja_files:
-        tja_path_str = str(tja_path)
-        current_modified = tja_path.stat().st_mtime
-        if current_modified <= saved_timestamp:
-            current_hash = path_to_hash.get(tja_path_str)
-            if current_hash is not None:
-                global_data.song_paths[tja_path] = current_hash
-                continue
-        current_hash = path_to_hash.get(tja_path_str)
-        if current_hash is None:
-            files_to_process.append(tja_path)
-        else:
-            files_to_process.append(tja_path)
-            if current_hash in song_hashes:
-                del song_hashes[current_hash]
-            del path_to_hash[tja_path_str]
-
-
-    # Prepare database connection for updates
-    db_path = Path("scores.db")
+def calculate_course_stats(notes: NoteList, branch_m: list[NoteList], branch_e: list[NoteList],
+                           branch_n: list[NoteList]) -> CourseStats:
+    """Compute the statistics of a course from the result of notes_to_position.
+
+    Everything but note_count follows the master branch, the path with the highest combo.
+    """
+    all_notes = NoteColumns(notes.play_notes)
+    for branch in branch_m + branch_e + branch_n:
+        all_notes.extend(branch.play_notes)
+
+    master_notes = list(notes.play_notes)
+    for branch in branch_m:
+        master_notes.extend(branch.play_notes)
+    master_notes.sort(key=lambda note: note.hit_ms)
+    columns = NoteColumns(master_notes)
+    types = columns.type
+    hit_ms = columns.hit_ms
+
+    hits = []
+    drumroll_ms = 0.0
+    balloon_count = 0
+    for i, note_type in enumerate(types):
+        if note_type in (NoteType.DON, NoteType.KAT, NoteType.DON_L, NoteType.KAT_L):
+            hits.append(hit_ms[i])
+        elif note_type in (NoteType.ROLL_HEAD, NoteType.ROLL_HEAD_L) and i + 1 < len(types):
+            drumroll_ms += hit_ms[i + 1] - hit_ms[i]
+        elif note_type in (NoteType.BALLOON_HEAD, NoteType.KUSUDAMA):
+            balloon_count += 1
+
+    # Sliding one second window over the hit times
+    peak_nps = 0
+    start = 0
+    for end, ms in enumerate(hits):
+        while ms - hits[start] >= 1000:
+            start += 1
+        peak_nps = max(peak_nps, end - start + 1)
+
+    length_ms = hit_ms[-1] - hit_ms[0] if hit_ms else 0.0
+    avg_nps = len(hits) / (length_ms / 1000) if length_ms > 0 else 0.0
+
+    bpms = [event.bpm for timeline in [notes.timeline] + [branch.timeline for branch in branch_m + branch_e + branch_n]
+            for event in timeline if event.flags & TimelineFlag.BPM and event.bpm > 0]
+    return CourseStats(all_notes.count_notes(), len(hits), drumroll_ms, balloon_count, float(peak_nps), avg_nps,
+                       length_ms, min(bpms, default=0.0), max(bpms, default=0.0))
+
+def index_tja_file(tja_path: Path) -> Optional[SongEntry]:
+    """Parse a TJA file into its song index entry.
+
+    Runs in the indexing worker processes, so it must not touch global state.
+    The entry's stat is left for index_song_files to fill in from the library scan.
+
+    Args:
+        tja_path (Path): The TJA file to parse.
+
+    Returns:
+        Optional[SongEntry]: The entry to index, or None if the file has no notes.
+    """
+    tja = TJAParser(tja_path)
+    all_notes = NoteList()
+    courses = dict()
+
+    for diff, (diff_notes, branch_m, branch_e, branch_n) in tja.parse_all_courses(use_cache=False).items():
+        course_data = tja.metadata.course_data[diff]
+        courses[diff] = CourseEntry(tja.hash_note_data(diff_notes), course_data.level, course_data.is_branching,
+                                    calculate_course_stats(diff_notes, branch_m, branch_e, branch_n))
+        all_notes.play_notes.extend(diff_notes.play_notes)
+        for branch in branch_m + branch_e + branch_n:
+            all_notes.play_notes.extend(branch.play_notes)
+            all_notes.bars.extend(branch.bars)
+        all_notes.bars.extend(diff_notes.bars)
+
+    if all_notes == NoteList():
+        return None
+    return SongEntry(tja_path, tja.hash_note_data(all_notes), FileStat(-1, -1, -1),
+                     tja.encoding, tja.metadata.title, tja.metadata.subtitle, courses,
+                     tja.metadata, tja.ex_data)
+
+class SongStream:
+    """Hands songs from build_song_hashes to the file navigator as they are indexed.
+
+    The navigator starts once the library is scanned and only waits on the songs
+    that are still being indexed, until its first folder is complete. Entries carry
+    the parsed TJA header, so the navigator does not read the files again.
+    """
+    def __init__(self):
+        self.scanned = threading.Event()
+        self.finished = threading.Event()
+        self._condition = threading.Condition()
+        self._pending: set[str] = set()
+        self._entries: dict[str, SongEntry] = dict()
+        self._closed = False
+
+    def start(self, pending: Iterable[Path]):
+        """Load the songs that are already indexed and mark the files still to be indexed."""
+        entries = song_index.get_all_songs()
+        with self._condition:
+            self._entries = entries
+            self._pending = {str(path) for path in pending}
+        self.scanned.set()
+
+    def put(self, tja_path: Path, entry: Optional[SongEntry]):
+        """Publish a freshly indexed song, or None if it failed to parse."""
+        key = str(tja_path)
+        with self._condition:
+            self._pending.discard(key)
+            if entry is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = entry
+            self._condition.notify_all()
+
+    def is_pending(self, tja_path: Path) -> bool:
+        """Check if a TJA file is still being indexed."""
+        with self._condition:
+            return str(tja_path) in self._pending
+
+    def get(self, tja_path: Path) -> Optional[SongEntry]:
+        """Return the entry of a TJA file, waiting for it if it is still being indexed."""
+        key = str(tja_path)
+        with self._condition:
+            self._condition.wait_for(lambda: key not in self._pending or self._closed)
+            return self._entries.get(key)
+
+    def wait(self):
+        """Wait until every song is indexed."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending or self._closed)
+
+    def close(self):
+        """Stop waiting on songs, called once indexing and the score import finish or fail."""
+        with self._condition:
+            self._closed = True
+            self._pending.clear()
+            self._condition.notify_all()
+        self.scanned.set()
+        self.finished.set()
+
+def _index_tja_files(tja_files: list[Path], workers: int) -> Iterator[tuple[Path, Optional[SongEntry], Optional[str]]]:
+    """Parse TJA files across worker processes, yielding entries as they finish.
+
+    Files that fail to parse are yielded with the error message instead of an entry.
+    """
+    if workers <= 1 or len(tja_files) <= 1:
+        for tja_path in tja_files:
+            try:
+                yield tja_path, index_tja_file(tja_path), None
+            except Exception as e:
+                yield tja_path, None, f"{type(e).__name__}: {e}"
+        return
+
+    # Spawned workers do not inherit the window or audio threads of this process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(tja_files)), mp_context=context) as executor:
+        futures = {executor.submit(index_tja_file, tja_path): tja_path for tja_path in tja_files}
+        for future in as_completed(futures):
+            tja_path = futures[future]
+            try:
+                yield tja_path, future.result(), None
+            except Exception as e:
+                yield tja_path, None, f"{type(e).__name__}: {e}"
+
+def index_song_files(files_to_process: list[Path], file_stats: dict[str, FileStat], report_progress: bool = True,
+                     song_stream: Optional[SongStream] = None):
+    """Index TJA files and import their TJAPlayer3 scores.
+
+    Args:
+        files_to_process (list[Path]): New or changed TJA files.
+        file_stats (dict[str, FileStat]): Filesystem state of the files from the library scan.
+            It is recorded for every indexed or failed file, so the next scan compares
+            against stats from the same source (DirEntry.stat has no inode on Windows).
+        report_progress (bool): Whether to update the loading screen progress bar.
+        song_stream (SongStream, optional): Receives each song as soon as it is indexed.
+    """
     db_updates = []  # Store updates to batch process later
+    score_imports = []
 
     # Process only files that need updating
     song_count = 0
     total_songs = len(files_to_process)
-    if total_songs > 0:
+    if report_progress and total_songs > 0:
         global_data.total_songs = total_songs
 
-    for tja_path in files_to_process:
-        try:
-            tja_path_str = str(tja_path)
-            current_modified = tja_path.stat().st_mtime
-            tja = TJAParser(tja_path)
-            all_notes = NoteList()
-            diff_hashes = dict()
-
-            for diff in tja.metadata.course_data:
-                diff_notes, branch_m, branch_e, branch_n = TJAParser.notes_to_position(TJAParser(tja.file_path), diff)
-                diff_hashes[diff] = tja.hash_note_data(diff_notes)
-                all_notes.play_notes.extend(diff_notes.play_notes)
-                if branch_m:
-                    for branch in branch_m:
-                        all_notes.play_notes.extend(branch.play_notes)
-                        all_notes.bars.extend(branch.bars)
-                if branch_e:
-                    for branch in branch_e:
-                        all_notes.play_notes.extend(branch.play_notes)
-                        all_notes.bars.extend(branch.bars)
-                if branch_n:
-                    for branch in branch_n:
-                        all_notes.play_notes.extend(branch.play_notes)
-                        all_notes.bars.extend(branch.bars)
-                all_notes.bars.extend(diff_notes.bars)
-        except Exception as e:
-            logger.error(f"Failed to parse TJA {tja_path}: {e}")
-            continue
-
-        if all_notes == NoteList():
+    workers = get_config()["general"].get("index_workers", 0) or os.cpu_count() or 1
+    if files_to_process:
+        logger.info(f"Indexing {total_songs} TJA files with {workers} workers")
+    failed = 0
+    for tja_path, entry, error in _index_tja_files(files_to_process, workers):
+        song_count += 1
+        if report_progress:
+            global_data.song_progress = song_count / total_songs
+        stat = file_stats.get(str(tja_path))
+        if entry is None:
+            error = error or "Chart has no notes"
+            logger.error(f"Failed to parse TJA {tja_path}: {error}")
+            failed += 1
+            if stat is not None:
+                song_index.record_failure(tja_path, stat, error)
+            else:
+                song_index.remove_path(tja_path)
+            if song_stream is not None:
+                song_stream.put(tja_path, None)
             continue
 
-        hash_val = tja.hash_note_data(all_notes)
-        if hash_val not in song_hashes:
-            song_hashes[hash_val] = []
-
-        song_hashes[hash_val].append({
-            "file_path": tja_path_str,
-            "last_modified": current_modified,
-            "title": tja.metadata.title,
-            "subtitle": tja.metadata.subtitle,
-            "diff_hashes": diff_hashes
-        })
-
-        # Update both indexes
-        path_to_hash[tja_path_str] = hash_val
-        global_data.song_paths[tja_path] = hash_val
+        if stat is not None:
+            entry.stat = stat
+        song_index.upsert_song(entry)
+        if song_stream is not None:
+            song_stream.put(tja_path, entry)
+        diff_hashes = entry.diff_hashes
 
         # Prepare database updates for each difficulty
-        en_name = tja.metadata.title.get('en', '') if isinstance(tja.metadata.title, dict) else str(tja.metadata.title)
-        jp_name = tja.metadata.title.get('jp', '') if isinstance(tja.metadata.title, dict) else ''
+        en_name = entry.title.get('en', '')
+        jp_name = entry.title.get('jp', '')
 
         score_ini_path = tja_path.with_suffix('.tja.score.ini')
         if score_ini_path.exists():
-            imported_scores, imported_clears, _ = read_tjap3_score(score_ini_path)
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
+            try:
+                imported_scores, imported_clears, _ = read_tjap3_score(score_ini_path)
+            except (configparser.Error, KeyError, ValueError) as e:
+                logger.error(f"Failed to read {score_ini_path}: {e}")
+                imported_scores, imported_clears = [], []
             for i in range(len(imported_scores)):
                 if i not in diff_hashes or imported_scores[i] == 0:
                     continue
-                cursor.execute("SELECT score FROM scores WHERE hash = ?", (diff_hashes[i],))
-                existing_record = cursor.fetchone()
-                if existing_record and existing_record[0] >= imported_scores[i]:
-                    continue
                 if imported_clears[i] == 2:
                     bads = 0
                     clear = Crown.FC
@@ -187,64 +280,75 @@ def build_song_hashes(output_dir=Path("cache")):
                 else:
                     bads = None
                     clear = Crown.NONE
-                cursor.execute("""
-                    INSERT OR REPLACE INTO scores (hash, en_name, jp_name, diff, score, clear, bad)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (diff_hashes[i], en_name, jp_name, i, imported_scores[i], clear, bads))
-                if cursor.rowcount > 0:
-                    action = "Added" if not existing_record else "Updated"
-                    logger.info(f"{action} entry for {en_name} ({i}) - Score: {imported_scores[i]}")
-            conn.commit()
-            conn.close()
+                score_imports.append((diff_hashes[i], en_name, jp_name, i, imported_scores[i], clear, bads))
 
         for diff, diff_hash in diff_hashes.items():
             db_updates.append((diff_hash, en_name, jp_name, diff))
 
-        song_count += 1
-        global_data.song_progress = song_count / total_songs
+    if failed:
+        logger.warning(f"{failed} of {total_songs} TJA files failed to parse, they will be skipped until they change")
 
-    # Update database with new difficulty hashes
-    if db_updates and db_path.exists():
+    # Update database with imported scores and new difficulty hashes
+    if (score_imports or db_updates) and score_store.db_path.exists():
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            for diff_hash, en_name, jp_name, diff in db_updates:
-                # Update existing entries that match by name and difficulty
-                cursor.execute("""
-                    UPDATE scores
-                    SET hash = ?
-                    WHERE (en_name = ? AND jp_name = ?) AND diff = ?
-                """, (diff_hash, en_name, jp_name, diff))
-                if cursor.rowcount > 0:
-                    logger.info(f"Updated {cursor.rowcount} entries for {en_name} ({diff})")
-
-            conn.commit()
-            conn.close()
-            logger.info(f"Database update completed. Processed {len(db_updates)} difficulty hash updates.")
-
+            score_store.import_scores(score_imports, db_updates)
         except sqlite3.Error as e:
             logger.error(f"Database error: {e}")
-        except Exception as e:
-            logger.error(f"Error updating database: {e}")
-    elif db_updates:
-        logger.warning(f"Warning: scores.db not found, skipping {len(db_updates)} database updates")
-
-    # Save both files
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(song_hashes, f, indent=2, ensure_ascii=False)
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(path_to_hash, f, indent=2, ensure_ascii=False)
-    with open(output_dir / 'timestamp.txt', 'w') as f:
-        f.write(str(current_timestamp))
-
-    return song_hashes
+    elif score_imports or db_updates:
+        logger.warning(f"Warning: scores.db not found, skipping {len(score_imports)} score imports and {len(db_updates)} database updates")
+
+def build_song_hashes(output_dir=Path("cache"), song_stream: Optional[SongStream] = None):
+    """Bring the song index up to date with the TJA files on disk.
+
+    Args:
+        output_dir (Path): Directory of the song index.
+        song_stream (SongStream, optional): Receives the songs as they are indexed, so the
+            file navigator can be built at the same time. The navigator then reports the
+            loading progress.
+    """
+    try:
+        return _build_song_hashes(output_dir, song_stream)
+    finally:
+        if song_stream is not None:
+            song_stream.close()
+
+def _build_song_hashes(output_dir: Path, song_stream: Optional[SongStream]):
+    if not output_dir.exists():
+        output_dir.mkdir()
+    indexed_stats = song_index.get_file_stats()
+    failed_stats = song_index.get_failed_stats()
+    song_library.scan(get_config()["paths"]["tja_path"])
+    current_stats = song_library.tja_stats
+
+    added = current_stats.keys() - indexed_stats.keys()
+    changed = {path for path in current_stats.keys() & indexed_stats.keys()
+               if current_stats[path] != indexed_stats[path]}
+    # Songs indexed before headers and course statistics were stored are parsed again
+    changed |= song_index.get_incomplete_paths() & current_stats.keys()
+    # Files that failed to parse are only retried once they change
+    skipped = {path for path in added if failed_stats.get(path) == current_stats[path]}
+    added -= skipped
+    removed = (indexed_stats.keys() | failed_stats.keys()) - current_stats.keys()
+    logger.info(f"Song library scan: {len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+                f"{len(skipped)} skipped after failing to parse")
+    if skipped:
+        logger.warning(f"Skipped {len(skipped)} TJA files that failed to parse, run index_report.py to list them")
+    if removed:
+        song_index.remove_paths(removed)
+
+    global_data.total_songs = len(current_stats)
+    files_to_process = [Path(path) for path in sorted(added | changed)]
+    if song_stream is not None:
+        song_stream.start(files_to_process)
+    index_song_files(files_to_process, current_stats, report_progress=song_stream is None, song_stream=song_stream)
+
+    return song_index
 
 def process_tja_file(tja_file):
     """Process a single TJA file and return hash or None if error"""
     tja = TJAParser(tja_file)
     all_notes = NoteList()
-    for diff in tja.metadata.course_data:
-        notes, branch_m, branch_e, branch_n = TJAParser.notes_to_position(TJAParser(tja.file_path), diff)
+    for notes, branch_m, branch_e, branch_n in tja.parse_all_courses(use_cache=False).values():
         all_notes.play_notes.extend(notes.play_notes)
         if branch_m:
             for branch in branch_m:
@@ -0,0 +1,574 @@
+import heapq
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import astuple, dataclass, field, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from libs.tja import TJAEXData, TJAMetadata
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = Path('cache/song_index.db')
+INDEX_VERSION = 5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    encoding TEXT,
+    metadata BLOB,
+    search TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS paths (
+    path TEXT PRIMARY KEY,
+    song_id INTEGER NOT NULL UNIQUE REFERENCES songs(id) ON DELETE CASCADE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS courses (
+    song_id INTEGER NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    difficulty INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    level INTEGER,
+    is_branching INTEGER NOT NULL DEFAULT 0,
+    note_count INTEGER,
+    max_combo INTEGER,
+    drumroll_ms REAL,
+    balloon_count INTEGER,
+    peak_nps REAL,
+    avg_nps REAL,
+    length_ms REAL,
+    min_bpm REAL,
+    max_bpm REAL,
+    PRIMARY KEY (song_id, difficulty)
+);
+CREATE TABLE IF NOT EXISTS titles (
+    song_id INTEGER NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    language TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (song_id, kind, language)
+);
+CREATE TABLE IF NOT EXISTS failures (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    error TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS codepoints (
+    codepoint TEXT PRIMARY KEY,
+    refs INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_grams (
+    gram TEXT NOT NULL,
+    song_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, song_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS songs_hash ON songs(hash);
+CREATE INDEX IF NOT EXISTS courses_hash ON courses(hash);
+CREATE INDEX IF NOT EXISTS titles_text ON titles(kind, language, text);
+'''
+
+# Course names searchable along with their level, e.g. "oni10"
+COURSE_NAMES = ('easy', 'normal', 'hard', 'oni', 'ura')
+# Longest substring indexed for search, longer words are matched through their substrings of this length
+SEARCH_GRAM_LENGTH = 3
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+def normalize_search_text(text: str) -> str:
+    """Fold full and half width characters, case and katakana, so a search matches however the text was typed."""
+    return unicodedata.normalize('NFKC', text).casefold().translate(KATAKANA_TO_HIRAGANA)
+
+def search_grams(text: str) -> set[str]:
+    """Return every substring of up to SEARCH_GRAM_LENGTH characters of each word of a normalized text."""
+    grams = set()
+    for word in text.split():
+        for length in range(1, SEARCH_GRAM_LENGTH + 1):
+            for start in range(len(word) - length + 1):
+                grams.add(word[start:start + length])
+    return grams
+
+@dataclass(frozen=True)
+class FileStat:
+    """The filesystem state of a song file, used to detect changes
+    size: size of the file in bytes
+    mtime_ns: modification time in nanoseconds
+    inode: inode number, catches files replaced by a copy with the same size and mtime
+    """
+    size: int
+    mtime_ns: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, stat: os.stat_result) -> 'FileStat':
+        return cls(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+@dataclass
+class CourseStats:
+    """Statistics of a course, computed from its notes when the song is indexed
+    note_count: don and kat notes in the course, counting every branch
+    max_combo: don and kat notes along the master branch
+    drumroll_ms: total length of the drumrolls along the master branch
+    balloon_count: number of balloons and kusudamas along the master branch
+    peak_nps: most notes hit within one second
+    avg_nps: notes per second between the first and the last note
+    length_ms: time between the first and the last note
+    min_bpm: lowest bpm of the course
+    max_bpm: highest bpm of the course
+    """
+    note_count: int
+    max_combo: int
+    drumroll_ms: float
+    balloon_count: int
+    peak_nps: float
+    avg_nps: float
+    length_ms: float
+    min_bpm: float
+    max_bpm: float
+
+STAT_COLUMNS = tuple(f.name for f in fields(CourseStats))
+
+@dataclass
+class CourseEntry:
+    """An indexed course of a song
+    hash: note hash of the course, used as the key in scores.db
+    level: number of stars, None if unknown
+    is_branching: whether the course has branches
+    stats: statistics of the notes, None if the course was imported without being parsed
+    """
+    hash: str
+    level: Optional[int] = None
+    is_branching: bool = False
+    stats: Optional[CourseStats] = None
+
+@dataclass
+class SongEntry:
+    """An indexed song file
+    file_path: path to the TJA file
+    hash: note hash of the whole song
+    stat: filesystem state of the file when it was indexed
+    encoding: text encoding of the file
+    title: dictionary for song titles, accessed by language code
+    subtitle: dictionary for song subtitles, accessed by language code
+    courses: indexed courses, accessed by diff number
+    metadata: header of the TJA file, so the song select screen does not have to read it again
+    ex_data: extra data parsed along with the header
+    """
+    file_path: Path
+    hash: str
+    stat: FileStat = FileStat(-1, -1, -1)
+    encoding: Optional[str] = None
+    title: dict[str, str] = field(default_factory=lambda: {'en': ''})
+    subtitle: dict[str, str] = field(default_factory=lambda: {'en': ''})
+    courses: dict[int, CourseEntry] = field(default_factory=lambda: dict())
+    metadata: Optional['TJAMetadata'] = None
+    ex_data: Optional['TJAEXData'] = None
+
+    @property
+    def diff_hashes(self) -> dict[int, str]:
+        return {diff: course.hash for diff, course in self.courses.items()}
+
+    def search_text(self) -> str:
+        """Return the normalized words a search can match: titles and subtitles in every language, genre and course levels."""
+        words = list(dict.fromkeys([*self.title.values(), *self.subtitle.values()]))
+        if self.metadata is not None and self.metadata.genre:
+            words.append(self.metadata.genre)
+        for diff, course in self.courses.items():
+            if diff < len(COURSE_NAMES) and course.level is not None:
+                words.append(f'{COURSE_NAMES[diff]}{course.level}')
+        return normalize_search_text(' '.join(words))
+
+@dataclass
+class SongLookup:
+    """Where every indexed song is, for resolving song_list.txt entries without querying each one
+    paths: paths of the files with each song hash, in index order
+    titles: song hash and path of the files with each English (title, subtitle), in index order
+    """
+    paths: dict[str, list[Path]]
+    titles: dict[tuple[str, str], list[tuple[str, Path]]]
+
+class SongIndex:
+    """SQLite backed index of every song in the library.
+
+    Each thread gets its own connection, so the loading threads can write
+    while the song select screen reads. Every file is written in its own
+    transaction, so a crash mid-scan leaves the previously indexed songs intact.
+    Files that fail to parse are recorded with their filesystem state, so they
+    are only parsed again once they change.
+    """
+    def __init__(self, db_path: Path = INDEX_PATH):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        # Built on first use and dropped after every write
+        self._lookup_lock = threading.Lock()
+        self._lookup: Optional[SongLookup] = None
+        # (path, search text) of every searchable song by song id, loaded once and kept up to date by every write
+        self._search_songs: Optional[dict[int, tuple[str, str]]] = None
+        # Ids of the songs containing each gram, loaded per gram on first use and also kept up to date
+        self._search_postings: dict[str, set[int]] = dict()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, 'connection', None)
+        if con is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(self.db_path)
+            con.execute('PRAGMA journal_mode = WAL')
+            con.execute('PRAGMA synchronous = NORMAL')
+            con.execute('PRAGMA foreign_keys = ON')
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_schema(con)
+                    self._schema_ready = True
+            self._local.connection = con
+        return con
+
+    def _create_schema(self, con: sqlite3.Connection):
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+        if version != INDEX_VERSION:
+            if version != 0:
+                logger.info(f"Song index version changed ({version} -> {INDEX_VERSION}), rebuilding")
+            with con:
+                for table in ('search_grams', 'codepoints', 'failures', 'titles', 'courses', 'paths', 'songs'):
+                    con.execute(f'DROP TABLE IF EXISTS {table}')
+        has_codepoints = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'codepoints'").fetchone()
+        con.executescript(SCHEMA)
+        con.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+        if not has_codepoints:
+            self._rebuild_codepoints(con)
+        self._remove_legacy_cache()
+
+    def _rebuild_codepoints(self, con: sqlite3.Connection):
+        """Count the title codepoints of every indexed song, for indexes created before they were tracked."""
+        refs: dict[str, int] = dict()
+        for (text,) in con.execute("SELECT group_concat(text, '') FROM titles GROUP BY song_id"):
+            for codepoint in set(text):
+                refs[codepoint] = refs.get(codepoint, 0) + 1
+        with con:
+            con.execute('DELETE FROM codepoints')
+            con.executemany('INSERT INTO codepoints (codepoint, refs) VALUES (?, ?)', refs.items())
+
+    def _remove_legacy_cache(self):
+        """Delete the old song_hashes.json cache, which lacks the headers and course data the index needs.
+
+        Its songs are parsed again by the first scan instead of being imported.
+        """
+        removed = False
+        for name in ('song_hashes.json', 'path_to_hash.json', 'timestamp.txt'):
+            legacy_path = self.db_path.parent / name
+            if legacy_path.exists():
+                legacy_path.unlink()
+                removed = True
+        if removed:
+            logger.info(f"Removed the old song hash cache from {self.db_path.parent}, every song will be indexed again")
+
+    def _count_codepoints(self, con: sqlite3.Connection, texts: Iterable[str], delta: int):
+        """Add one reference to every distinct codepoint of a song's titles, or take it away with a delta of -1."""
+        con.executemany('''
+            INSERT INTO codepoints (codepoint, refs) VALUES (?, ?)
+            ON CONFLICT (codepoint) DO UPDATE SET refs = refs + excluded.refs
+        ''', [(codepoint, delta) for codepoint in set(''.join(texts))])
+        if delta < 0:
+            con.execute('DELETE FROM codepoints WHERE refs <= 0')
+
+    def _delete_song(self, con: sqlite3.Connection, path: str) -> Optional[tuple[int, str]]:
+        """Delete the song indexed at a path and return its id and search text."""
+        texts = [text for (text,) in con.execute(
+            'SELECT titles.text FROM paths JOIN titles ON titles.song_id = paths.song_id WHERE paths.path = ?', (path,))]
+        if texts:
+            self._count_codepoints(con, texts, -1)
+        row = con.execute('SELECT songs.id, songs.search FROM paths JOIN songs ON songs.id = paths.song_id WHERE paths.path = ?',
+                          (path,)).fetchone()
+        if row is not None:
+            song_id, search = row
+            # Deleted by gram rather than through a foreign key, which would need a second index on song_id
+            con.executemany('DELETE FROM search_grams WHERE gram = ? AND song_id = ?',
+                            [(gram, song_id) for gram in search_grams(search)])
+        con.execute('DELETE FROM songs WHERE id IN (SELECT song_id FROM paths WHERE path = ?)', (path,))
+        return row
+
+    def _write_song(self, con: sqlite3.Connection, entry: SongEntry) -> tuple[Optional[tuple[int, str]], int, str]:
+        """Insert the song of an entry, replacing the song indexed at its path.
+
+        Returns:
+            tuple: The id and search text of the replaced song (or None), then the new song's id and search text.
+        """
+        removed = self._delete_song(con, str(entry.file_path))
+        con.execute('DELETE FROM failures WHERE path = ?', (str(entry.file_path),))
+        metadata = None
+        if entry.metadata is not None:
+            metadata = pickle.dumps((entry.metadata, entry.ex_data), protocol=pickle.HIGHEST_PROTOCOL)
+        search = entry.search_text()
+        song_id = con.execute('INSERT INTO songs (hash, encoding, metadata, search) VALUES (?, ?, ?, ?)',
+                              (entry.hash, entry.encoding, metadata, search)).lastrowid
+        con.executemany('INSERT INTO search_grams (gram, song_id) VALUES (?, ?)',
+                        [(gram, song_id) for gram in search_grams(search)])
+        con.execute('INSERT INTO paths (path, song_id, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)',
+                    (str(entry.file_path), song_id, entry.stat.size, entry.stat.mtime_ns, entry.stat.inode))
+        con.executemany(f'''INSERT INTO courses (song_id, difficulty, hash, level, is_branching, {', '.join(STAT_COLUMNS)})
+                            VALUES (?, ?, ?, ?, ?{', ?' * len(STAT_COLUMNS)})''',
+                        [(song_id, diff, course.hash, course.level, int(course.is_branching),
+                          *(astuple(course.stats) if course.stats is not None else (None,) * len(STAT_COLUMNS)))
+                         for diff, course in entry.courses.items()])
+        con.executemany('INSERT INTO titles (song_id, kind, language, text) VALUES (?, ?, ?, ?)',
+                        [(song_id, 'title', language, text) for language, text in entry.title.items()] +
+                        [(song_id, 'subtitle', language, text) for language, text in entry.subtitle.items()])
+        self._count_codepoints(con, list(entry.title.values()) + list(entry.subtitle.values()), 1)
+        return removed, song_id, search
+
+    def upsert_song(self, entry: SongEntry):
+        """Insert or replace the song indexed at entry.file_path."""
+        con = self.connection
+        with con:
+            removed, song_id, search = self._write_song(con, entry)
+        self._invalidate_lookup()
+        # Songs without their header are not searchable, see search_songs
+        added = (song_id, str(entry.file_path), search) if entry.metadata is not None else None
+        self._update_search([removed] if removed is not None else [], added)
+
+    def remove_path(self, path: Path):
+        """Remove the song indexed at a path."""
+        self.remove_paths([str(path)])
+
+    def remove_paths(self, paths: Iterable[str]):
+        """Remove the songs and failures recorded at several paths in one transaction."""
+        con = self.connection
+        removed = []
+        with con:
+            for path in paths:
+                row = self._delete_song(con, path)
+                if row is not None:
+                    removed.append(row)
+                con.execute('DELETE FROM failures WHERE path = ?', (path,))
+        self._invalidate_lookup()
+        self._update_search(removed, None)
+
+    def record_failure(self, path: Path, stat: FileStat, error: str):
+        """Record a file that failed to parse, replacing the song previously indexed at its path."""
+        con = self.connection
+        with con:
+            removed = self._delete_song(con, str(path))
+            con.execute('INSERT OR REPLACE INTO failures (path, size, mtime_ns, inode, error) VALUES (?, ?, ?, ?, ?)',
+                        (str(path), stat.size, stat.mtime_ns, stat.inode, error))
+        self._invalidate_lookup()
+        self._update_search([removed] if removed is not None else [], None)
+
+    def _invalidate_lookup(self):
+        # Only called once a write is committed, so a lookup built concurrently is never kept stale
+        with self._lookup_lock:
+            self._lookup = None
+
+    def _update_search(self, removed: list[tuple[int, str]], added: Optional[tuple[int, str, str]]):
+        """Apply a committed write to the loaded search data, so searching never has to reload it.
+
+        Applying a write twice changes nothing, so it is safe even if the data was loaded after the commit.
+
+        Args:
+            removed (list[tuple[int, str]]): Id and search text of every deleted song.
+            added (Optional[tuple[int, str, str]]): Id, path and search text of the inserted song, if it is searchable.
+        """
+        with self._lookup_lock:
+            if self._search_songs is None:
+                return
+            # Removed first, a new song can reuse the id of the song it replaces
+            for song_id, search in removed:
+                self._search_songs.pop(song_id, None)
+                for gram in search_grams(search):
+                    posting = self._search_postings.get(gram)
+                    if posting is not None:
+                        posting.discard(song_id)
+            if added is not None:
+                song_id, path, search = added
+                self._search_songs[song_id] = (path, search)
+                for gram in search_grams(search):
+                    posting = self._search_postings.get(gram)
+                    if posting is not None:
+                        posting.add(song_id)
+
+    def load_search(self):
+        """Load the search data ahead of the first search, so it is not loaded on the song select screen."""
+        with self._lookup_lock:
+            self._load_search_songs()
+
+    def _load_search_songs(self) -> dict[int, tuple[str, str]]:
+        if self._search_songs is None:
+            # Songs without their header have no genre or levels in their search text, they are
+            # left out until the next scan parses them again (see get_incomplete_paths)
+            self._search_songs = {song_id: (path, search) for song_id, path, search in self.connection.execute('''
+                SELECT songs.id, paths.path, songs.search FROM songs JOIN paths ON paths.song_id = songs.id
+                WHERE songs.metadata IS NOT NULL
+            ''')}
+        return self._search_songs
+
+    def get_lookup(self) -> SongLookup:
+        """Return the paths of every indexed song by song hash and by English title and subtitle."""
+        with self._lookup_lock:
+            if self._lookup is None:
+                lookup = SongLookup(dict(), dict())
+                for hash_val, path, title, subtitle in self.connection.execute('''
+                    SELECT songs.hash, paths.path, title.text, subtitle.text
+                    FROM songs JOIN paths ON paths.song_id = songs.id
+                    LEFT JOIN titles AS title ON title.song_id = songs.id
+                        AND title.kind = 'title' AND title.language = 'en'
+                    LEFT JOIN titles AS subtitle ON subtitle.song_id = songs.id
+                        AND subtitle.kind = 'subtitle' AND subtitle.language = 'en'
+                    ORDER BY songs.id
+                '''):
+                    lookup.paths.setdefault(hash_val, []).append(Path(path))
+                    if title is not None and subtitle is not None:
+                        lookup.titles.setdefault((title, subtitle), []).append((hash_val, Path(path)))
+                self._lookup = lookup
+            return self._lookup
+
+    def get_failed_stats(self) -> dict[str, FileStat]:
+        """Return the filesystem state of every file that failed to parse."""
+        return {path: FileStat(size, mtime_ns, inode) for path, size, mtime_ns, inode
+                in self.connection.execute('SELECT path, size, mtime_ns, inode FROM failures')}
+
+    def get_failures(self) -> list[tuple[str, str]]:
+        """Return the path and error of every file that failed to parse, sorted by path."""
+        return self.connection.execute('SELECT path, error FROM failures ORDER BY path').fetchall()
+
+    def get_file_stats(self) -> dict[str, FileStat]:
+        """Return the indexed filesystem state of every path."""
+        return {path: FileStat(size, mtime_ns, inode) for path, size, mtime_ns, inode
+                in self.connection.execute('SELECT path, size, mtime_ns, inode FROM paths')}
+
+    def get_incomplete_paths(self) -> set[str]:
+        """Return the paths of songs indexed without their header or the statistics of every course."""
+        return {path for (path,) in self.connection.execute('''
+            SELECT paths.path FROM paths JOIN songs ON songs.id = paths.song_id
+            WHERE songs.metadata IS NULL
+                OR EXISTS (SELECT 1 FROM courses WHERE courses.song_id = songs.id AND courses.note_count IS NULL)
+        ''')}
+
+    def get_course_stats(self, path: Path, diff: int) -> Optional[CourseStats]:
+        """Return the statistics of a course of the file at a path, or None if they are not indexed."""
+        row = self.connection.execute(f'''
+            SELECT {', '.join(STAT_COLUMNS)} FROM courses JOIN paths ON paths.song_id = courses.song_id
+            WHERE paths.path = ? AND courses.difficulty = ?
+        ''', (str(path), diff)).fetchone()
+        return self._course_stats(row) if row is not None else None
+
+    @staticmethod
+    def _course_stats(row) -> Optional[CourseStats]:
+        if row[0] is None:
+            return None
+        return CourseStats(*row)
+
+    def has_hash(self, hash_val: str) -> bool:
+        """Check if any indexed file has the given song hash."""
+        return self.connection.execute('SELECT 1 FROM songs WHERE hash = ? LIMIT 1', (hash_val,)).fetchone() is not None
+
+    def get_song(self, hash_val: str) -> Optional[SongEntry]:
+        """Return the first indexed song with the given song hash."""
+        return next(self._load_songs('songs.hash = ? ORDER BY songs.id LIMIT 1', (hash_val,)), None)
+
+    def get_song_by_path(self, path: Path) -> Optional[SongEntry]:
+        """Return the song indexed at a path."""
+        return next(self._load_songs('paths.path = ?', (str(path),)), None)
+
+    def get_all_songs(self) -> dict[str, SongEntry]:
+        """Return every indexed song, accessed by path."""
+        return {str(entry.file_path): entry for entry in self._load_songs('1', ())}
+
+    def search_songs(self, query: str, limit: Optional[int] = None) -> list[Path]:
+        """Return the paths of the songs matching every word of a query, sorted by path.
+
+        A word matches a song if it appears in one of the words of the song's title,
+        subtitle, genre or course levels, ignoring width, case and kana differences.
+
+        Args:
+            query (str): The words to search for, separated by spaces.
+            limit (Optional[int]): Return at most this many paths, the first ones in path order.
+
+        Returns:
+            list[Path]: The paths of the matching songs.
+        """
+        words = normalize_search_text(query).split()
+        if not words:
+            return []
+        with self._lookup_lock:
+            songs = self._load_search_songs()
+
+            # Songs with every gram of every word, longer words are matched through their substrings of SEARCH_GRAM_LENGTH
+            candidates: Optional[set[int]] = None
+            for word in words:
+                for start in range(max(1, len(word) - SEARCH_GRAM_LENGTH + 1)):
+                    posting = self._search_posting(word[start:start + SEARCH_GRAM_LENGTH])
+                    candidates = posting if candidates is None else candidates & posting
+                    if not candidates:
+                        return []
+
+            # Drop songs where the grams of a longer word are apart, stopping once there are enough
+            long_words = [word for word in words if len(word) > SEARCH_GRAM_LENGTH]
+            # A posting loaded from the database can hold songs that are not searchable.
+            # Popped from a heap in path order, so a limited search only orders the songs it returns
+            matches = [songs[song_id] for song_id in candidates if song_id in songs]
+            heapq.heapify(matches)
+            paths = []
+            while matches:
+                path, search = heapq.heappop(matches)
+                if all(word in search for word in long_words):
+                    paths.append(Path(path))
+                    if len(paths) == limit:
+                        break
+            return paths
+
+    def _search_posting(self, gram: str) -> set[int]:
+        posting = self._search_postings.get(gram)
+        if posting is None:
+            posting = {song_id for (song_id,) in self.connection.execute(
+                'SELECT song_id FROM search_grams WHERE gram = ?', (gram,))}
+            self._search_postings[gram] = posting
+        return posting
+
+    def get_codepoints(self) -> set[str]:
+        """Return every character used in an indexed title or subtitle."""
+        return {codepoint for (codepoint,) in self.connection.execute('SELECT codepoint FROM codepoints')}
+
+    def song_count(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM paths').fetchone()[0]
+
+    def _load_songs(self, where: str, params: Iterable) -> Iterator[SongEntry]:
+        con = self.connection
+        rows = con.execute(f'''
+            SELECT songs.id, paths.path, songs.hash, paths.size, paths.mtime_ns, paths.inode, songs.encoding, songs.metadata
+            FROM songs JOIN paths ON paths.song_id = songs.id
+            WHERE {where}
+        ''', tuple(params)).fetchall()
+        entries: dict[int, SongEntry] = dict()
+        for song_id, path, hash_val, size, mtime_ns, inode, encoding, metadata in rows:
+            entry = SongEntry(Path(path), hash_val, FileStat(size, mtime_ns, inode), encoding, dict(), dict())
+            if metadata is not None:
+                try:
+                    entry.metadata, entry.ex_data = pickle.loads(metadata)
+                except Exception as e:
+                    logger.warning(f"Failed to load indexed metadata of {path}: {e}")
+            entries[song_id] = entry
+        if not entries:
+            return
+
+        # Titles and courses of every song in two queries, instead of two per song
+        song_ids = json.dumps(list(entries))
+        for song_id, kind, language, text in con.execute(
+                'SELECT song_id, kind, language, text FROM titles WHERE song_id IN (SELECT value FROM json_each(?))', (song_ids,)):
+            getattr(entries[song_id], kind)[language] = text
+        for song_id, diff, course_hash, level, is_branching, *stats in con.execute(f'''
+                SELECT song_id, difficulty, hash, level, is_branching, {', '.join(STAT_COLUMNS)} FROM courses
+                WHERE song_id IN (SELECT value FROM json_each(?)) ORDER BY song_id, difficulty''', (song_ids,)):
+            entries[song_id].courses[diff] = CourseEntry(course_hash, level, bool(is_branching), self._course_stats(stats))
+        yield from entries.values()
+
+song_index = SongIndex()
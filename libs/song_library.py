@@ -0,0 +1,176 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+from libs.song_index import FileStat
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class LibraryDir:
+    """A directory in the song library
+    path: path to the directory
+    has_box_def: whether the directory has a box.def, which makes it a folder in song select
+    has_box_png: whether the directory has a box.png
+    has_song_list: whether the directory has a song_list.txt
+    has_dan_json: whether the directory has a dan.json
+    tja_files: TJA files directly inside the directory, sorted
+    children: subdirectories, sorted
+    tja_count: number of TJA and dan.json files in the directory and all of its subdirectories
+    """
+    path: Path
+    has_box_def: bool = False
+    has_box_png: bool = False
+    has_song_list: bool = False
+    has_dan_json: bool = False
+    tja_files: list[Path] = field(default_factory=lambda: [])
+    children: list['LibraryDir'] = field(default_factory=lambda: [])
+    tja_count: int = 0
+
+    @property
+    def box_def_children(self) -> list['LibraryDir']:
+        return [child for child in self.children if child.has_box_def]
+
+    def walk(self) -> Iterator['LibraryDir']:
+        """Iterate this directory and all of its subdirectories, depth first."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def song_files(self) -> list[Path]:
+        """Return the TJA and dan.json files of this directory and of its
+        subdirectories that are not folders of their own."""
+        files = list(self.tja_files)
+        if self.has_dan_json:
+            files.append(self.path / 'dan.json')
+        for child in self.children:
+            if not child.has_box_def:
+                files.extend(child.song_files())
+        return files
+
+@dataclass
+class LibraryChanges:
+    """The difference between two scans of the song library
+    library: the newer scan
+    added: song files that are new in the newer scan
+    changed: song files whose size, mtime or inode changed
+    removed: song files that are gone in the newer scan
+    structure_changed: whether a box.def was added, changed or removed
+    song_lists: box.def folders whose song_list.txt has to be read again
+    scores_changed: whether scores were imported, so every song has to read its scores again
+    """
+    library: 'SongLibrary'
+    added: list[Path] = field(default_factory=lambda: [])
+    changed: list[Path] = field(default_factory=lambda: [])
+    removed: list[Path] = field(default_factory=lambda: [])
+    structure_changed: bool = False
+    song_lists: list[Path] = field(default_factory=lambda: [])
+    scores_changed: bool = False
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed or self.structure_changed or
+                    self.song_lists or self.scores_changed)
+
+class SongLibrary:
+    """In-memory tree of the song folders, built in a single os.scandir pass.
+
+    The song indexer and the file navigator both read from it, so every
+    directory is listed and every TJA file is stat'd once per scan.
+    """
+    def __init__(self):
+        self.root_dirs: list[Path] = []
+        self.directories: dict[str, LibraryDir] = dict()
+        self.tja_stats: dict[str, FileStat] = dict()
+        self.dan_stats: dict[str, FileStat] = dict()
+        self.box_def_stats: dict[str, FileStat] = dict()
+        self.is_scanned = False
+
+    def scan(self, root_dirs: list[Path], quiet: bool = False):
+        """Walk the song folders and rebuild the tree."""
+        self.root_dirs = [Path(root_dir) for root_dir in root_dirs]
+        self.directories = dict()
+        self.tja_stats = dict()
+        self.dan_stats = dict()
+        self.box_def_stats = dict()
+        for root_dir in self.root_dirs:
+            if root_dir.is_dir():
+                self._scan_dir(root_dir)
+            else:
+                logger.warning(f"Song folder does not exist: {root_dir}")
+        self.is_scanned = True
+        if not quiet:
+            logger.info(f"Scanned song library: {len(self.directories)} directories, {len(self.tja_stats)} TJA files")
+
+    def _scan_dir(self, path: Path) -> LibraryDir:
+        directory = LibraryDir(path)
+        self.directories[str(path)] = directory
+        child_paths: list[Path] = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        if entry.is_dir():
+                            child_paths.append(path / name)
+                            continue
+                        if name == 'box.def':
+                            directory.has_box_def = True
+                            self.box_def_stats[str(path / name)] = FileStat.from_stat(entry.stat())
+                        elif name == 'box.png':
+                            directory.has_box_png = True
+                        elif name == 'song_list.txt':
+                            directory.has_song_list = True
+                        elif name == 'dan.json':
+                            directory.has_dan_json = True
+                            self.dan_stats[str(path / name)] = FileStat.from_stat(entry.stat())
+                        elif name.lower().endswith('.tja'):
+                            tja_path = path / name
+                            self.tja_stats[str(tja_path)] = FileStat.from_stat(entry.stat())
+                            directory.tja_files.append(tja_path)
+                    except OSError as e:
+                        logger.warning(f"Could not read {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Could not list {path}: {e}")
+
+        directory.tja_files.sort()
+        directory.children = [self._scan_dir(child_path) for child_path in sorted(child_paths)]
+        directory.tja_count = (len(directory.tja_files) + directory.has_dan_json +
+                               sum(child.tja_count for child in directory.children))
+        return directory
+
+    def get(self, path: Path) -> Optional[LibraryDir]:
+        """Return the scanned directory at a path, or None if it is not in the library."""
+        return self.directories.get(str(path))
+
+    def diff(self, other: 'SongLibrary') -> LibraryChanges:
+        """Compare this scan with a newer one.
+
+        Args:
+            other (SongLibrary): The newer scan.
+
+        Returns:
+            LibraryChanges: The song files added, changed and removed since this scan.
+        """
+        old_stats = self.tja_stats | self.dan_stats
+        new_stats = other.tja_stats | other.dan_stats
+        added = new_stats.keys() - old_stats.keys()
+        changed = {path for path in new_stats.keys() & old_stats.keys() if new_stats[path] != old_stats[path]}
+        removed = old_stats.keys() - new_stats.keys()
+        return LibraryChanges(other,
+            [Path(path) for path in sorted(added)],
+            [Path(path) for path in sorted(changed)],
+            [Path(path) for path in sorted(removed)],
+            self.box_def_stats != other.box_def_stats)
+
+    def replace(self, other: 'SongLibrary'):
+        """Take over the tree of another scan, keeping this object as the shared instance."""
+        self.root_dirs = other.root_dirs
+        self.directories = other.directories
+        self.tja_stats = other.tja_stats
+        self.dan_stats = other.dan_stats
+        self.box_def_stats = other.box_def_stats
+        self.is_scanned = other.is_scanned
+
+song_library = SongLibrary()
@@ -1,12 +1,18 @@
 import bisect
-from enum import IntEnum
+import codecs
+from array import array
+from enum import IntEnum, IntFlag, auto
 import hashlib
+import heapq
 import math
 import logging
+import os
+import pickle
 import random
 from collections import deque
 from dataclasses import dataclass, field, fields
 from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 from typing import Optional
 
@@ -46,43 +52,85 @@ class ScrollType(IntEnum):
     BMSCROLL = 1
     HBSCROLL = 2
 
-@dataclass()
+class TimelineFlag(IntFlag):
+    """Which optional properties of a TimelineObject are set"""
+    NONE = 0
+    BPM = auto()
+    BPMCHANGE = auto()
+    DELAY = auto()
+    BORDER_COLOR = auto()
+    CAM_H_OFFSET = auto()
+    CAM_V_OFFSET = auto()
+    CAM_ZOOM = auto()
+    CAM_H_SCALE = auto()
+    CAM_V_SCALE = auto()
+    CAM_ROTATION = auto()
+    JPOSSCROLL = auto()
+
+class NoteFlag(IntFlag):
+    """Which optional properties of a Note are set"""
+    NONE = 0
+    BRANCH_START = auto()
+    BRANCH_PARAMS = auto()
+    SUDDEN = auto()
+
+@dataclass(slots=True)
 class TimelineObject:
-    hit_ms: float = field(init=False)
-    load_ms: float = field(init=False)
-
-    judge_pos_x: float = field(init=False)
-    judge_pos_y: float = field(init=False)
-    delta_x: float = field(init=False)
-    delta_y: float = field(init=False)
-    border_color: ray.Color = field(init=False)
-    cam_h_offset: float = field(init=False)
-    cam_v_offset: float = field(init=False)
-    cam_h_scale: float = field(init=False)
-    cam_v_scale: float = field(init=False)
-    cam_zoom: float = field(init=False)
-    cam_rotation: float = field(init=False)
-
-    bpm: float = field(init=False)
-    bpmchange: float = field(init=False)
-    delay: float = field(init=False)
-    '''
-    gogo_time: bool = field(init=False)
-    branch_params: str = field(init=False)
-    is_branch_start: bool = False
-    is_section_marker: bool = False
-    sudden_appear_ms: float = 0
-    sudden_moving_ms: float = 0
-    bpmchange (float): If it exists, the bpm will be multiplied by it when the note passes the judgement circle
-    delay (float): Milliseconds, if it exists, the delay will be added when the note passes the judgement circle
-    '''
+    """An event on the timeline of a chart.
+
+    Every property has a fixed slot, flags records which of them the event actually sets.
+
+    Attributes:
+        hit_ms (float): The time at which the event happens.
+        load_ms (float): The time at which a JPOSSCROLL starts moving.
+        judge_pos_x, judge_pos_y, delta_x, delta_y (float): The start position and distance of a JPOSSCROLL.
+        border_color (ray.Color): The new border color.
+        cam_* (float): The new camera values.
+        bpm (float): The new bpm.
+        bpmchange (float): The bpm will be multiplied by it when the note passes the judgement circle.
+        delay (float): Milliseconds, the delay will be added when the note passes the judgement circle.
+        flags (TimelineFlag): Which of the optional properties are set.
+    """
+    hit_ms: float = field(default=0, init=False)
+    load_ms: float = field(default=0, init=False)
+
+    judge_pos_x: float = field(default=0, init=False)
+    judge_pos_y: float = field(default=0, init=False)
+    delta_x: float = field(default=0, init=False)
+    delta_y: float = field(default=0, init=False)
+    border_color: Optional[ray.Color] = field(default=None, init=False)
+    cam_h_offset: float = field(default=0, init=False)
+    cam_v_offset: float = field(default=0, init=False)
+    cam_h_scale: float = field(default=1, init=False)
+    cam_v_scale: float = field(default=1, init=False)
+    cam_zoom: float = field(default=1, init=False)
+    cam_rotation: float = field(default=0, init=False)
+
+    bpm: float = field(default=0, init=False)
+    bpmchange: float = field(default=1, init=False)
+    delay: float = field(default=0, init=False)
+    flags: TimelineFlag = field(default=TimelineFlag.NONE, init=False)
 
     def __lt__(self, other):
         """Allow sorting by load_ms"""
         return self.load_ms < other.load_ms
 
+    def __getstate__(self):
+        """ray.Color is a cffi struct and cannot be pickled, store it as a tuple"""
+        state = {f.name: getattr(self, f.name) for f in fields(self)}
+        color = state['border_color']
+        if color is not None:
+            state['border_color'] = tuple(color) if isinstance(color, tuple) else (color.r, color.g, color.b, color.a)
+        return state
+
+    def __setstate__(self, state):
+        if state.get('border_color') is not None:
+            state['border_color'] = ray.Color(*state['border_color'])
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
-@dataclass()
+@dataclass(slots=True)
 class Note:
     """A note in a TJA file.
 
@@ -96,26 +144,28 @@ class Note:
         display (bool): Whether the note should be displayed.
         index (int): The index of the note.
         gogo_time (bool): Whether the note is a gogo time note.
-        moji (int): The text drawn below the note.
-        is_branch_start (bool): Whether the note is the start of a branch.
-        branch_params (str): The parameters (requirements) of the branch.
+        moji (int): The text drawn below the note, -1 if none.
+        branch_params (str): The parameters (requirements) of the branch, only valid with NoteFlag.BRANCH_PARAMS.
+        lyric (str): The lyric shown while the note is playing.
+        sudden_appear_ms, sudden_moving_ms (float): How long before hit_ms the note appears and starts moving, only valid with NoteFlag.SUDDEN.
+        flags (NoteFlag): Which of the optional properties are set, and whether the note is the start of a branch.
     """
-    type: int = field(init=False)
-    hit_ms: float = field(init=False)
-    load_ms: float = field(init=False)
-    load_ms_x: float = field(init=False)
-    load_ms_y: float = field(init=False)
-    pixels_per_frame_x: float = field(init=False)
-    pixels_per_frame_y: float = field(init=False)
-    display: bool = field(init=False)
-    index: int = field(init=False)
-    gogo_time: bool = field(init=False)
-    moji: int = field(init=False)
-    is_branch_start: bool = field(init=False)
-    branch_params: str = field(init=False)
-    lyric: str = field(init=False)
-    sudden_appear_ms: float = field(init=False)
-    sudden_moving_ms: float = field(init=False)
+    type: int = field(default=0, init=False)
+    hit_ms: float = field(default=0, init=False)
+    load_ms: float = field(default=0, init=False)
+    load_ms_x: float = field(default=0, init=False)
+    load_ms_y: float = field(default=0, init=False)
+    pixels_per_frame_x: float = field(default=0, init=False)
+    pixels_per_frame_y: float = field(default=0, init=False)
+    display: bool = field(default=True, init=False)
+    index: int = field(default=0, init=False)
+    gogo_time: bool = field(default=False, init=False)
+    moji: int = field(default=-1, init=False)
+    branch_params: str = field(default='', init=False)
+    lyric: str = field(default='', init=False)
+    sudden_appear_ms: float = field(default=0, init=False)
+    sudden_moving_ms: float = field(default=0, init=False)
+    flags: NoteFlag = field(default=NoteFlag.NONE, init=False)
 
     def __lt__(self, other):
         return self.hit_ms < other.hit_ms
@@ -133,16 +183,8 @@ class Note:
         return self.hit_ms == other.hit_ms
 
     def _get_hash_data(self) -> bytes:
-        hash_fields = ['type', 'hit_ms', 'load_ms']
-        field_values = []
-
-        for field_name in sorted(hash_fields):
-            value = getattr(self, field_name, None)
-            field_values.append((field_name, value))
-
-        field_values.append(('__class__', self.__class__.__name__))
-        hash_string = str(field_values)
-        return hash_string.encode('utf-8')
+        # Same text as str() of the sorted (field, value) list the digests were originally made from
+        return f"[('hit_ms', {self.hit_ms!r}), ('load_ms', {self.load_ms!r}), ('type', {self.type!r}), ('__class__', {type(self).__name__!r})]".encode('utf-8')
 
     def get_hash(self, algorithm='sha256') -> str:
         """Generate hash of the note"""
@@ -150,14 +192,15 @@ class Note:
         hash_obj.update(self._get_hash_data())
         return hash_obj.hexdigest()
 
-    def __hash__(self) -> int:
-        """Make instances hashable for use in sets/dicts"""
-        return int(self.get_hash('md5')[:8], 16)  # Use first 8 chars of MD5 as int
+    # Notes are hashed by identity: reset_chart shifts hit_ms in place for BMSCROLL/HBSCROLL,
+    # so a hash of hit_ms would change while the note sits in a set or dict.
+    # Code that dedups notes by value keys on an explicit tuple, as bar_manager does.
+    __hash__ = object.__hash__
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({f.name: getattr(self, f.name) for f in fields(self)})
 
-@dataclass
+@dataclass(slots=True)
 class Drumroll(Note):
     """A drumroll note in a TJA file.
 
@@ -166,20 +209,19 @@ class Drumroll(Note):
         color (int): The color of the drumroll. (0-255 where 255 is red)
     """
     _source_note: Note
-    color: int = field(init=False)
+    color: int = field(default=255, init=False)
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({f.name: getattr(self, f.name) for f in fields(self)})
 
     def __eq__(self, other):
         return self.hit_ms == other.hit_ms
 
     def __post_init__(self):
-        for field_name in [f.name for f in fields(Note)]:
-            if hasattr(self._source_note, field_name):
-                setattr(self, field_name, getattr(self._source_note, field_name))
+        for field_name in NOTE_FIELDS:
+            setattr(self, field_name, getattr(self._source_note, field_name))
 
-@dataclass
+@dataclass(slots=True)
 class Balloon(Note):
     """A balloon note in a TJA file.
 
@@ -190,51 +232,49 @@ class Balloon(Note):
         is_kusudama (bool): Whether the balloon is a kusudama.
     """
     _source_note: Note
-    count: int = field(init=False)
+    count: int = field(default=1, init=False)
     popped: bool = False
     is_kusudama: bool = False
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({f.name: getattr(self, f.name) for f in fields(self)})
 
     def __eq__(self, other):
         return self.hit_ms == other.hit_ms
 
     def __post_init__(self):
-        for field_name in [f.name for f in fields(Note)]:
-            if hasattr(self._source_note, field_name):
-                setattr(self, field_name, getattr(self._source_note, field_name))
+        for field_name in NOTE_FIELDS:
+            setattr(self, field_name, getattr(self._source_note, field_name))
 
     def _get_hash_data(self) -> bytes:
-        """Override to include source note and balloon-specific data"""
-        hash_fields = ['type', 'hit_ms', 'load_ms', 'count']
-        field_values = []
+        """Override to include balloon-specific data"""
+        return f"[('count', {self.count!r}), ('hit_ms', {self.hit_ms!r}), ('load_ms', {self.load_ms!r}), ('type', {self.type!r}), ('__class__', {type(self).__name__!r})]".encode('utf-8')
 
-        for field_name in sorted(hash_fields):
-            value = getattr(self, field_name, None)
-            field_values.append((field_name, value))
-
-        field_values.append(('__class__', self.__class__.__name__))
-        hash_string = str(field_values)
-        return hash_string.encode('utf-8')
+NOTE_FIELDS = tuple(f.name for f in fields(Note))
+# Identifies the class of a note in the packed buffer of hash_note_data
+HASH_CLASS_IDS = {Note: 0, Drumroll: 1, Balloon: 2}
 
 @dataclass
 class NoteList:
     """A collection of notes
     play_notes: A list of notes, drumrolls, and balloons that are played by the player
     draw_notes: A list of notes, drumrolls, and balloons that are drawn by the player
-    bars: A list of bars"""
+    bars: A list of bars
+    timeline: A list of timeline events
+    camera_moves: A list of camera moves, evaluated at the current time during gameplay"""
     play_notes: list[Note | Drumroll | Balloon] = field(default_factory=lambda: [])
     draw_notes: list[Note | Drumroll | Balloon] = field(default_factory=lambda: [])
     bars: list[Note] = field(default_factory=lambda: [])
     timeline: list[TimelineObject] = field(default_factory=lambda: [])
+    camera_moves: list['CameraMove'] = field(default_factory=lambda: [])
 
     def __add__(self, other: 'NoteList') -> 'NoteList':
         return NoteList(
             play_notes=self.play_notes + other.play_notes,
             draw_notes=self.draw_notes + other.draw_notes,
             bars=self.bars + other.bars,
-            timeline=self.timeline + other.timeline
+            timeline=self.timeline + other.timeline,
+            camera_moves=self.camera_moves + other.camera_moves
         )
 
     def __iadd__(self, other: 'NoteList') -> 'NoteList':
@@ -242,8 +282,41 @@ class NoteList:
         self.draw_notes += other.draw_notes
         self.bars += other.bars
         self.timeline += other.timeline
+        self.camera_moves += other.camera_moves
         return self
 
+class NoteColumns:
+    """The note type, hit time and balloon count of a list of notes, as typed arrays
+
+    A compact helper for counting notes and scoring a chart, which only need these
+    three fields. The notes themselves stay the storage used during play.
+    count is 0 for notes that are not balloons."""
+    COLUMNS = {
+        'hit_ms': 'd',
+        'type': 'B',
+        'count': 'q',
+    }
+    __slots__ = tuple(COLUMNS)
+
+    def __init__(self, notes: Optional[list[Note] | deque[Note]] = None):
+        for name, typecode in self.COLUMNS.items():
+            setattr(self, name, array(typecode))
+        if notes:
+            self.extend(notes)
+
+    def extend(self, notes: list[Note] | deque[Note]):
+        """Append the data of the given notes to the columns."""
+        self.hit_ms.extend([note.hit_ms for note in notes])
+        self.type.extend([int(note.type) for note in notes])
+        self.count.extend([note.count if isinstance(note, Balloon) else 0 for note in notes])
+
+    def __len__(self) -> int:
+        return len(self.hit_ms)
+
+    def count_notes(self) -> int:
+        """Count the don and kat notes (the notes that are judged)."""
+        return sum(map(self.type.count, (NoteType.DON, NoteType.KAT, NoteType.DON_L, NoteType.KAT_L)))
+
 @dataclass
 class CourseData:
     """A collection of course metadata
@@ -299,59 +372,384 @@ class TJAEXData:
     new: bool = False
 
 
-def calculate_base_score(notes: NoteList) -> int:
+class ChartCommand(IntEnum):
+    NOTES = 0
+    UNKNOWN = 1
+    BORDERCOLOR = 2
+    CAMRESET = 3
+    CAMHOFFSET = 4
+    CAMHMOVESTART = 5
+    CAMHMOVEEND = 6
+    CAMVOFFSET = 7
+    CAMVMOVESTART = 8
+    CAMVMOVEEND = 9
+    CAMZOOMSTART = 10
+    CAMZOOMEND = 11
+    CAMZOOM = 12
+    CAMHSCALESTART = 13
+    CAMHSCALEEND = 14
+    CAMHSCALE = 15
+    CAMVSCALESTART = 16
+    CAMVSCALEEND = 17
+    CAMVSCALE = 18
+    CAMROTATIONSTART = 19
+    CAMROTATIONEND = 20
+    CAMROTATION = 21
+    SECTION = 22
+    BRANCHSTART = 23
+    BRANCHEND = 24
+    BRANCH_M = 25
+    BRANCH_E = 26
+    BRANCH_N = 27
+    LYRIC = 28
+    JPOSSCROLL = 29
+    NMSCROLL = 30
+    BMSCROLL = 31
+    HBSCROLL = 32
+    MEASURE = 33
+    SCROLL = 34
+    BPMCHANGE = 35
+    BARLINEOFF = 36
+    BARLINEON = 37
+    GOGOSTART = 38
+    GOGOEND = 39
+    DELAY = 40
+    SUDDEN = 41
+
+# (match, token, command, argument offset) checked in order, the first match wins.
+# Longer commands must come before their prefixes (#CAMZOOMSTART before #CAMZOOM).
+# An argument offset of None passes the whole part to the handler.
+COMMAND_TABLE = [
+    ('startswith', '#BORDERCOLOR', ChartCommand.BORDERCOLOR, 13),
+    ('startswith', '#CAMRESET', ChartCommand.CAMRESET, None),
+    ('startswith', '#CAMHOFFSET', ChartCommand.CAMHOFFSET, 12),
+    ('startswith', '#CAMHMOVESTART', ChartCommand.CAMHMOVESTART, 15),
+    ('startswith', '#CAMHMOVEEND', ChartCommand.CAMHMOVEEND, None),
+    ('startswith', '#CAMVOFFSET', ChartCommand.CAMVOFFSET, 12),
+    ('startswith', '#CAMVMOVESTART', ChartCommand.CAMVMOVESTART, 15),
+    ('startswith', '#CAMVMOVEEND', ChartCommand.CAMVMOVEEND, None),
+    ('startswith', '#CAMZOOMSTART', ChartCommand.CAMZOOMSTART, 14),
+    ('startswith', '#CAMZOOMEND', ChartCommand.CAMZOOMEND, None),
+    ('startswith', '#CAMZOOM', ChartCommand.CAMZOOM, 9),
+    ('startswith', '#CAMHSCALESTART', ChartCommand.CAMHSCALESTART, 16),
+    ('startswith', '#CAMHSCALEEND', ChartCommand.CAMHSCALEEND, None),
+    ('startswith', '#CAMHSCALE', ChartCommand.CAMHSCALE, 11),
+    ('startswith', '#CAMVSCALESTART', ChartCommand.CAMVSCALESTART, 16),
+    ('startswith', '#CAMVSCALEEND', ChartCommand.CAMVSCALEEND, None),
+    ('startswith', '#CAMVSCALE', ChartCommand.CAMVSCALE, 11),
+    ('startswith', '#CAMROTATIONSTART', ChartCommand.CAMROTATIONSTART, 18),
+    ('startswith', '#CAMROTATIONEND', ChartCommand.CAMROTATIONEND, None),
+    ('startswith', '#CAMROTATION', ChartCommand.CAMROTATION, 13),
+    ('startswith', '#SECTION', ChartCommand.SECTION, None),
+    ('startswith', '#BRANCHSTART', ChartCommand.BRANCHSTART, 13),
+    ('startswith', '#BRANCHEND', ChartCommand.BRANCHEND, None),
+    ('equals', '#M', ChartCommand.BRANCH_M, None),
+    ('equals', '#E', ChartCommand.BRANCH_E, None),
+    ('equals', '#N', ChartCommand.BRANCH_N, None),
+    ('contains', '#LYRIC', ChartCommand.LYRIC, 6),
+    ('contains', '#JPOSSCROLL', ChartCommand.JPOSSCROLL, None),
+    ('contains', '#NMSCROLL', ChartCommand.NMSCROLL, None),
+    ('contains', '#BMSCROLL', ChartCommand.BMSCROLL, None),
+    ('contains', '#HBSCROLL', ChartCommand.HBSCROLL, None),
+    ('contains', '#MEASURE', ChartCommand.MEASURE, None),
+    ('contains', '#SCROLL', ChartCommand.SCROLL, 7),
+    ('contains', '#BPMCHANGE', ChartCommand.BPMCHANGE, 11),
+    ('contains', '#BARLINEOFF', ChartCommand.BARLINEOFF, None),
+    ('contains', '#BARLINEON', ChartCommand.BARLINEON, None),
+    ('contains', '#GOGOSTART', ChartCommand.GOGOSTART, None),
+    ('contains', '#GOGOEND', ChartCommand.GOGOEND, None),
+    ('startswith', '#DELAY', ChartCommand.DELAY, 6),
+    ('startswith', '#SUDDEN', ChartCommand.SUDDEN, None),
+]
+
+@lru_cache(maxsize=4096)
+def _tokenize_command(part: str) -> tuple[ChartCommand, str]:
+    for match, token, command, offset in COMMAND_TABLE:
+        if ((match == 'startswith' and part.startswith(token)) or
+            (match == 'equals' and part == token) or
+            (match == 'contains' and token in part)):
+            return command, part if offset is None else part[offset:]
+    if len(part) > 0 and not part[0].isdigit():
+        return ChartCommand.UNKNOWN, part
+    return ChartCommand.NOTES, part
+
+def tokenize_part(part: str) -> tuple[ChartCommand, str]:
+    """Classify a part of a bar into a command and its argument string.
+
+    Args:
+        part (str): A command or a line of note data.
+
+    Returns:
+        tuple[ChartCommand, str]: The command and its arguments, or the note data itself.
+    """
+    if '#' not in part:
+        # Every command contains '#', so this is note data (or garbage)
+        if len(part) > 0 and not part[0].isdigit():
+            return ChartCommand.UNKNOWN, part
+        return ChartCommand.NOTES, part
+    return _tokenize_command(part)
+
+# Camera commands that interpolate a TimelineObject attribute between two values
+CAMERA_MOVES = {
+    ChartCommand.CAMHMOVESTART: 'cam_h_offset',
+    ChartCommand.CAMHMOVEEND: 'cam_h_offset',
+    ChartCommand.CAMVMOVESTART: 'cam_v_offset',
+    ChartCommand.CAMVMOVEEND: 'cam_v_offset',
+    ChartCommand.CAMZOOMSTART: 'cam_zoom',
+    ChartCommand.CAMZOOMEND: 'cam_zoom',
+    ChartCommand.CAMHSCALESTART: 'cam_h_scale',
+    ChartCommand.CAMHSCALEEND: 'cam_h_scale',
+    ChartCommand.CAMVSCALESTART: 'cam_v_scale',
+    ChartCommand.CAMVSCALEEND: 'cam_v_scale',
+    ChartCommand.CAMROTATIONSTART: 'cam_rotation',
+    ChartCommand.CAMROTATIONEND: 'cam_rotation',
+}
+
+# Camera commands that set a TimelineObject attribute immediately
+CAMERA_SETS = {
+    ChartCommand.CAMHOFFSET: 'cam_h_offset',
+    ChartCommand.CAMVOFFSET: 'cam_v_offset',
+    ChartCommand.CAMZOOM: 'cam_zoom',
+    ChartCommand.CAMHSCALE: 'cam_h_scale',
+    ChartCommand.CAMVSCALE: 'cam_v_scale',
+    ChartCommand.CAMROTATION: 'cam_rotation',
+}
+
+# The TimelineFlag of each camera attribute
+CAMERA_FLAGS = {attribute: TimelineFlag[attribute.upper()] for attribute in CAMERA_SETS.values()}
+
+def apply_easing(t, easing_point, easing_function):
+    """Apply easing function to normalized time value t (0 to 1)"""
+    if easing_point == 'IN':
+        pass  # t stays as is
+    elif easing_point == 'OUT':
+        t = 1 - t
+    elif easing_point == 'IN_OUT':
+        if t < 0.5:
+            t = t * 2
+        else:
+            t = (1 - t) * 2
+
+    if easing_function == 'LINEAR':
+        result = t
+    elif easing_function == 'CUBIC':
+        result = t ** 3
+    elif easing_function == 'QUARTIC':
+        result = t ** 4
+    elif easing_function == 'QUINTIC':
+        result = t ** 5
+    elif easing_function == 'SINUSOIDAL':
+        result = 1 - math.cos((t * math.pi) / 2)
+    elif easing_function == 'EXPONENTIAL':
+        result = 0 if t == 0 else 2 ** (10 * (t - 1))
+    elif easing_function == 'CIRCULAR':
+        result = 1 - math.sqrt(1 - t ** 2)
+    else:
+        result = t
+
+    if easing_point == 'OUT':
+        result = 1 - result
+    elif easing_point == 'IN_OUT':
+        if t >= 0.5:
+            result = 1 - result
+
+    return result
+
+@dataclass
+class CameraMove:
+    """A #CAM...START command and its matching END
+    attribute: the TimelineObject camera attribute that is moved (cam_zoom, cam_h_offset, etc.)
+    start_ms, end_ms: time the move starts and ends, end_ms is only known once the END command is reached
+    start_value, end_value: values to interpolate between
+    easing_point: IN, OUT or IN_OUT
+    easing_function: LINEAR, CUBIC, etc.
+    """
+    attribute: str
+    start_ms: float
+    start_value: float
+    end_value: float
+    easing_point: str
+    easing_function: str
+    end_ms: float = 0
+
+    def value_at(self, ms: float) -> float:
+        """Get the value of the camera attribute at the given time, clamped to the ends of the move."""
+        duration_ms = self.end_ms - self.start_ms
+        t = 1.0 if duration_ms <= 0 else min(1.0, max(0.0, (ms - self.start_ms) / duration_ms))
+        eased_t = apply_easing(t, self.easing_point, self.easing_function)
+        return self.start_value + (self.end_value - self.start_value) * eased_t
+
+@dataclass
+class ChartState:
+    """The running state of notes_to_position while it walks through a course
+    current_ms: time of the next note or bar line
+    notes: the NoteList currently being written to (master or a branch)
+    start_branch_*: state saved at #BRANCHSTART and restored for every branch
+    bpmchange_last_bpm, delay_current, delay_last_note_ms: only used during BMSCROLL or HBSCROLL
+    bar_length, barline_added: state of the bar currently being parsed
+    """
+    current_ms: float
+    bpm: float
+    balloon: list[int]
+    master_notes: NoteList = field(default_factory=NoteList)
+    branch_m: list[NoteList] = field(default_factory=list)
+    branch_e: list[NoteList] = field(default_factory=list)
+    branch_n: list[NoteList] = field(default_factory=list)
+    notes: NoteList = field(init=False)
+    count: int = 0
+    index: int = 0
+    sudden_appear: float = 0
+    sudden_moving: float = 0
+    judge_pos_x: float = 0
+    judge_pos_y: float = 0
+    border_color: ray.Color = ray.BLACK
+    camera: dict[str, float] = field(default_factory=lambda: {
+        'cam_h_offset': 0, 'cam_v_offset': 0, 'cam_zoom': 1.0,
+        'cam_h_scale': 1.0, 'cam_v_scale': 1.0, 'cam_rotation': 0.0})
+    camera_moves: dict[str, CameraMove] = field(default_factory=dict)
+    time_signature: float = 4/4
+    x_scroll_modifier: float = 1
+    y_scroll_modifier: float = 0
+    barline_display: bool = True
+    gogo_time: bool = False
+    start_branch_ms: float = 0
+    start_branch_bpm: float = field(init=False)
+    start_branch_time_sig: float = 4/4
+    start_branch_x_scroll: float = 1
+    start_branch_y_scroll: float = 0
+    start_branch_barline: bool = True
+    start_branch_gogo: bool = False
+    branch_balloon_count: int = 0
+    is_branching: bool = False
+    prev_note: Optional[Note] = None
+    is_section_start: bool = False
+    section_bar: Optional[Note] = None
+    lyric: str = ""
+    scroll_type: ScrollType = ScrollType.NMSCROLL
+    bpmchange_last_bpm: float = field(init=False)
+    delay_current: float = 0
+    delay_last_note_ms: float = field(init=False)
+    bar_length: int = 0
+    barline_added: bool = False
+
+    def __post_init__(self):
+        self.notes = self.master_notes
+        self.start_branch_bpm = self.bpm
+        self.bpmchange_last_bpm = self.bpm
+        self.delay_last_note_ms = self.current_ms
+
+
+def calculate_base_score(notes: NoteList | NoteColumns) -> int:
     """Calculate the base score for a song based on the number of notes, balloons, and drumrolls.
 
     Args:
-        notes (NoteList): The list of notes in the song.
+        notes (NoteList | NoteColumns): The list of notes in the song, or its play notes as columns.
 
     Returns:
         int: The base score for the song.
     """
-    total_notes = 0
-    balloon_count = 0
-    drumroll_msec = 0
-    for i in range(len(notes.play_notes)):
-        note = notes.play_notes[i]
-        if i < len(notes.play_notes)-1:
-            next_note = notes.play_notes[i+1]
-        else:
-            next_note = notes.play_notes[len(notes.play_notes)-1]
-        if isinstance(note, Drumroll):
-            drumroll_msec += (next_note.hit_ms - note.hit_ms)
-        elif isinstance(note, Balloon):
-            balloon_count += min(100, note.count)
-        elif note.type == 8:
-            continue
-        else:
-            total_notes += 1
+    columns = notes if isinstance(notes, NoteColumns) else NoteColumns(notes.play_notes)
+    total_notes = columns.count_notes()
     if total_notes == 0:
         return 1000000
+    types = columns.type
+    hit_ms = columns.hit_ms
+    last = len(types) - 1
+    drumroll_msec = 0
+    balloon_count = 0
+    for i, note_type in enumerate(types):
+        if note_type == NoteType.ROLL_HEAD or note_type == NoteType.ROLL_HEAD_L:
+            drumroll_msec += (hit_ms[min(i + 1, last)] - hit_ms[i])
+        elif note_type == NoteType.BALLOON_HEAD or note_type == NoteType.KUSUDAMA:
+            balloon_count += min(100, columns.count[i])
     return math.ceil((1000000 - (balloon_count * 100) - (16.920079999994086 * drumroll_msec / 1000 * 100)) / total_notes / 10) * 10
 
-def test_encodings(file_path: Path):
-    """Test the encoding of a file by trying different encodings.
+TJA_ENCODINGS = ['utf-8-sig', 'shift-jis', 'utf-8', 'utf-16', 'mac_roman']
+
+def decode_file(file_path: Path, encoding: Optional[str] = None) -> tuple[str, str]:
+    """Read a file once and decode it, detecting the encoding if needed.
 
     Args:
-        file_path (Path): The path to the file to test.
+        file_path (Path): The path to the file to read.
+        encoding (str, optional): A previously detected encoding to try first.
 
     Returns:
-        str: The encoding that successfully decoded the file.
+        tuple[str, str]: The decoded text and the encoding that decoded it.
     """
-    encodings = ['utf-8-sig', 'shift-jis', 'utf-8', 'utf-16', 'mac_roman']
-    final_encoding = None
-
-    for encoding in encodings:
+    raw = file_path.read_bytes()
+    if encoding is not None:
+        try:
+            return raw.decode(encoding), encoding
+        except (UnicodeDecodeError, LookupError):
+            logger.debug(f"Stored encoding {encoding} no longer decodes {file_path}")
+    if raw.startswith(codecs.BOM_UTF8):
+        candidates = ['utf-8-sig']
+    elif raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates = ['utf-16']
+    else:
+        candidates = []
+    for candidate in candidates + TJA_ENCODINGS[:-1]:
         try:
-            _ = file_path.read_text(encoding=encoding).splitlines()
-            final_encoding = encoding
-            break
+            return raw.decode(candidate), candidate
         except UnicodeDecodeError:
             continue
-    return final_encoding
+    # mac_roman maps every byte, so it always succeeds as the last resort
+    return raw.decode(TJA_ENCODINGS[-1]), TJA_ENCODINGS[-1]
 
 logger = logging.getLogger(__name__)
 
+CHART_CACHE_DIR = Path('cache/charts')
+# Bump whenever the parser output or any of the note classes change shape
+CHART_CACHE_VERSION = 3
+# The least recently used charts are deleted once the cache grows past this size
+CHART_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def prune_chart_cache(max_bytes: int = CHART_CACHE_MAX_BYTES):
+    """Delete the compiled charts of an older CHART_CACHE_VERSION, then the least recently used
+    ones until the cache fits in max_bytes.
+
+    Args:
+        max_bytes (int): The most disk space the cache may use.
+    """
+    if not CHART_CACHE_DIR.exists():
+        return
+    version_path = CHART_CACHE_DIR / 'version.txt'
+    try:
+        version = version_path.read_text().strip()
+    except OSError:
+        version = None
+    entries = []
+    for path in CHART_CACHE_DIR.iterdir():
+        if path.suffix not in ('.pickle', '.tmp'):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    removed = 0
+    if version != str(CHART_CACHE_VERSION):
+        stale, entries = entries, []
+    else:
+        # Loading a chart touches its file, so the oldest modification time is the least recently used
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        stale = []
+        while entries and total > max_bytes:
+            entry = entries.pop(0)
+            total -= entry[1]
+            stale.append(entry)
+    for _, _, path in stale:
+        try:
+            path.unlink()
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Failed to delete chart cache {path}: {e}")
+    version_path.write_text(str(CHART_CACHE_VERSION))
+    if removed:
+        logger.info(f"Deleted {removed} compiled charts from the chart cache")
+
 class TJAParser:
     """Parse a TJA file and extract metadata and data.
 
@@ -365,9 +763,11 @@ class TJAParser:
         metadata (TJAMetadata): The metadata extracted from the TJA file.
         ex_data (TJAEXData): The extended data extracted from the TJA file.
         data (list): The data extracted from the TJA file.
+        encoding (str): The encoding the TJA file was decoded with.
     """
     DIFFS = {0: "easy", 1: "normal", 2: "hard", 3: "oni", 4: "edit", 5: "tower", 6: "dan"}
-    def __init__(self, path: Path, start_delay: float = 0, screen_width: float = 1280, screen_height: float = 720, initial_judge_pos_x: float = 414, initial_judge_pos_y: float = 256):
+    def __init__(self, path: Path, start_delay: float = 0, screen_width: float = 1280, screen_height: float = 720, initial_judge_pos_x: float = 414, initial_judge_pos_y: float = 256, metadata_only: bool = False, encoding: Optional[str] = None,
+                 metadata: Optional[TJAMetadata] = None, ex_data: Optional[TJAEXData] = None):
         """
         Initialize a TJA object.
 
@@ -376,33 +776,119 @@ class TJAParser:
             start_delay (int): The delay in milliseconds before the first note.
             screen_width, screen_height (float): The screen width and height.
             initial_judge_pos_x, initial_judge_pos_y (float): The judge position (coordinates for center of judgement circle texture on screen)
+            metadata_only (bool): Only parse the header lines, the note data is loaded when it is first needed.
+            encoding (str, optional): The encoding of the file if it is already known, skips detection.
+            metadata (TJAMetadata, optional): Metadata parsed earlier, such as by the song index. The file is
+                not read until the note data is needed.
+            ex_data (TJAEXData, optional): Extra data parsed along with metadata.
         """
         self.file_path: Path = path
-
-        encoding = test_encodings(self.file_path)
-        lines = self.file_path.read_text(encoding=encoding).splitlines()
-        self.data = [cleaned for line in lines
-                     if (cleaned := strip_comments(line).strip())]
+        self.encoding: Optional[str] = encoding
 
         self.metadata = TJAMetadata()
         self.ex_data = TJAEXData()
         logger.debug(f"Parsing TJA file: {self.file_path}")
-        self.get_metadata()
+        if metadata is not None:
+            self._data = None
+            self.metadata = metadata
+            if ex_data is not None:
+                self.ex_data = ex_data
+        elif metadata_only:
+            self._data = None
+            self.get_metadata(self._read_lines(header_only=True))
+        else:
+            self._data = self._read_lines()
+            self.get_metadata(self._data)
 
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.initial_judge_pos_x = initial_judge_pos_x
         self.initial_judge_pos_y = initial_judge_pos_y
 
+        self.start_delay = start_delay
         self.current_ms: float = start_delay
+        self._course_spans: Optional[dict[int, tuple[int, int, ScrollType]]] = None
+
+    def _chart_cache_path(self, diff: int) -> Path:
+        """Get the cache file for a difficulty, keyed by everything that affects note positions."""
+        key = repr((str(self.file_path.resolve()), diff, self.current_ms,
+                    self.screen_width, self.screen_height,
+                    self.initial_judge_pos_x, self.initial_judge_pos_y))
+        return CHART_CACHE_DIR / f'{hashlib.sha1(key.encode("utf-8")).hexdigest()}.pickle'
+
+    def _load_cached_chart(self, cache_path: Path):
+        """Load a previously compiled chart, or None if it is missing or stale."""
+        if not cache_path.exists():
+            return None
+        try:
+            stat = self.file_path.stat()
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to read chart cache {cache_path}: {e}")
+            return None
+        if (cached.get('version') != CHART_CACHE_VERSION or
+            cached.get('size') != stat.st_size or
+            cached.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        try:
+            # Recorded for prune_chart_cache, which deletes the least recently used charts first
+            os.utime(cache_path)
+        except OSError:
+            pass
+        logger.debug(f"Loaded {self.file_path} from chart cache")
+        return cached['chart']
+
+    def _store_cached_chart(self, cache_path: Path, chart) -> None:
+        """Write a compiled chart to the cache. Failures only cost a re-parse next time."""
+        try:
+            stat = self.file_path.stat()
+            CHART_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            temp_path = cache_path.with_suffix('.tmp')
+            with open(temp_path, 'wb') as f:
+                pickle.dump({
+                    'version': CHART_CACHE_VERSION,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'chart': chart,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"Failed to write chart cache {cache_path}: {e}")
+
+    def _read_lines(self, header_only: bool = False) -> list[str]:
+        """
+        Read the TJA file into a list of stripped lines without comments.
 
-    def get_metadata(self):
+        Args:
+            header_only (bool): Skip note data and commands, keeping only what get_metadata needs.
+        """
+        text, self.encoding = decode_file(self.file_path, self.encoding)
+        lines = text.splitlines()
+        if header_only:
+            lines = [line for line in lines
+                     if (stripped := line.lstrip()) and not stripped[0].isdigit() and stripped[0] != ','
+                     and (stripped[0] != '#' or stripped.startswith('#BRANCH'))]
+        return [cleaned for line in lines
+                if (cleaned := strip_comments(line).strip())]
+
+    @property
+    def data(self) -> list[str]:
+        """The stripped lines of the TJA file, loaded on first use for metadata only parsers."""
+        if self._data is None:
+            self._data = self._read_lines()
+        return self._data
+
+    def get_metadata(self, lines: list[str]):
         """
         Extract metadata from the TJA file.
+
+        Args:
+            lines (list[str]): The stripped lines of the TJA file.
         """
         current_diff = None  # Track which difficulty we're currently processing
 
-        for item in self.data:
+        for item in lines:
             if item.startswith('#BRANCH') and current_diff is not None:
                 self.metadata.course_data[current_diff].is_branching = True
             elif item.startswith("#") or item[0].isdigit():
@@ -545,6 +1031,47 @@ class TJAParser:
             elif '限定' in self.metadata.title[region_code]:
                 self.ex_data.limited_time = True
 
+    def get_course_spans(self) -> dict[int, tuple[int, int, ScrollType]]:
+        """
+        Find the note section of every course in a single scan of the data.
+
+        Returns:
+            dict[int, tuple[int, int, ScrollType]]: The first line after #START, the #END line
+            and the scroll type of each course, accessed by diff number.
+        """
+        if self._course_spans is not None:
+            return self._course_spans
+        diff_names = {name: diff for diff, name in self.DIFFS.items()}
+        # diff -> [note_start, note_end, scroll_type]
+        spans: dict[int, list] = {}
+        current_diff = None
+
+        for i, line in enumerate(self.data):
+            if line.startswith("COURSE:"):
+                course_value = line[7:].strip().lower()
+                current_diff = int(course_value) if course_value.isdigit() else diff_names.get(course_value)
+                continue
+            if current_diff is None:
+                continue
+            span = spans.setdefault(current_diff, [-1, -1, ScrollType.NMSCROLL])
+            if span[1] != -1:
+                continue
+            if span[0] == -1 and line in ("#START", "#START P1"):
+                span[0] = i + 1
+            elif line == "#END" and span[0] != -1:
+                span[1] = i
+            elif '#NMSCROLL' in line:
+                span[2] = ScrollType.NMSCROLL
+            elif '#BMSCROLL' in line:
+                span[2] = ScrollType.BMSCROLL
+            elif '#HBSCROLL' in line:
+                span[2] = ScrollType.HBSCROLL
+
+        self._course_spans = {diff: (note_start, note_end, scroll_type)
+                              for diff, (note_start, note_end, scroll_type) in spans.items()
+                              if note_start != -1 and note_end != -1}
+        return self._course_spans
+
     def data_to_notes(self, diff) -> list[list[str]]:
         """
         Convert the data to notes.
@@ -555,36 +1082,9 @@ class TJAParser:
         Returns:
             list[list[str]]: The notes.
         """
-        diff_name = self.DIFFS.get(diff, "").lower()
-
-        # Use enumerate for single iteration
-        note_start = note_end = -1
-        target_found = False
-        scroll_type = ScrollType.NMSCROLL
-
-        # Find the section boundaries
-        for i, line in enumerate(self.data):
-            if line.startswith("COURSE:"):
-                course_value = line[7:].strip().lower()
-                target_found = (course_value.isdigit() and int(course_value) == diff) or course_value == diff_name
-            elif target_found:
-                if note_start == -1 and line in ("#START", "#START P1"):
-                    note_start = i + 1
-                elif line == "#END" and note_start != -1:
-                    note_end = i
-                    break
-                elif '#NMSCROLL' in line:
-                    scroll_type = ScrollType.NMSCROLL
-                    continue
-                elif '#BMSCROLL' in line:
-                    scroll_type = ScrollType.BMSCROLL
-                    continue
-                elif '#HBSCROLL' in line:
-                    scroll_type = ScrollType.HBSCROLL
-                    continue
-
-        if note_start == -1 or note_end == -1:
+        if diff not in self.get_course_spans():
             return []
+        note_start, note_end, scroll_type = self._course_spans[diff]
 
         # Process the section with minimal string operations
         notes = []
@@ -687,791 +1187,552 @@ class TJAParser:
                     else:
                         play_note_list[-3].moji = 2
 
-    def apply_easing(self, t, easing_point, easing_function):
-        """Apply easing function to normalized time value t (0 to 1)"""
-        if easing_point == 'IN':
-            pass  # t stays as is
-        elif easing_point == 'OUT':
-            t = 1 - t
-        elif easing_point == 'IN_OUT':
-            if t < 0.5:
-                t = t * 2
-            else:
-                t = (1 - t) * 2
-
-        if easing_function == 'LINEAR':
-            result = t
-        elif easing_function == 'CUBIC':
-            result = t ** 3
-        elif easing_function == 'QUARTIC':
-            result = t ** 4
-        elif easing_function == 'QUINTIC':
-            result = t ** 5
-        elif easing_function == 'SINUSOIDAL':
-            import math
-            result = 1 - math.cos((t * math.pi) / 2)
-        elif easing_function == 'EXPONENTIAL':
-            result = 0 if t == 0 else 2 ** (10 * (t - 1))
-        elif easing_function == 'CIRCULAR':
-            import math
-            result = 1 - math.sqrt(1 - t ** 2)
-        else:
-            result = t
+    def notes_to_position(self, diff: int, use_cache: bool = True):
+        """Parse a TJA's notes into a NoteList.
 
-        if easing_point == 'OUT':
-            result = 1 - result
-        elif easing_point == 'IN_OUT':
-            if t >= 0.5:
-                result = 1 - result
-
-        return result
-
-    def notes_to_position(self, diff: int):
-        """Parse a TJA's notes into a NoteList."""
-        master_notes = NoteList()
-        branch_m: list[NoteList] = []
-        branch_e: list[NoteList] = []
-        branch_n: list[NoteList] = []
-        notes = self.data_to_notes(diff)
-        balloon = self.metadata.course_data[diff].balloon.copy()
-        count = 0
-        index = 0
-        sudden_appear = 0
-        sudden_moving = 0
-        judge_pos_x = 0
-        judge_pos_y = 0
-        border_color = ray.BLACK
-        cam_h_offset = 0
-        cam_v_offset = 0
-        cam_h_move_active = False
-        cam_h_move_start_ms = 0
-        cam_h_move_duration_ms = 0
-        cam_h_move_start_offset = 0
-        cam_h_move_end_offset = 0
-        cam_h_easing_point = None
-        cam_h_easing_function = None
-        cam_v_move_active = False
-        cam_v_move_start_ms = 0
-        cam_v_move_duration_ms = 0
-        cam_v_move_start_offset = 0
-        cam_v_move_end_offset = 0
-        cam_v_easing_point = None
-        cam_v_easing_function = None
-        cam_zoom_move_active = False
-        cam_zoom_move_start_ms = 0
-        cam_zoom_start = 1.0
-        cam_zoom_end = 1.0
-        cam_zoom_easing_point = ""
-        cam_zoom_easing_function = ""
-        cam_h_scale = 1.0
-        cam_h_scale_move_active = False
-        cam_h_scale_move_start_ms = 0
-        cam_h_scale_start = 1.0
-        cam_h_scale_end = 1.0
-        cam_h_scale_easing_point = ""
-        cam_h_scale_easing_function = ""
-        cam_v_scale = 1.0
-        cam_v_scale_move_active = False
-        cam_v_scale_move_start_ms = 0
-        cam_v_scale_start = 1.0
-        cam_v_scale_end = 1.0
-        cam_v_scale_easing_point = ""
-        cam_v_scale_easing_function = ""
-        cam_rotation = 0.0
-        cam_rotation_move_active = False
-        cam_rotation_move_start_ms = 0
-        cam_rotation_start = 0.0
-        cam_rotation_end = 0.0
-        cam_rotation_easing_point = ""
-        cam_rotation_easing_function = ""
-        time_signature = 4/4
-        bpm = self.metadata.bpm
-        x_scroll_modifier = 1
-        y_scroll_modifier = 0
-        barline_display = True
-        gogo_time = False
-        curr_note_list = master_notes.play_notes
-        curr_draw_list = master_notes.draw_notes
-        curr_bar_list = master_notes.bars
-        curr_timeline = master_notes.timeline
+        The compiled chart is cached on disk and reused as long as the file and screen geometry are unchanged.
+        """
+        if not use_cache:
+            return self._parse_notes(diff)
+        cache_path = self._chart_cache_path(diff)
+        cached = self._load_cached_chart(cache_path)
+        if cached is not None:
+            master_notes, branch_m, branch_e, branch_n, self.current_ms = cached
+            return master_notes, branch_m, branch_e, branch_n
+        master_notes, branch_m, branch_e, branch_n = self._parse_notes(diff)
+        self._store_cached_chart(cache_path, (master_notes, branch_m, branch_e, branch_n, self.current_ms))
+        return master_notes, branch_m, branch_e, branch_n
+
+    def parse_all_courses(self, use_cache: bool = True) -> dict[int, tuple[NoteList, list[NoteList], list[NoteList], list[NoteList]]]:
+        """Parse the notes of every course in the TJA file.
+
+        Returns:
+            dict: The result of notes_to_position for each course, accessed by diff number.
+        """
+        courses = dict()
+        for diff in self.metadata.course_data:
+            self.current_ms = self.start_delay
+            courses[diff] = self.notes_to_position(diff, use_cache=use_cache)
+        return courses
+
+    def _parse_notes(self, diff: int):
+        """Parse a TJA's notes into a NoteList, bypassing the chart cache."""
+        state = ChartState(current_ms=self.current_ms, bpm=self.metadata.bpm,
+                           balloon=self.metadata.course_data[diff].balloon.copy())
         init_bpm = TimelineObject()
-        init_bpm.hit_ms = self.current_ms
-        init_bpm.bpm = bpm
-        curr_timeline.append(init_bpm)
-        start_branch_ms = 0
-        start_branch_bpm = bpm
-        start_branch_time_sig = time_signature
-        start_branch_x_scroll = x_scroll_modifier
-        start_branch_y_scroll = y_scroll_modifier
-        start_branch_barline = barline_display
-        start_branch_gogo = gogo_time
-        branch_balloon_count = 0
-        is_branching = False
-        prev_note = None
-        is_section_start = False
-        section_bar = None
-        lyric = ""
-        scroll_type = ScrollType.NMSCROLL
-
-        # Only used during BMSCROLL or HBSCROLL
-        bpmchange_last_bpm = bpm
-        delay_current = 0
-        delay_last_note_ms = self.current_ms
-
-        # Mutates note.load_ms, note.pixels_per_frame_x, pixels_per_frame_y
-        # Depends on state variables: bpm, time_signature, x_scroll_modifier, y_scroll_modifier, judge_pos_x, judge_pos_y
-        # Depends on hit_ms!!! SET note.hit_ms FIRST!!! BEFORE calling this.
-        def attach_scroll(note):
-            # distance between note hit position (judgement circle) and note initial loading position, depends on which direction the note is coming from (scroll)
-            judge_pos_x = self.initial_judge_pos_x
-            judge_pos_y = self.initial_judge_pos_y
-            distance_x = (self.screen_width - judge_pos_x) if x_scroll_modifier >= 0 else judge_pos_x
-            distance_y = judge_pos_y if y_scroll_modifier >= 0 else (self.screen_height - judge_pos_y)
-
-            # note.pixels_per_frame_x = get_pixels_per_frame(bpm * time_signature * x_scroll_modifier, time_signature*4, distance_x)
-            # note.pixels_per_frame_y = get_pixels_per_frame(bpm * time_signature * y_scroll_modifier, time_signature*4, distance_y)
-            note.pixels_per_frame_x = get_pixels_per_frame(bpm * time_signature * x_scroll_modifier, time_signature*4, 866)
-            note.pixels_per_frame_y = get_pixels_per_frame(bpm * time_signature * y_scroll_modifier, time_signature*4, 866)
-            
-            pixels_per_ms_x = get_pixels_per_ms(note.pixels_per_frame_x)
-            pixels_per_ms_y = get_pixels_per_ms(note.pixels_per_frame_y)
-
-            if note.pixels_per_frame_x == 0:
-                if note.pixels_per_frame_y == 0:
-                    # Since both scrolls are 0, it should be loaded from the start
-                    note.load_ms = 0
-                    note.load_ms_x = note.load_ms
-                    note.load_ms_y = note.load_ms
-                else:
-                    note.load_ms_x = 0
-                    note.load_ms_y = note.hit_ms - (distance_y / abs(pixels_per_ms_y))
-                    note.load_ms = note.load_ms_y
-            else:
-                if note.pixels_per_frame_y == 0:
-                    note.load_ms_x = note.hit_ms - (distance_x / abs(pixels_per_ms_x))
-                    note.load_ms_y = 0
-                    note.load_ms = note.load_ms_x
-                else:
-                    # Use smaller load_ms between x, y directions
-                    note.load_ms_x = note.hit_ms - (distance_x / abs(pixels_per_ms_x))
-                    note.load_ms_y = note.hit_ms - (distance_y / abs(pixels_per_ms_y))
-                    note.load_ms = min(note.load_ms_x, note.load_ms_y)
+        init_bpm.hit_ms = state.current_ms
+        init_bpm.bpm = state.bpm
+        init_bpm.flags = TimelineFlag.BPM
+        state.notes.timeline.append(init_bpm)
 
-        for bar in notes:
-            bar_length = sum(len(part) for part in bar if '#' not in part)
-            barline_added = False
+        for bar in self.data_to_notes(diff):
+            state.bar_length = sum(len(part) for part in bar if '#' not in part)
+            state.barline_added = False
 
             for part in bar:
-                if part.startswith('#BORDERCOLOR'):
-                    r, g, b = part[13:].split(',')
-                    border_color = ray.Color(int(r), int(g), int(b), 255)
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.border_color = border_color
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-                if part.startswith('#CAMRESET'):
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_h_offset = 0
-                    timeline_obj.cam_v_offset = 0
-                    timeline_obj.cam_zoom = 1
-                    timeline_obj.cam_h_scale = 1
-                    timeline_obj.cam_v_scale = 1
-                    timeline_obj.cam_rotation = 0
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-
-                # Horizontal Offset Commands
-                if part.startswith('#CAMHOFFSET'):
-                    cam_h_offset = float(part[12:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_h_offset = cam_h_offset
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-                if part.startswith('#CAMHMOVESTART'):
-                    parts = part[15:].split(',')
-                    if len(parts) >= 4:
-                        cam_h_move_start_offset = float(parts[0].strip())
-                        cam_h_move_end_offset = float(parts[1].strip())
-                        cam_h_easing_point = parts[2].strip()
-                        cam_h_easing_function = parts[3].strip()
-                        cam_h_move_active = True
-                        cam_h_move_start_ms = self.current_ms
-                        cam_h_offset = cam_h_move_start_offset
-                    continue
-                if part.startswith('#CAMHMOVEEND'):
-                    if cam_h_move_active:
-                        cam_h_move_duration_ms = self.current_ms - cam_h_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_h_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_h_easing_point, cam_h_easing_function)
-                            interpolated_ms = cam_h_move_start_ms + (step * interpolation_interval_ms)
-                            interp_offset = cam_h_move_start_offset + (
-                                (cam_h_move_end_offset - cam_h_move_start_offset) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_h_offset = interp_offset
-                            curr_timeline.append(cam_timeline)
-                        cam_h_offset = cam_h_move_end_offset
-                        cam_h_move_active = False
-                    continue
-
-                # Vertical Offset Commands
-                if part.startswith('#CAMVOFFSET'):
-                    cam_v_offset = float(part[12:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_v_offset = cam_v_offset
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-                if part.startswith('#CAMVMOVESTART'):
-                    parts = part[15:].split(',')
-                    if len(parts) >= 4:
-                        cam_v_move_start_offset = float(parts[0].strip())
-                        cam_v_move_end_offset = float(parts[1].strip())
-                        cam_v_easing_point = parts[2].strip()
-                        cam_v_easing_function = parts[3].strip()
-                        cam_v_move_active = True
-                        cam_v_move_start_ms = self.current_ms
-                        cam_v_offset = cam_v_move_start_offset
-                    continue
-                if part.startswith('#CAMVMOVEEND'):
-                    if cam_v_move_active:
-                        cam_v_move_duration_ms = self.current_ms - cam_v_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_v_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_v_easing_point, cam_v_easing_function)
-                            interpolated_ms = cam_v_move_start_ms + (step * interpolation_interval_ms)
-                            interp_offset = cam_v_move_start_offset + (
-                                (cam_v_move_end_offset - cam_v_move_start_offset) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_v_offset = interp_offset
-                            curr_timeline.append(cam_timeline)
-                        cam_v_offset = cam_v_move_end_offset
-                        cam_v_move_active = False
-                    continue
-
-                # Zoom Commands
-                if part.startswith('#CAMZOOMSTART'):
-                    parts = part[14:].split(',')
-                    if len(parts) >= 4:
-                        cam_zoom_start = float(parts[0].strip())
-                        cam_zoom_end = float(parts[1].strip())
-                        cam_zoom_easing_point = parts[2].strip()
-                        cam_zoom_easing_function = parts[3].strip()
-                        cam_zoom_move_active = True
-                        cam_zoom_move_start_ms = self.current_ms
-                        cam_zoom = cam_zoom_start
-                    continue
-                if part.startswith('#CAMZOOMEND'):
-                    if cam_zoom_move_active:
-                        cam_zoom_move_duration_ms = self.current_ms - cam_zoom_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_zoom_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_zoom_easing_point, cam_zoom_easing_function)
-                            interpolated_ms = cam_zoom_move_start_ms + (step * interpolation_interval_ms)
-                            interp_zoom = cam_zoom_start + (
-                                (cam_zoom_end - cam_zoom_start) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_zoom = interp_zoom
-                            curr_timeline.append(cam_timeline)
-                        cam_zoom = cam_zoom_end
-                        cam_zoom_move_active = False
-                    continue
-                if part.startswith('#CAMZOOM'):
-                    cam_zoom = float(part[9:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_zoom = cam_zoom
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-
-                # Horizontal Scale Commands
-                if part.startswith('#CAMHSCALESTART'):
-                    parts = part[16:].split(',')
-                    if len(parts) >= 4:
-                        cam_h_scale_start = float(parts[0].strip())
-                        cam_h_scale_end = float(parts[1].strip())
-                        cam_h_scale_easing_point = parts[2].strip()
-                        cam_h_scale_easing_function = parts[3].strip()
-                        cam_h_scale_move_active = True
-                        cam_h_scale_move_start_ms = self.current_ms
-                        cam_h_scale = cam_h_scale_start
-                    continue
-                if part.startswith('#CAMHSCALEEND'):
-                    if cam_h_scale_move_active:
-                        cam_h_scale_move_duration_ms = self.current_ms - cam_h_scale_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_h_scale_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_h_scale_easing_point, cam_h_scale_easing_function)
-                            interpolated_ms = cam_h_scale_move_start_ms + (step * interpolation_interval_ms)
-                            interp_scale = cam_h_scale_start + (
-                                (cam_h_scale_end - cam_h_scale_start) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_h_scale = interp_scale
-                            curr_timeline.append(cam_timeline)
-                        cam_h_scale = cam_h_scale_end
-                        cam_h_scale_move_active = False
-                    continue
-                if part.startswith('#CAMHSCALE'):
-                    cam_h_scale = float(part[11:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_h_scale = cam_h_scale
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-
-                # Vertical Scale Commands
-                if part.startswith('#CAMVSCALESTART'):
-                    parts = part[16:].split(',')
-                    if len(parts) >= 4:
-                        cam_v_scale_start = float(parts[0].strip())
-                        cam_v_scale_end = float(parts[1].strip())
-                        cam_v_scale_easing_point = parts[2].strip()
-                        cam_v_scale_easing_function = parts[3].strip()
-                        cam_v_scale_move_active = True
-                        cam_v_scale_move_start_ms = self.current_ms
-                        cam_v_scale = cam_v_scale_start
-                    continue
-                if part.startswith('#CAMVSCALEEND'):
-                    if cam_v_scale_move_active:
-                        cam_v_scale_move_duration_ms = self.current_ms - cam_v_scale_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_v_scale_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_v_scale_easing_point, cam_v_scale_easing_function)
-                            interpolated_ms = cam_v_scale_move_start_ms + (step * interpolation_interval_ms)
-                            interp_scale = cam_v_scale_start + (
-                                (cam_v_scale_end - cam_v_scale_start) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_v_scale = interp_scale
-                            curr_timeline.append(cam_timeline)
-                        cam_v_scale = cam_v_scale_end
-                        cam_v_scale_move_active = False
-                    continue
-                if part.startswith('#CAMVSCALE'):
-                    cam_v_scale = float(part[11:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_v_scale = cam_v_scale
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-
-                # Rotation Commands
-                if part.startswith('#CAMROTATIONSTART'):
-                    parts = part[18:].split(',')
-                    if len(parts) >= 4:
-                        cam_rotation_start = float(parts[0].strip())
-                        cam_rotation_end = float(parts[1].strip())
-                        cam_rotation_easing_point = parts[2].strip()
-                        cam_rotation_easing_function = parts[3].strip()
-                        cam_rotation_move_active = True
-                        cam_rotation_move_start_ms = self.current_ms
-                        cam_rotation = cam_rotation_start
-                    continue
-                if part.startswith('#CAMROTATIONEND'):
-                    if cam_rotation_move_active:
-                        cam_rotation_move_duration_ms = self.current_ms - cam_rotation_move_start_ms
-                        interpolation_interval_ms = 8
-                        num_steps = int(cam_rotation_move_duration_ms / interpolation_interval_ms)
-                        for step in range(num_steps + 1):
-                            t = step / max(num_steps, 1)
-                            eased_t = self.apply_easing(t, cam_rotation_easing_point, cam_rotation_easing_function)
-                            interpolated_ms = cam_rotation_move_start_ms + (step * interpolation_interval_ms)
-                            interp_rotation = cam_rotation_start + (
-                                (cam_rotation_end - cam_rotation_start) * eased_t
-                            )
-                            cam_timeline = TimelineObject()
-                            cam_timeline.hit_ms = interpolated_ms
-                            cam_timeline.cam_rotation = interp_rotation
-                            curr_timeline.append(cam_timeline)
-                        cam_rotation = cam_rotation_end
-                        cam_rotation_move_active = False
-                    continue
-                if part.startswith('#CAMROTATION'):
-                    cam_rotation = float(part[13:])
-                    timeline_obj = TimelineObject()
-                    timeline_obj.hit_ms = self.current_ms
-                    timeline_obj.cam_rotation = cam_rotation
-                    bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-                if part.startswith('#SECTION'):
-                    is_section_start = True
-                    continue
-
-                if part.startswith('#BRANCHSTART'):
-                    start_branch_ms = self.current_ms
-                    start_branch_bpm = bpm
-                    start_branch_time_sig = time_signature
-                    start_branch_x_scroll = x_scroll_modifier
-                    start_branch_y_scroll = y_scroll_modifier
-                    start_branch_barline = barline_display
-                    start_branch_gogo = gogo_time
-                    branch_balloon_count = count
-                    branch_params = part[13:]
-
-                    def set_branch_params(bar_list: list[Note], branch_params: str, section_bar: Optional[Note]):
-                        if bar_list and len(bar_list) > 1:
-                            section_index = -2
-                            if section_bar and section_bar.hit_ms < self.current_ms:
-                                if section_bar in bar_list:
-                                    section_index = bar_list.index(section_bar)
-                            bar_list[section_index].branch_params = branch_params
-                        elif bar_list:
-                            section_index = -1
-                            bar_list[section_index].branch_params = branch_params
-                        elif bar_list == []:
-                            bar_line = Note()
-                            bar_line.hit_ms = self.current_ms
-                            attach_scroll(bar_line)
-                            bar_line.type = 0
-                            bar_line.display = False
-                            bar_line.gogo_time = gogo_time
-                            bar_line.branch_params = branch_params
-                            bar_list.append(bar_line)
-
-                    for bars in [curr_bar_list,
-                                    branch_m[-1].bars if branch_m else None,
-                                    branch_e[-1].bars if branch_e else None,
-                                    branch_n[-1].bars if branch_n else None]:
-                        set_branch_params(bars, branch_params, section_bar)
-                    if section_bar:
-                        section_bar = None
-                    continue
-
-                elif part.startswith('#BRANCHEND'):
-                    curr_note_list = master_notes.play_notes
-                    curr_draw_list = master_notes.draw_notes
-                    curr_bar_list = master_notes.bars
-                    curr_timeline = master_notes.timeline
-                    continue
-
-                if part == '#M':
-                    branch_m.append(NoteList())
-                    curr_note_list = branch_m[-1].play_notes
-                    curr_draw_list = branch_m[-1].draw_notes
-                    curr_bar_list = branch_m[-1].bars
-                    curr_timeline = branch_m[-1].timeline
-                    self.current_ms = start_branch_ms
-                    bpm = start_branch_bpm
-                    time_signature = start_branch_time_sig
-                    x_scroll_modifier = start_branch_x_scroll
-                    y_scroll_modifier = start_branch_y_scroll
-                    barline_display = start_branch_barline
-                    gogo_time = start_branch_gogo
-                    count = branch_balloon_count
-                    is_branching = True
-                    continue
-                elif part == '#E':
-                    branch_e.append(NoteList())
-                    curr_note_list = branch_e[-1].play_notes
-                    curr_draw_list = branch_e[-1].draw_notes
-                    curr_bar_list = branch_e[-1].bars
-                    curr_timeline = branch_e[-1].timeline
-                    self.current_ms = start_branch_ms
-                    bpm = start_branch_bpm
-                    time_signature = start_branch_time_sig
-                    x_scroll_modifier = start_branch_x_scroll
-                    y_scroll_modifier = start_branch_y_scroll
-                    barline_display = start_branch_barline
-                    gogo_time = start_branch_gogo
-                    count = branch_balloon_count
-                    is_branching = True
-                    continue
-                elif part == '#N':
-                    branch_n.append(NoteList())
-                    curr_note_list = branch_n[-1].play_notes
-                    curr_draw_list = branch_n[-1].draw_notes
-                    curr_bar_list = branch_n[-1].bars
-                    curr_timeline = branch_n[-1].timeline
-                    self.current_ms = start_branch_ms
-                    bpm = start_branch_bpm
-                    time_signature = start_branch_time_sig
-                    x_scroll_modifier = start_branch_x_scroll
-                    y_scroll_modifier = start_branch_y_scroll
-                    barline_display = start_branch_barline
-                    gogo_time = start_branch_gogo
-                    count = branch_balloon_count
-                    is_branching = True
-                    continue
-
-                if '#LYRIC' in part:
-                    lyric = part[6:]
-                    continue
-
-                if '#JPOSSCROLL' in part:
-                    parts = part.split()
-                    if len(parts) >= 4:
-                        duration_ms = float(parts[1]) * 1000
-                        distance_str = parts[2]
-                        direction = int(parts[3])
-                        delta_x = 0
-                        delta_y = 0
-                        if 'i' in distance_str:
-                            normalized = distance_str.replace('.i', 'j').replace('i', 'j')
-                            normalized = normalized.replace(',', '')
-                            c = complex(normalized)
-                            delta_x = c.real
-                            delta_y = c.imag
-                        else:
-                            distance = float(distance_str)
-                            delta_x = distance
-                            delta_y = 0
-                        if direction == 0:
-                            delta_x = -delta_x
-                            delta_y = -delta_y
-
-                        for obj in reversed(curr_timeline):
-                            if hasattr(obj, 'delta_x') and hasattr(obj, 'delta_y'):
-                                if obj.hit_ms > self.current_ms:
-                                    available_time = self.current_ms - obj.load_ms
-                                    total_duration = obj.hit_ms - obj.load_ms
-                                    ratio = min(1.0, available_time / total_duration) if total_duration > 0 else 1.0
-                                    obj.delta_x *= ratio
-                                    obj.delta_y *= ratio
-                                    obj.hit_ms = self.current_ms
-                                    break
-
-                        jpos_scroll = TimelineObject()
-                        jpos_scroll.load_ms = self.current_ms
-                        jpos_scroll.hit_ms = self.current_ms + duration_ms
-                        jpos_scroll.judge_pos_x = judge_pos_x
-                        jpos_scroll.judge_pos_y = judge_pos_y
-                        jpos_scroll.delta_x = delta_x
-                        jpos_scroll.delta_y = delta_y
-                        curr_timeline.append(jpos_scroll)
-
-                        judge_pos_x += delta_x
-                        judge_pos_y += delta_y
-                    continue
-                elif '#NMSCROLL' in part:
-                    scroll_type = ScrollType.NMSCROLL
-                    continue
-                elif '#BMSCROLL' in part:
-                    scroll_type = ScrollType.BMSCROLL
-                    continue
-                elif '#HBSCROLL' in part:
-                    scroll_type = ScrollType.HBSCROLL
-                    continue
-                elif '#MEASURE' in part:
-                    divisor = part.find('/')
-                    time_signature = float(part[9:divisor]) / float(part[divisor+1:])
-                    continue
-                elif '#SCROLL' in part:
-                    if scroll_type != ScrollType.BMSCROLL:
-                        scroll_value = part[7:]
-                        if 'i' in scroll_value:
-                            # TODO: rewrite with more lenient parser
-                            normalized = scroll_value.replace('.i', 'j').replace('i', 'j')
-                            normalized = normalized.replace(',', '')
-                            c = complex(normalized)
-                            x_scroll_modifier = c.real
-                            y_scroll_modifier = c.imag
-                        elif ',' in scroll_value:
-                            # Polar scroll
-                            # (r),(div),(n)
-                            args = scroll_value.split(',')
-                            radius = float(args[0])
-                            theta = math.radians(float(args[2]) / float(args[1]) * 360)
-                            x_scroll_modifier = -radius*math.cos(theta)
-                            y_scroll_modifier = radius*math.sin(theta)
-                        else:
-                            x_scroll_modifier = float(scroll_value)
-                            y_scroll_modifier = 0.0
-                    continue
-                elif '#BPMCHANGE' in part:
-                    parsed_bpm = float(part[11:])
-                    if scroll_type == ScrollType.BMSCROLL or scroll_type == ScrollType.HBSCROLL:
-                        # Do not modify bpm, it needs to be changed live by bpmchange
-                        bpmchange = parsed_bpm / bpmchange_last_bpm
-                        bpmchange_last_bpm = parsed_bpm
-
-                        bpmchange_timeline = TimelineObject()
-                        bpmchange_timeline.hit_ms = self.current_ms
-                        bpmchange_timeline.bpmchange = bpmchange
-                        bisect.insort(curr_timeline, bpmchange_timeline, key=lambda x: x.hit_ms)
-                    else:
-                        timeline_obj = TimelineObject()
-                        timeline_obj.hit_ms = self.current_ms
-                        timeline_obj.bpm = parsed_bpm
-                        bpm = parsed_bpm
-                        bisect.insort(curr_timeline, timeline_obj, key=lambda x: x.hit_ms)
-                    continue
-                elif '#BARLINEOFF' in part:
-                    barline_display = False
-                    continue
-                elif '#BARLINEON' in part:
-                    barline_display = True
-                    continue
-                elif '#GOGOSTART' in part:
-                    gogo_time = True
-                    continue
-                elif '#GOGOEND' in part:
-                    gogo_time = False
-                    continue
-                elif part.startswith("#DELAY"):
-                    delay_ms = float(part[6:]) * 1000
-                    if scroll_type == ScrollType.BMSCROLL or scroll_type == ScrollType.HBSCROLL:
-                        if delay_ms <= 0:
-                            # No changes if not positive
-                            pass
-                        else:
-                            # Do not modify current_ms, it will be modified live
-                            delay_current += delay_ms
-
-                            # Delays will be combined between notes, and attached to previous note
-                    else:
-                        self.current_ms += delay_ms
-                    continue
-                elif part.startswith("#SUDDEN"):
-                    parts = part.split()
-                    if len(parts) >= 3:
-                        appear_duration = float(parts[1])
-                        moving_duration = float(parts[2])
-
-                        sudden_appear = appear_duration * 1000
-                        sudden_moving = moving_duration * 1000
-
-                        if sudden_appear == 0:
-                            sudden_appear = float('inf')
-                        if sudden_moving == 0:
-                            sudden_moving = float('inf')
-                    continue
-                elif len(part) > 0 and not part[0].isdigit():
-                    logger.warning(f"Unrecognized command: {part} in TJA {self.file_path}")
-                    continue
-
-                ms_per_measure = get_ms_per_measure(bpm, time_signature)
-                bar_line = Note()
-                bar_line.hit_ms = self.current_ms
-                attach_scroll(bar_line)
-                bar_line.type = 0
-                bar_line.display = barline_display
-                bar_line.gogo_time = gogo_time
-                if barline_added:
-                    bar_line.display = False
-
-                if is_branching:
-                    bar_line.is_branch_start = True
-                    is_branching = False
-
-                if is_section_start:
-                    section_bar = bar_line
-                    is_section_start = False
-
-                bisect.insort(curr_bar_list, bar_line, key=lambda x: x.load_ms)
-                barline_added = True
-
-                if len(part) == 0:
-                    self.current_ms += ms_per_measure
-                    increment = 0
-                else:
-                    increment = ms_per_measure / bar_length
+                command, args = tokenize_part(part)
+                self.COMMAND_HANDLERS[command](self, state, command, args)
 
-                for item in part:
-                    if item == '.':
-                        continue
-                    if item == '0' or (not item.isdigit()):
-                        delay_last_note_ms = self.current_ms
-                        self.current_ms += increment
-                        continue
-                    if item == '9' and curr_note_list and curr_note_list[-1].type == 9:
-                        delay_last_note_ms = self.current_ms
-                        self.current_ms += increment
-                        continue
+        for notes in [state.master_notes, *state.branch_m, *state.branch_e, *state.branch_n]:
+            self._sort_notes(notes)
+        self.current_ms = state.current_ms
+        return state.master_notes, state.branch_m, state.branch_e, state.branch_n
 
-                    if delay_current != 0:
-                        # logger.debug(delay_current)
-                        delay_timeline = TimelineObject()
-                        delay_timeline.hit_ms = delay_last_note_ms
-                        delay_timeline.delay = delay_current
-                        bisect.insort(curr_timeline, delay_timeline, key=lambda x: x.hit_ms)
-
-                        delay_current = 0
-
-
-                    note = Note()
-                    delay_last_note_ms = self.current_ms
-                    note.hit_ms = self.current_ms
-                    note.display = True
-                    attach_scroll(note)
-                    note.type = int(item)
-                    note.index = index
-                    note.gogo_time = gogo_time
-                    note.moji = -1
-                    note.lyric = lyric
-
-                    if sudden_appear > 0 or sudden_moving > 0:
-                        note.sudden_appear_ms = sudden_appear
-                        note.sudden_moving_ms = sudden_moving
-
-                    if item in {'5', '6'}:
-                        note = Drumroll(note)
-                        note.color = 255
-                    elif item in {'7', '9'}:
-                        count += 1
-                        if balloon is None:
-                            raise Exception("Balloon note found, but no count was specified")
-                        if item == '9':
-                            note = Balloon(note, is_kusudama=True)
-                        else:
-                            note = Balloon(note)
-                        note.count = 1 if not balloon else balloon.pop(0)
-                    elif item == '8':
-                        if prev_note is None:
-                            raise ValueError("No previous note found")
-                        # Allows complex scroll
-
-                    self.current_ms += increment
-                    curr_note_list.append(note)
-                    bisect.insort(curr_draw_list, note, key=lambda x: x.load_ms)
-                    self.get_moji(curr_note_list, ms_per_measure)
-                    index += 1
-                    prev_note = note
+    def _sort_notes(self, notes: NoteList):
+        """Sort the draw notes and bars of a NoteList by load_ms.
 
-        return master_notes, branch_m, branch_e, branch_n
+        Notes are appended in source order while parsing, a stable sort gives the same order as inserting each one in place.
+        """
+        notes.draw_notes.sort(key=attrgetter('load_ms'))
+        notes.bars.sort(key=attrgetter('load_ms'))
+
+    def _get_scroll(self, state: ChartState) -> tuple[float, float, float, float]:
+        """Get the pixels per frame and load distance (in ms) of notes placed with the current scroll state.
 
-    def hash_note_data(self, notes: NoteList):
-        """Hashes the note data for the given NoteList."""
-        n = hashlib.sha256()
-        list1 = notes.play_notes
-        list2 = notes.bars
-        merged: list[Note | Drumroll | Balloon] = []
-        i = 0
-        j = 0
-        while i < len(list1) and j < len(list2):
-            if list1[i] <= list2[j]:
-                merged.append(list1[i])
-                i += 1
+        Returns:
+            tuple[float, float, float, float]: pixels_per_frame_x, pixels_per_frame_y, load_offset_x, load_offset_y
+        """
+        # distance between note hit position (judgement circle) and note initial loading position, depends on which direction the note is coming from (scroll)
+        judge_pos_x = self.initial_judge_pos_x
+        judge_pos_y = self.initial_judge_pos_y
+        distance_x = (self.screen_width - judge_pos_x) if state.x_scroll_modifier >= 0 else judge_pos_x
+        distance_y = judge_pos_y if state.y_scroll_modifier >= 0 else (self.screen_height - judge_pos_y)
+
+        # pixels_per_frame_x = get_pixels_per_frame(bpm * time_signature * x_scroll_modifier, time_signature*4, distance_x)
+        # pixels_per_frame_y = get_pixels_per_frame(bpm * time_signature * y_scroll_modifier, time_signature*4, distance_y)
+        pixels_per_frame_x = get_pixels_per_frame(state.bpm * state.time_signature * state.x_scroll_modifier, state.time_signature*4, 866)
+        pixels_per_frame_y = get_pixels_per_frame(state.bpm * state.time_signature * state.y_scroll_modifier, state.time_signature*4, 866)
+
+        pixels_per_ms_x = get_pixels_per_ms(pixels_per_frame_x)
+        pixels_per_ms_y = get_pixels_per_ms(pixels_per_frame_y)
+        load_offset_x = distance_x / abs(pixels_per_ms_x) if pixels_per_frame_x != 0 else 0
+        load_offset_y = distance_y / abs(pixels_per_ms_y) if pixels_per_frame_y != 0 else 0
+        return pixels_per_frame_x, pixels_per_frame_y, load_offset_x, load_offset_y
+
+    def _attach_scroll(self, note: Note, scroll: tuple[float, float, float, float]):
+        """Set note.load_ms, note.pixels_per_frame_x and note.pixels_per_frame_y from the result of _get_scroll.
+
+        Depends on hit_ms!!! SET note.hit_ms FIRST!!! BEFORE calling this.
+        """
+        pixels_per_frame_x, pixels_per_frame_y, load_offset_x, load_offset_y = scroll
+        note.pixels_per_frame_x = pixels_per_frame_x
+        note.pixels_per_frame_y = pixels_per_frame_y
+
+        if pixels_per_frame_x == 0:
+            if pixels_per_frame_y == 0:
+                # Since both scrolls are 0, it should be loaded from the start
+                note.load_ms = 0
+                note.load_ms_x = note.load_ms
+                note.load_ms_y = note.load_ms
+            else:
+                note.load_ms_x = 0
+                note.load_ms_y = note.hit_ms - load_offset_y
+                note.load_ms = note.load_ms_y
+        else:
+            if pixels_per_frame_y == 0:
+                note.load_ms_x = note.hit_ms - load_offset_x
+                note.load_ms_y = 0
+                note.load_ms = note.load_ms_x
             else:
-                merged.append(list2[j])
-                j += 1
-        merged.extend(list1[i:])
-        merged.extend(list2[j:])
-        for item in merged:
-            n.update(item.get_hash().encode('utf-8'))
-
-        return n.hexdigest()
+                # Use smaller load_ms between x, y directions
+                note.load_ms_x = note.hit_ms - load_offset_x
+                note.load_ms_y = note.hit_ms - load_offset_y
+                note.load_ms = min(note.load_ms_x, note.load_ms_y)
+
+    def _add_timeline_object(self, state: ChartState, timeline_obj: TimelineObject):
+        timeline = state.notes.timeline
+        # Commands almost always come in time order, only search when the object belongs earlier
+        if not timeline or timeline[-1].hit_ms <= timeline_obj.hit_ms:
+            timeline.append(timeline_obj)
+        else:
+            bisect.insort(timeline, timeline_obj, key=attrgetter('hit_ms'))
+
+    def _handle_bordercolor(self, state: ChartState, command: ChartCommand, args: str):
+        r, g, b = args.split(',')
+        state.border_color = ray.Color(int(r), int(g), int(b), 255)
+        timeline_obj = TimelineObject()
+        timeline_obj.hit_ms = state.current_ms
+        timeline_obj.border_color = state.border_color
+        timeline_obj.flags = TimelineFlag.BORDER_COLOR
+        self._add_timeline_object(state, timeline_obj)
+
+    def _handle_camreset(self, state: ChartState, command: ChartCommand, args: str):
+        timeline_obj = TimelineObject()
+        timeline_obj.hit_ms = state.current_ms
+        timeline_obj.cam_h_offset = 0
+        timeline_obj.cam_v_offset = 0
+        timeline_obj.cam_zoom = 1
+        timeline_obj.cam_h_scale = 1
+        timeline_obj.cam_v_scale = 1
+        timeline_obj.cam_rotation = 0
+        timeline_obj.flags = (TimelineFlag.CAM_H_OFFSET | TimelineFlag.CAM_V_OFFSET | TimelineFlag.CAM_ZOOM |
+                              TimelineFlag.CAM_H_SCALE | TimelineFlag.CAM_V_SCALE | TimelineFlag.CAM_ROTATION)
+        self._add_timeline_object(state, timeline_obj)
+
+    def _handle_camera_set(self, state: ChartState, command: ChartCommand, args: str):
+        attribute = CAMERA_SETS[command]
+        state.camera[attribute] = float(args)
+        timeline_obj = TimelineObject()
+        timeline_obj.hit_ms = state.current_ms
+        setattr(timeline_obj, attribute, state.camera[attribute])
+        timeline_obj.flags = CAMERA_FLAGS[attribute]
+        self._add_timeline_object(state, timeline_obj)
+
+    def _handle_camera_move_start(self, state: ChartState, command: ChartCommand, args: str):
+        attribute = CAMERA_MOVES[command]
+        parts = args.split(',')
+        if len(parts) >= 4:
+            move = CameraMove(attribute=attribute,
+                              start_ms=state.current_ms,
+                              start_value=float(parts[0].strip()),
+                              end_value=float(parts[1].strip()),
+                              easing_point=parts[2].strip(),
+                              easing_function=parts[3].strip())
+            state.camera_moves[attribute] = move
+            state.camera[attribute] = move.start_value
+
+    def _handle_camera_move_end(self, state: ChartState, command: ChartCommand, args: str):
+        attribute = CAMERA_MOVES[command]
+        move = state.camera_moves.pop(attribute, None)
+        if move is None:
+            return
+        move.end_ms = state.current_ms
+        state.notes.camera_moves.append(move)
+        state.camera[attribute] = move.end_value
+
+    def _handle_section(self, state: ChartState, command: ChartCommand, args: str):
+        state.is_section_start = True
+
+    def _set_branch_params(self, state: ChartState, bar_list: Optional[list[Note]], branch_params: str):
+        if bar_list and len(bar_list) > 1:
+            section_index = -2
+            if state.section_bar and state.section_bar.hit_ms < state.current_ms:
+                if state.section_bar in bar_list:
+                    section_index = bar_list.index(state.section_bar)
+            bar_list[section_index].branch_params = branch_params
+            bar_list[section_index].flags |= NoteFlag.BRANCH_PARAMS
+        elif bar_list:
+            section_index = -1
+            bar_list[section_index].branch_params = branch_params
+            bar_list[section_index].flags |= NoteFlag.BRANCH_PARAMS
+        elif bar_list == []:
+            bar_line = Note()
+            bar_line.hit_ms = state.current_ms
+            self._attach_scroll(bar_line, self._get_scroll(state))
+            bar_line.type = 0
+            bar_line.display = False
+            bar_line.gogo_time = state.gogo_time
+            bar_line.branch_params = branch_params
+            bar_line.flags = NoteFlag.BRANCH_PARAMS
+            bar_list.append(bar_line)
+
+    def _handle_branchstart(self, state: ChartState, command: ChartCommand, args: str):
+        state.start_branch_ms = state.current_ms
+        state.start_branch_bpm = state.bpm
+        state.start_branch_time_sig = state.time_signature
+        state.start_branch_x_scroll = state.x_scroll_modifier
+        state.start_branch_y_scroll = state.y_scroll_modifier
+        state.start_branch_barline = state.barline_display
+        state.start_branch_gogo = state.gogo_time
+        state.branch_balloon_count = state.count
+
+        # Branch parameters go on the latest bars by load_ms
+        for notes in [state.notes,
+                      state.branch_m[-1] if state.branch_m else None,
+                      state.branch_e[-1] if state.branch_e else None,
+                      state.branch_n[-1] if state.branch_n else None]:
+            if notes is not None:
+                self._sort_notes(notes)
+        for bars in [state.notes.bars,
+                     state.branch_m[-1].bars if state.branch_m else None,
+                     state.branch_e[-1].bars if state.branch_e else None,
+                     state.branch_n[-1].bars if state.branch_n else None]:
+            self._set_branch_params(state, bars, args)
+        state.section_bar = None
+
+    def _handle_branchend(self, state: ChartState, command: ChartCommand, args: str):
+        state.notes = state.master_notes
+
+    def _handle_branch(self, state: ChartState, command: ChartCommand, args: str):
+        if command == ChartCommand.BRANCH_M:
+            branch = state.branch_m
+        elif command == ChartCommand.BRANCH_E:
+            branch = state.branch_e
+        else:
+            branch = state.branch_n
+        branch.append(NoteList())
+        state.notes = branch[-1]
+        state.current_ms = state.start_branch_ms
+        state.bpm = state.start_branch_bpm
+        state.time_signature = state.start_branch_time_sig
+        state.x_scroll_modifier = state.start_branch_x_scroll
+        state.y_scroll_modifier = state.start_branch_y_scroll
+        state.barline_display = state.start_branch_barline
+        state.gogo_time = state.start_branch_gogo
+        state.count = state.branch_balloon_count
+        state.is_branching = True
+
+    def _handle_lyric(self, state: ChartState, command: ChartCommand, args: str):
+        state.lyric = args
+
+    def _handle_jposscroll(self, state: ChartState, command: ChartCommand, args: str):
+        parts = args.split()
+        if len(parts) < 4:
+            return
+        duration_ms = float(parts[1]) * 1000
+        distance_str = parts[2]
+        direction = int(parts[3])
+        delta_x = 0
+        delta_y = 0
+        if 'i' in distance_str:
+            normalized = distance_str.replace('.i', 'j').replace('i', 'j')
+            normalized = normalized.replace(',', '')
+            c = complex(normalized)
+            delta_x = c.real
+            delta_y = c.imag
+        else:
+            distance = float(distance_str)
+            delta_x = distance
+            delta_y = 0
+        if direction == 0:
+            delta_x = -delta_x
+            delta_y = -delta_y
+
+        for obj in reversed(state.notes.timeline):
+            if obj.flags & TimelineFlag.JPOSSCROLL:
+                if obj.hit_ms > state.current_ms:
+                    available_time = state.current_ms - obj.load_ms
+                    total_duration = obj.hit_ms - obj.load_ms
+                    ratio = min(1.0, available_time / total_duration) if total_duration > 0 else 1.0
+                    obj.delta_x *= ratio
+                    obj.delta_y *= ratio
+                    obj.hit_ms = state.current_ms
+                    break
+
+        jpos_scroll = TimelineObject()
+        jpos_scroll.load_ms = state.current_ms
+        jpos_scroll.hit_ms = state.current_ms + duration_ms
+        jpos_scroll.judge_pos_x = state.judge_pos_x
+        jpos_scroll.judge_pos_y = state.judge_pos_y
+        jpos_scroll.delta_x = delta_x
+        jpos_scroll.delta_y = delta_y
+        jpos_scroll.flags = TimelineFlag.JPOSSCROLL
+        state.notes.timeline.append(jpos_scroll)
+
+        state.judge_pos_x += delta_x
+        state.judge_pos_y += delta_y
+
+    def _handle_measure(self, state: ChartState, command: ChartCommand, args: str):
+        divisor = args.find('/')
+        state.time_signature = float(args[9:divisor]) / float(args[divisor+1:])
+
+    def _handle_scroll(self, state: ChartState, command: ChartCommand, args: str):
+        if state.scroll_type == ScrollType.BMSCROLL:
+            return
+        if 'i' in args:
+            # TODO: rewrite with more lenient parser
+            normalized = args.replace('.i', 'j').replace('i', 'j')
+            normalized = normalized.replace(',', '')
+            c = complex(normalized)
+            state.x_scroll_modifier = c.real
+            state.y_scroll_modifier = c.imag
+        elif ',' in args:
+            # Polar scroll
+            # (r),(div),(n)
+            polar = args.split(',')
+            radius = float(polar[0])
+            theta = math.radians(float(polar[2]) / float(polar[1]) * 360)
+            state.x_scroll_modifier = -radius*math.cos(theta)
+            state.y_scroll_modifier = radius*math.sin(theta)
+        else:
+            state.x_scroll_modifier = float(args)
+            state.y_scroll_modifier = 0.0
+
+    def _handle_bpmchange(self, state: ChartState, command: ChartCommand, args: str):
+        parsed_bpm = float(args)
+        if state.scroll_type == ScrollType.BMSCROLL or state.scroll_type == ScrollType.HBSCROLL:
+            # Do not modify bpm, it needs to be changed live by bpmchange
+            bpmchange = parsed_bpm / state.bpmchange_last_bpm
+            state.bpmchange_last_bpm = parsed_bpm
+
+            bpmchange_timeline = TimelineObject()
+            bpmchange_timeline.hit_ms = state.current_ms
+            bpmchange_timeline.bpmchange = bpmchange
+            bpmchange_timeline.flags = TimelineFlag.BPMCHANGE
+            self._add_timeline_object(state, bpmchange_timeline)
+        else:
+            timeline_obj = TimelineObject()
+            timeline_obj.hit_ms = state.current_ms
+            timeline_obj.bpm = parsed_bpm
+            timeline_obj.flags = TimelineFlag.BPM
+            state.bpm = parsed_bpm
+            self._add_timeline_object(state, timeline_obj)
+
+    def _handle_delay(self, state: ChartState, command: ChartCommand, args: str):
+        delay_ms = float(args) * 1000
+        if state.scroll_type == ScrollType.BMSCROLL or state.scroll_type == ScrollType.HBSCROLL:
+            # Do not modify current_ms, it will be modified live
+            # Delays will be combined between notes, and attached to previous note
+            if delay_ms > 0:
+                state.delay_current += delay_ms
+        else:
+            state.current_ms += delay_ms
+
+    def _handle_sudden(self, state: ChartState, command: ChartCommand, args: str):
+        parts = args.split()
+        if len(parts) < 3:
+            return
+        appear_duration = float(parts[1])
+        moving_duration = float(parts[2])
+
+        state.sudden_appear = appear_duration * 1000
+        state.sudden_moving = moving_duration * 1000
+
+        if state.sudden_appear == 0:
+            state.sudden_appear = float('inf')
+        if state.sudden_moving == 0:
+            state.sudden_moving = float('inf')
+
+    def _handle_unknown(self, state: ChartState, command: ChartCommand, args: str):
+        logger.warning(f"Unrecognized command: {args} in TJA {self.file_path}")
+
+    def _handle_notes(self, state: ChartState, command: ChartCommand, part: str):
+        ms_per_measure = get_ms_per_measure(state.bpm, state.time_signature)
+        # Scroll state can't change in the middle of a line of notes
+        scroll = self._get_scroll(state)
+        bar_line = Note()
+        bar_line.hit_ms = state.current_ms
+        self._attach_scroll(bar_line, scroll)
+        bar_line.type = 0
+        bar_line.display = state.barline_display
+        bar_line.gogo_time = state.gogo_time
+        if state.barline_added:
+            bar_line.display = False
+
+        if state.is_branching:
+            bar_line.flags |= NoteFlag.BRANCH_START
+            state.is_branching = False
+
+        if state.is_section_start:
+            state.section_bar = bar_line
+            state.is_section_start = False
+
+        state.notes.bars.append(bar_line)
+        state.barline_added = True
+
+        if len(part) == 0:
+            state.current_ms += ms_per_measure
+            increment = 0
+        else:
+            increment = ms_per_measure / state.bar_length
+
+        play_notes = state.notes.play_notes
+        draw_notes = state.notes.draw_notes
+        current_ms = state.current_ms
+        delay_last_note_ms = state.delay_last_note_ms
+        for item in part:
+            if item == '.':
+                continue
+            if item == '0' or (not item.isdigit()):
+                delay_last_note_ms = current_ms
+                current_ms += increment
+                continue
+            if item == '9' and play_notes and play_notes[-1].type == 9:
+                delay_last_note_ms = current_ms
+                current_ms += increment
+                continue
+
+            if state.delay_current != 0:
+                delay_timeline = TimelineObject()
+                delay_timeline.hit_ms = delay_last_note_ms
+                delay_timeline.delay = state.delay_current
+                delay_timeline.flags = TimelineFlag.DELAY
+                self._add_timeline_object(state, delay_timeline)
+
+                state.delay_current = 0
+
+            note = Note()
+            delay_last_note_ms = current_ms
+            note.hit_ms = current_ms
+            note.display = True
+            self._attach_scroll(note, scroll)
+            note.type = int(item)
+            note.index = state.index
+            note.gogo_time = state.gogo_time
+            note.moji = -1
+            note.lyric = state.lyric
+
+            if state.sudden_appear > 0 or state.sudden_moving > 0:
+                note.sudden_appear_ms = state.sudden_appear
+                note.sudden_moving_ms = state.sudden_moving
+                note.flags |= NoteFlag.SUDDEN
+
+            if item in {'5', '6'}:
+                note = Drumroll(note)
+                note.color = 255
+            elif item in {'7', '9'}:
+                state.count += 1
+                if state.balloon is None:
+                    raise Exception("Balloon note found, but no count was specified")
+                if item == '9':
+                    note = Balloon(note, is_kusudama=True)
+                else:
+                    note = Balloon(note)
+                note.count = 1 if not state.balloon else state.balloon.pop(0)
+            elif item == '8':
+                if state.prev_note is None:
+                    raise ValueError("No previous note found")
+                # Allows complex scroll
+
+            current_ms += increment
+            play_notes.append(note)
+            draw_notes.append(note)
+            self.get_moji(play_notes, ms_per_measure)
+            state.index += 1
+            state.prev_note = note
+        state.current_ms = current_ms
+        state.delay_last_note_ms = delay_last_note_ms
+
+    def _handle_scroll_type(self, state: ChartState, command: ChartCommand, args: str):
+        state.scroll_type = ScrollType[command.name]
+
+    def _handle_barline(self, state: ChartState, command: ChartCommand, args: str):
+        state.barline_display = command == ChartCommand.BARLINEON
+
+    def _handle_gogo(self, state: ChartState, command: ChartCommand, args: str):
+        state.gogo_time = command == ChartCommand.GOGOSTART
+
+    COMMAND_HANDLERS = {
+        ChartCommand.NOTES: _handle_notes,
+        ChartCommand.UNKNOWN: _handle_unknown,
+        ChartCommand.BORDERCOLOR: _handle_bordercolor,
+        ChartCommand.CAMRESET: _handle_camreset,
+        ChartCommand.CAMHOFFSET: _handle_camera_set,
+        ChartCommand.CAMHMOVESTART: _handle_camera_move_start,
+        ChartCommand.CAMHMOVEEND: _handle_camera_move_end,
+        ChartCommand.CAMVOFFSET: _handle_camera_set,
+        ChartCommand.CAMVMOVESTART: _handle_camera_move_start,
+        ChartCommand.CAMVMOVEEND: _handle_camera_move_end,
+        ChartCommand.CAMZOOMSTART: _handle_camera_move_start,
+        ChartCommand.CAMZOOMEND: _handle_camera_move_end,
+        ChartCommand.CAMZOOM: _handle_camera_set,
+        ChartCommand.CAMHSCALESTART: _handle_camera_move_start,
+        ChartCommand.CAMHSCALEEND: _handle_camera_move_end,
+        ChartCommand.CAMHSCALE: _handle_camera_set,
+        ChartCommand.CAMVSCALESTART: _handle_camera_move_start,
+        ChartCommand.CAMVSCALEEND: _handle_camera_move_end,
+        ChartCommand.CAMVSCALE: _handle_camera_set,
+        ChartCommand.CAMROTATIONSTART: _handle_camera_move_start,
+        ChartCommand.CAMROTATIONEND: _handle_camera_move_end,
+        ChartCommand.CAMROTATION: _handle_camera_set,
+        ChartCommand.SECTION: _handle_section,
+        ChartCommand.BRANCHSTART: _handle_branchstart,
+        ChartCommand.BRANCHEND: _handle_branchend,
+        ChartCommand.BRANCH_M: _handle_branch,
+        ChartCommand.BRANCH_E: _handle_branch,
+        ChartCommand.BRANCH_N: _handle_branch,
+        ChartCommand.LYRIC: _handle_lyric,
+        ChartCommand.JPOSSCROLL: _handle_jposscroll,
+        ChartCommand.NMSCROLL: _handle_scroll_type,
+        ChartCommand.BMSCROLL: _handle_scroll_type,
+        ChartCommand.HBSCROLL: _handle_scroll_type,
+        ChartCommand.MEASURE: _handle_measure,
+        ChartCommand.SCROLL: _handle_scroll,
+        ChartCommand.BPMCHANGE: _handle_bpmchange,
+        ChartCommand.BARLINEOFF: _handle_barline,
+        ChartCommand.BARLINEON: _handle_barline,
+        ChartCommand.GOGOSTART: _handle_gogo,
+        ChartCommand.GOGOEND: _handle_gogo,
+        ChartCommand.DELAY: _handle_delay,
+        ChartCommand.SUDDEN: _handle_sudden,
+    }
+
+    def hash_note_data(self, notes: NoteList, compat: bool = True) -> str:
+        """Hashes the note data for the given NoteList.
+
+        Args:
+            notes (NoteList): The notes to hash, play notes and bars are merged by hit_ms.
+            compat (bool): Produce the digests song and score keys have always used (one sha256 per note).
+                Otherwise every note is packed into one binary buffer and hashed in a single call,
+                which is much faster but gives different digests.
+
+        Returns:
+            str: The hex digest.
+        """
+        # Two-way merge, ties go to the play note
+        merged = list(heapq.merge(notes.play_notes, notes.bars, key=attrgetter('hit_ms')))
+        if compat:
+            sha256 = hashlib.sha256
+            digests = ''.join([sha256(note._get_hash_data()).hexdigest() for note in merged])
+            return sha256(digests.encode('utf-8')).hexdigest()
+        columns = (
+            array('q', [note.type for note in merged]),
+            array('d', [note.hit_ms for note in merged]),
+            array('d', [note.load_ms for note in merged]),
+            array('q', [note.count if isinstance(note, Balloon) else 0 for note in merged]),
+            array('B', [HASH_CLASS_IDS[type(note)] for note in merged]),
+        )
+        return hashlib.sha256(b''.join(column.tobytes() for column in columns)).hexdigest()
 
 # TODO: fix, it wouldn't work with BPMCHANGE or DELAY for BMS/HBSCROLL, too naive approach
 def modifier_speed(notes: NoteList, value: float):
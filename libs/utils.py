@@ -1,5 +1,6 @@
 import ctypes
 import hashlib
+import json
 import sys
 import logging
 import time
@@ -144,6 +145,97 @@ if not Path('cache/image').exists():
 for file in Path('cache/image').iterdir():
     text_cache.add(file.stem)
 
+FONT_PATH = Path('Graphics/Modified-DFPKanteiryu-XB.ttf')
+FONT_CACHE_DIR = Path('cache/fonts')
+FONT_GLYPH_PADDING = 4
+
+def _font_from_atlas(atlas: ray.Image, font_size: int, glyphs: list[list[int]], recs: list[list[float]]) -> ray.Font:
+    """Assemble a font from a glyph atlas, the same way raylib's LoadFontEx does."""
+    glyph_count = len(glyphs)
+    # Allocated by raylib so unload_font can free them
+    glyph_array = rl.ffi.cast('GlyphInfo *', rl.MemAlloc(glyph_count * rl.ffi.sizeof('GlyphInfo')))
+    rec_array = rl.ffi.cast('Rectangle *', rl.MemAlloc(glyph_count * rl.ffi.sizeof('Rectangle')))
+    for i, ((value, offset_x, offset_y, advance_x), (x, y, width, height)) in enumerate(zip(glyphs, recs)):
+        rec_array[i] = (x, y, width, height)
+        glyph_array[i].value = value
+        glyph_array[i].offsetX = offset_x
+        glyph_array[i].offsetY = offset_y
+        glyph_array[i].advanceX = advance_x
+        glyph_array[i].image = rl.ImageFromImage(atlas, rec_array[i])
+    texture = rl.LoadTextureFromImage(atlas)
+    return ray.Font(font_size, glyph_count, FONT_GLYPH_PADDING, texture, rec_array, glyph_array)
+
+def load_font_cached(font_path: Path, font_size: int, codepoints: set[str]) -> ray.Font:
+    """Load a font with the given codepoints, reusing the glyph atlas of an earlier launch.
+
+    Rasterizing thousands of CJK glyphs is the slow part of loading the font, so
+    the atlas and glyph metrics are saved in cache/fonts, keyed by the font file
+    and the codepoint set.
+
+    Args:
+        font_path (Path): The TTF or OTF file.
+        font_size (int): The size to rasterize the glyphs at.
+        codepoints (set[str]): The characters to include.
+
+    Returns:
+        ray.Font: The loaded font.
+    """
+    text = ''.join(sorted(codepoints))
+    try:
+        stat = font_path.stat()
+    except OSError as e:
+        logger.error(f"Failed to load font {font_path}: {e}")
+        return ray.get_font_default()
+    key = hashlib.sha256(f'{font_path}|{stat.st_size}|{stat.st_mtime_ns}|{font_size}|{text}'.encode('utf-8')).hexdigest()
+    atlas_path = FONT_CACHE_DIR / f'{key}.png'
+    glyphs_path = FONT_CACHE_DIR / f'{key}.json'
+
+    if atlas_path.exists() and glyphs_path.exists():
+        try:
+            with open(glyphs_path, 'r', encoding='utf-8') as f:
+                glyph_data = json.load(f)
+            atlas = rl.LoadImage(str(atlas_path).encode('utf-8'))
+            if atlas.data != rl.ffi.NULL:
+                font = _font_from_atlas(atlas, font_size, glyph_data['glyphs'], glyph_data['recs'])
+                rl.UnloadImage(atlas)
+                logger.info(f"Loaded font with {len(codepoints)} codepoints from {atlas_path}")
+                return font
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to load font cache {glyphs_path}: {e}")
+
+    font_data = font_path.read_bytes()
+    codepoint_array = rl.ffi.new('int[]', [ord(codepoint) for codepoint in text])
+    glyph_count = rl.ffi.new('int *', 0)
+    glyph_array = rl.LoadFontData(rl.ffi.from_buffer('unsigned char[]', font_data), len(font_data), font_size,
+                                  codepoint_array, len(text), rl.FONT_DEFAULT, glyph_count)
+    if glyph_array == rl.ffi.NULL:
+        logger.error(f"Failed to load font {font_path}")
+        return ray.get_font_default()
+    rec_array = rl.ffi.new('Rectangle **')
+    atlas = rl.GenImageFontAtlas(glyph_array, rec_array, glyph_count[0], font_size, FONT_GLYPH_PADDING, 0)
+    glyphs = [[glyph_array[i].value, glyph_array[i].offsetX, glyph_array[i].offsetY, glyph_array[i].advanceX]
+              for i in range(glyph_count[0])]
+    recs = [[rec_array[0][i].x, rec_array[0][i].y, rec_array[0][i].width, rec_array[0][i].height]
+            for i in range(glyph_count[0])]
+    rl.UnloadFontData(glyph_array, glyph_count[0])
+    rl.MemFree(rec_array[0])
+
+    try:
+        FONT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Only the latest codepoint set is worth keeping
+        for old_file in FONT_CACHE_DIR.iterdir():
+            old_file.unlink()
+        if rl.ExportImage(atlas, str(atlas_path).encode('utf-8')):
+            with open(glyphs_path, 'w', encoding='utf-8') as f:
+                json.dump({'glyphs': glyphs, 'recs': recs}, f)
+    except OSError as e:
+        logger.warning(f"Failed to save font cache {glyphs_path}: {e}")
+
+    font = _font_from_atlas(atlas, font_size, glyphs, recs)
+    rl.UnloadImage(atlas)
+    logger.info(f"Loaded font with {len(codepoints)} codepoints")
+    return font
+
 class OutlinedText:
     """Create an outlined text object."""
     def __init__(self, text: str, font_size: int, color: ray.Color, outline_thickness=5.0, vertical=False):
@@ -211,7 +303,7 @@ class OutlinedText:
         if reload_font:
             codepoint_count = ray.ffi.new('int *', 0)
             codepoints = ray.load_codepoints(''.join(global_data.font_codepoints), codepoint_count)
-            global_data.font = ray.load_font_ex(str(Path('Graphics/Modified-DFPKanteiryu-XB.ttf')), 40, codepoints, len(global_data.font_codepoints))
+            global_data.font = ray.load_font_ex(str(FONT_PATH), 40, codepoints, len(global_data.font_codepoints))
             logger.info(f"Reloaded font with {len(global_data.font_codepoints)} codepoints")
         return global_data.font
 
@@ -5,7 +5,7 @@ import logging
 from libs.animation import Animation
 from libs.audio import audio
 from libs.background import Background
-from libs.file_navigator import Exam
+from libs.file_navigator import Exam, count_dan_notes
 from libs.global_data import DanResultExam, DanResultSong, PlayerNum, global_data
 from libs.global_objects import AllNetIcon
 from libs.tja import TJAParser
@@ -57,16 +57,7 @@ class DanGameScreen(GameScreen):
         session_data = global_data.session_data[global_data.player_num]
         songs = copy.deepcopy(session_data.selected_dan)
         self.exams = copy.deepcopy(session_data.selected_dan_exam)
-        self.total_notes = 0
-        for song, genre_index, difficulty, level in songs:
-            notes, branch_m, branch_e, branch_n = song.notes_to_position(difficulty)
-            self.total_notes += sum(1 for note in notes.play_notes if note.type < 5)
-            for branch in branch_m:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
-            for branch in branch_e:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
-            for branch in branch_n:
-                self.total_notes += sum(1 for note in branch.play_notes if note.type < 5)
+        self.total_notes = count_dan_notes(songs)
         song, genre_index, difficulty, level = songs[self.song_index]
         session_data.selected_difficulty = difficulty
         self.init_tja(song.file_path)
@@ -2,7 +2,6 @@ import bisect
 from enum import IntEnum
 import math
 import logging
-import sqlite3
 from collections import deque
 from pathlib import Path
 from typing import Optional
@@ -16,14 +15,20 @@ from libs.background import Background
 from libs.chara_2d import Chara2D
 from libs.global_data import Crown, Difficulty, Modifiers, PlayerNum
 from libs.global_objects import AllNetIcon, Nameplate
+from libs.score_store import score_store
 from libs.screen import Screen
 from libs.texture import tex
 from libs.tja import (
+    CAMERA_FLAGS,
     Balloon,
+    CameraMove,
     Drumroll,
     Note,
+    NoteColumns,
+    NoteFlag,
     NoteList,
     NoteType,
+    TimelineFlag,
     TJAParser,
     apply_modifiers,
     calculate_base_score,
@@ -149,7 +154,8 @@ class GameScreen(Screen):
         self.start_ms = get_current_ms() - self.tja.metadata.offset*1000
 
     def get_song_hash(self, song: Path):
-        notes, branch_m, branch_e, branch_n = TJAParser.notes_to_position(TJAParser(song), self.player_1.difficulty)
+        # Hashed at the default geometry, which is not worth a chart cache entry of its own
+        notes, branch_m, branch_e, branch_n = TJAParser(song).notes_to_position(self.player_1.difficulty, use_cache=False)
         if branch_m:
             for branch in branch_m:
                 notes.play_notes.extend(branch.play_notes)
@@ -172,40 +178,29 @@ class GameScreen(Screen):
         """Write the score to the database"""
         if global_data.modifiers[global_data.player_num].auto:
             return
-        with sqlite3.connect('scores.db') as con:
-            session_data = global_data.session_data[global_data.player_num]
-            cursor = con.cursor()
-            hash = self.get_song_hash(session_data.selected_song)
-            check_query = "SELECT score, clear FROM Scores WHERE hash = ? LIMIT 1"
-            cursor.execute(check_query, (hash,))
-            result = cursor.fetchone()
-            existing_score = result[0] if result is not None else None
-            existing_crown = result[1] if result is not None and len(result) > 1 and result[1] is not None else 0
-            crown = Crown.NONE
-            if session_data.result_data.bad and session_data.result_data.ok == 0:
-                crown = Crown.DFC
-            elif session_data.result_data.bad == 0:
-                crown = Crown.FC
-            elif self.player_1.gauge.is_clear:
-                crown = Crown.CLEAR
-            logger.info(f"Existing score: {existing_score}, Existing crown: {existing_crown}, New score: {session_data.result_data.score}, New crown: {crown}")
-            if result is None or (existing_score is not None and session_data.result_data.score > existing_score):
-                insert_query = '''
-                INSERT OR REPLACE INTO Scores (hash, en_name, jp_name, diff, score, good, ok, bad, drumroll, combo, clear)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-                '''
-                data = (hash, self.tja.metadata.title['en'],
-                        self.tja.metadata.title.get('ja', ''), self.player_1.difficulty,
-                        session_data.result_data.score, session_data.result_data.good,
-                        session_data.result_data.ok, session_data.result_data.bad,
-                        session_data.result_data.total_drumroll, session_data.result_data.max_combo, crown)
-                cursor.execute(insert_query, data)
-                session_data.result_data.prev_score = existing_score if existing_score is not None else 0
-                logger.info(f"Wrote score {session_data.result_data.score} for {self.tja.metadata.title['en']}")
-                con.commit()
-            if result is None or (existing_crown is not None and crown > existing_crown):
-                cursor.execute("UPDATE Scores SET clear = ? WHERE hash = ?", (crown, hash))
-                con.commit()
+        session_data = global_data.session_data[global_data.player_num]
+        hash = self.get_song_hash(session_data.selected_song)
+        result = score_store.get(hash)
+        existing_score = result[0] if result is not None else None
+        existing_crown = result[5] if result is not None and result[5] is not None else 0
+        crown = Crown.NONE
+        if session_data.result_data.bad and session_data.result_data.ok == 0:
+            crown = Crown.DFC
+        elif session_data.result_data.bad == 0:
+            crown = Crown.FC
+        elif self.player_1.gauge.is_clear:
+            crown = Crown.CLEAR
+        logger.info(f"Existing score: {existing_score}, Existing crown: {existing_crown}, New score: {session_data.result_data.score}, New crown: {crown}")
+        if result is None or (existing_score is not None and session_data.result_data.score > existing_score):
+            score_store.write_score(hash, self.tja.metadata.title['en'],
+                                    self.tja.metadata.title.get('ja', ''), self.player_1.difficulty,
+                                    session_data.result_data.score, session_data.result_data.good,
+                                    session_data.result_data.ok, session_data.result_data.bad,
+                                    session_data.result_data.total_drumroll, session_data.result_data.max_combo, crown)
+            session_data.result_data.prev_score = existing_score if existing_score is not None else 0
+            logger.info(f"Wrote score {session_data.result_data.score} for {self.tja.metadata.title['en']}")
+        if result is None or (existing_crown is not None and crown > existing_crown):
+            score_store.write_crown(hash, crown)
 
     def start_song(self, ms_from_start):
         if (ms_from_start >= self.tja.metadata.offset*1000 + self.start_delay - global_data.config["general"]["audio_offset"]) and not self.song_started:
@@ -391,13 +386,13 @@ class Player:
         self.don_notes = deque([note for note in self.play_notes if note.type in {NoteType.DON, NoteType.DON_L}])
         self.kat_notes = deque([note for note in self.play_notes if note.type in {NoteType.KAT, NoteType.KAT_L}])
         self.other_notes = deque([note for note in self.play_notes if note.type not in {NoteType.DON, NoteType.DON_L, NoteType.KAT, NoteType.KAT_L}])
-        self.total_notes = len([note for note in self.play_notes if 0 < note.type < 5])
         total_notes = notes
         if self.branch_m:
             for section in self.branch_m:
-                self.total_notes += len([note for note in section.play_notes if 0 < note.type < 5])
                 total_notes += section
-        self.base_score = calculate_base_score(total_notes)
+        note_columns = NoteColumns(total_notes.play_notes)
+        self.total_notes = note_columns.count_notes()
+        self.base_score = calculate_base_score(note_columns)
 
         #Note management
         self.timeline = notes.timeline
@@ -414,29 +409,45 @@ class Player:
         self.branch_condition = ''
         self.balloon_index = 0
         self.bpm = 120
-        if self.timeline and hasattr(self.timeline[self.timeline_index], 'bpm'):
+        if self.timeline and self.timeline[self.timeline_index].flags & TimelineFlag.BPM:
             self.bpm = self.timeline[self.timeline_index].bpm
         # Handle HBSCROLL, BMSCROLL (pre-modify hit_ms, so that notes can't be literally hit, but are still visually different) - basically it applies the transformations of #BPMCHANGE and #DELAY to hit_ms, so that notes can't be hit even if its visaulyl
         for i, o in enumerate(self.timeline):
-            if hasattr(o, 'bpmchange'):
+            if o.flags & TimelineFlag.BPMCHANGE:
                 hit_ms = o.hit_ms
                 bpmchange = o.bpmchange
                 for note in chain(self.play_notes, self.current_bars, self.draw_bar_list):
                     if note.hit_ms > hit_ms:
                         note.hit_ms = (note.hit_ms - hit_ms) / bpmchange + hit_ms
+                for move in notes.camera_moves:
+                    if move.start_ms > hit_ms:
+                        move.start_ms = (move.start_ms - hit_ms) / bpmchange + hit_ms
+                    if move.end_ms > hit_ms:
+                        move.end_ms = (move.end_ms - hit_ms) / bpmchange + hit_ms
                 for i2 in range(i + 1, len(self.timeline)):
                     o2 = self.timeline[i2]
                     o2.hit_ms = (o2.hit_ms - hit_ms) / bpmchange + hit_ms
-            elif hasattr(o, 'delay'):
+            elif o.flags & TimelineFlag.DELAY:
                 hit_ms = o.hit_ms
                 delay = o.delay
                 for note in chain(self.play_notes, self.current_bars, self.draw_bar_list):
                     if note.hit_ms > hit_ms:
                         note.hit_ms += delay
+                for move in notes.camera_moves:
+                    if move.start_ms > hit_ms:
+                        move.start_ms += delay
+                    if move.end_ms > hit_ms:
+                        move.end_ms += delay
                 for i2 in range(i + 1, len(self.timeline)):
                     o2 = self.timeline[i2]
                     o2.hit_ms += delay
 
+        # Camera moves per camera attribute, each with its own cursor to the current move
+        self.camera_moves: dict[str, list[CameraMove]] = dict()
+        for move in sorted(notes.camera_moves, key=lambda x: x.start_ms):
+            self.camera_moves.setdefault(move.attribute, []).append(move)
+        self.camera_move_index = dict.fromkeys(self.camera_moves, 0)
+
         # Decide end_time after all transforms have been applied
         self.end_time = 0
         if self.play_notes:
@@ -506,39 +517,50 @@ class Player:
         timeline_object = self.timeline[self.timeline_index]
         should_advance = False
 
-        if hasattr(timeline_object, 'border_color') and timeline_object.hit_ms <= current_ms:
+        if timeline_object.flags & TimelineFlag.BORDER_COLOR and timeline_object.hit_ms <= current_ms:
             global_data.camera.border_color = timeline_object.border_color
             should_advance = True
 
-        if hasattr(timeline_object, 'cam_h_offset') and timeline_object.hit_ms <= current_ms:
-            orig_offset = global_data.camera.offset
-            global_data.camera.offset = ray.Vector2(timeline_object.cam_h_offset, orig_offset.y)
-            should_advance = True
-
-        if hasattr(timeline_object, 'cam_v_offset') and timeline_object.hit_ms <= current_ms:
-            orig_offset = global_data.camera.offset
-            global_data.camera.offset = ray.Vector2(orig_offset.x, timeline_object.cam_v_offset)
-            should_advance = True
-
-        if hasattr(timeline_object, 'cam_zoom') and timeline_object.hit_ms <= current_ms:
-            global_data.camera.zoom = timeline_object.cam_zoom
-            should_advance = True
-
-        if hasattr(timeline_object, 'cam_h_scale') and timeline_object.hit_ms <= current_ms:
-            global_data.camera.h_scale = timeline_object.cam_h_scale
-            should_advance = True
-
-        if hasattr(timeline_object, 'cam_v_scale') and timeline_object.hit_ms <= current_ms:
-            global_data.camera.v_scale = timeline_object.cam_v_scale
-            should_advance = True
-
-        if hasattr(timeline_object, 'cam_rotation') and timeline_object.hit_ms <= current_ms:
-            global_data.camera.rotation = timeline_object.cam_rotation
-            should_advance = True
+        if timeline_object.hit_ms <= current_ms:
+            for attribute, flag in CAMERA_FLAGS.items():
+                if timeline_object.flags & flag:
+                    self.set_camera(attribute, getattr(timeline_object, attribute))
+                    should_advance = True
 
         if should_advance:
             self.timeline_index += 1
 
+    def set_camera(self, attribute: str, value: float):
+        """Set a camera attribute, named like the TimelineObject attribute, on the global camera"""
+        camera = global_data.camera
+        if attribute == 'cam_h_offset':
+            camera.offset = ray.Vector2(value, camera.offset.y)
+        elif attribute == 'cam_v_offset':
+            camera.offset = ray.Vector2(camera.offset.x, value)
+        elif attribute == 'cam_zoom':
+            camera.zoom = value
+        elif attribute == 'cam_h_scale':
+            camera.h_scale = value
+        elif attribute == 'cam_v_scale':
+            camera.v_scale = value
+        elif attribute == 'cam_rotation':
+            camera.rotation = value
+
+    def update_camera_moves(self, current_ms: float):
+        """Evaluate the camera moves that are active at current_ms"""
+        for attribute, moves in self.camera_moves.items():
+            index = self.camera_move_index[attribute]
+            if index >= len(moves) or current_ms < moves[index].start_ms:
+                continue
+            # Skip moves that were entirely passed in a single frame
+            while index + 1 < len(moves) and moves[index + 1].start_ms <= current_ms:
+                index += 1
+            move = moves[index]
+            self.set_camera(attribute, move.value_at(current_ms))
+            if current_ms >= move.end_ms:
+                index += 1
+            self.camera_move_index[attribute] = index
+
     def get_judge_position(self, current_ms: float):
         """Get the current judgment circle position based on bar data with on-demand interpolation"""
         if not self.timeline or self.timeline_index >= len(self.timeline):
@@ -546,7 +568,7 @@ class Player:
 
         timeline_object = self.timeline[self.timeline_index]
 
-        if hasattr(timeline_object, 'delta_x'):
+        if timeline_object.flags & TimelineFlag.JPOSSCROLL:
             if timeline_object.load_ms <= current_ms <= timeline_object.hit_ms:
                 duration = timeline_object.hit_ms - timeline_object.load_ms
                 if duration > 0:
@@ -563,7 +585,7 @@ class Player:
                 self.timeline_index += 1
                 if self.timeline_index < len(self.timeline):
                     next_timeline_object = self.timeline[self.timeline_index]
-                    if hasattr(next_timeline_object, 'delta_x'):
+                    if next_timeline_object.flags & TimelineFlag.JPOSSCROLL:
                         next_timeline_object.judge_pos_x = self.judge_x / tex.screen_scale
                         next_timeline_object.judge_pos_y = self.judge_y / tex.screen_scale
 
@@ -574,7 +596,7 @@ class Player:
         timeline_object = self.timeline[self.timeline_index]
         should_advance = False
 
-        if hasattr(timeline_object, 'bpmchange') and timeline_object.hit_ms <= current_ms:
+        if timeline_object.flags & TimelineFlag.BPMCHANGE and timeline_object.hit_ms <= current_ms:
             hit_ms = timeline_object.hit_ms
             bpmchange = timeline_object.bpmchange
             # Adjust notes (visually)
@@ -598,7 +620,7 @@ class Player:
             self.bpm *= bpmchange
             should_advance = True
 
-        if hasattr(timeline_object, 'delay') and timeline_object.hit_ms <= current_ms:
+        if timeline_object.flags & TimelineFlag.DELAY and timeline_object.hit_ms <= current_ms:
             hit_ms = timeline_object.hit_ms
             delay = timeline_object.delay
             if self.delay_start is not None:
@@ -617,7 +639,7 @@ class Player:
         if not self.timeline or self.timeline_index >= len(self.timeline):
             return
         timeline_object = self.timeline[self.timeline_index]
-        if hasattr(timeline_object, 'bpm') and timeline_object.hit_ms <= current_ms:
+        if timeline_object.flags & TimelineFlag.BPM and timeline_object.hit_ms <= current_ms:
             self.bpm = timeline_object.bpm
             self.timeline_index += 1
 
@@ -652,9 +674,9 @@ class Player:
             if position >= removal_threshold:
                 bars_to_keep.append(bar)
         self.current_bars = bars_to_keep
-        if self.current_bars and hasattr(self.current_bars[-1], 'branch_params'):
+        if self.current_bars and self.current_bars[-1].flags & NoteFlag.BRANCH_PARAMS:
             self.branch_condition, e_req, m_req = self.current_bars[-1].branch_params.split(',')
-            delattr(self.current_bars[-1], 'branch_params')
+            self.current_bars[-1].flags &= ~NoteFlag.BRANCH_PARAMS
             e_req = float(e_req)
             m_req = float(m_req)
             logger.info(f'branch condition measures started with conditions {self.branch_condition}, {e_req}, {m_req}, {self.current_bars[-1].hit_ms}')
@@ -696,7 +718,7 @@ class Player:
                     for notes in note_lists:
                         for note in notes:
                             if note.type <= 4 and start_time <= note.hit_ms < branch_start_time:
-                                seen_notes.add(note)
+                                seen_notes.add((note.type, note.hit_ms, note.load_ms))
 
                     self.curr_branch_reqs = [e_req, m_req, branch_start_time, max(len(seen_notes), 1)]
     def play_note_manager(self, current_ms: float, background: Optional[Background]):
@@ -1096,6 +1118,7 @@ class Player:
         self.animation_manager(self.draw_drum_hit_list, current_time)
         self.get_judge_position(ms_from_start)
         self.handle_tjap3_extended_commands(ms_from_start)
+        self.update_camera_moves(ms_from_start)
         self.handle_scroll_type_commands(ms_from_start)
         if self.delay_start is not None and self.delay_end is not None:
             # Currently, a delay is active: notes should be frozen at ms = delay_start
@@ -1223,7 +1246,7 @@ class Player:
             y_position = self.get_position_y(current_ms, bar)
             x_position += self.judge_x
             y_position += self.judge_y
-            if hasattr(bar, 'is_branch_start'):
+            if bar.flags & NoteFlag.BRANCH_START:
                 frame = 1
             else:
                 frame = 0
@@ -1249,7 +1272,7 @@ class Player:
             if note.type == NoteType.TAIL:
                 continue
 
-            if hasattr(note, 'sudden_appear_ms') and hasattr(note, 'sudden_moving_ms'):
+            if note.flags & NoteFlag.SUDDEN:
                 appear_ms = note.hit_ms - note.sudden_appear_ms
                 moving_start_ms = note.hit_ms - note.sudden_moving_ms
 
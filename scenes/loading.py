@@ -1,15 +1,17 @@
 import logging
-from pathlib import Path
 import threading
 
 import pyray as ray
 
 from libs.animation import Animation
 from libs.global_objects import AllNetIcon
+from libs.library_watcher import library_watcher
 from libs.screen import Screen
-from libs.song_hash import build_song_hashes
+from libs.song_hash import SongStream, build_song_hashes
+from libs.song_index import song_index
+from libs.tja import prune_chart_cache
 from libs.texture import tex
-from libs.utils import get_current_ms, global_data
+from libs.utils import FONT_PATH, get_current_ms, global_data, load_font_cached
 from libs.file_navigator import navigator
 
 
@@ -20,10 +22,11 @@ class LoadScreen(Screen):
         super().__init__(name)
         self.width = tex.screen_width
         self.height = tex.screen_height
-        self.songs_loaded = False
+        self.font_loaded = False
         self.navigator_started = False
         self.loading_complete = False
         self.navigator = navigator
+        self.song_stream = SongStream()
 
         # Progress bar settings
         self.progress_bar_width = self.width * 0.43
@@ -40,31 +43,26 @@ class LoadScreen(Screen):
 
     def _load_song_hashes(self):
         """Background thread function to load song hashes"""
-        global_data.song_hashes = build_song_hashes()
-        self.songs_loaded = True
+        build_song_hashes(song_stream=self.song_stream)
+        song_index.load_search()
+        prune_chart_cache()
         logger.info("Song hashes loaded")
 
     def _load_font(self):
-        for hash in global_data.song_hashes:
-            song_entry = global_data.song_hashes[hash]
-            for song in song_entry:
-                titles = song.get('title', dict())
-                subtitles = song.get('subtitle', dict())
-                for title in titles.values():
-                    for character in title:
-                        global_data.font_codepoints.add(character)
-                for subtitle in subtitles.values():
-                    for character in subtitle:
-                        global_data.font_codepoints.add(character)
-        codepoint_count = ray.ffi.new('int *', 0)
-        codepoints = ray.load_codepoints(''.join(global_data.font_codepoints), codepoint_count)
-        global_data.font = ray.load_font_ex(str(Path('Graphics/Modified-DFPKanteiryu-XB.ttf')), 40, codepoints, len(global_data.font_codepoints))
+        global_data.font_codepoints.update(song_index.get_codepoints())
+        global_data.font = load_font_cached(FONT_PATH, 40, global_data.font_codepoints)
 
     def _load_navigator(self):
         """Background thread function to load navigator"""
-        self.navigator.initialize(global_data.config["paths"]["tja_path"])
+        self.navigator.initialize(global_data.config["paths"]["tja_path"], song_stream=self.song_stream)
         self.loading_complete = True
         logger.info("Navigator initialized")
+        # Song select opens once the first folder is complete, the songs indexed after that reach it
+        # through the library watcher's changes like songs added while the game runs
+        changes = self.navigator.take_deferred_changes()
+        if changes:
+            library_watcher.changes.put(changes)
+        library_watcher.start()
 
     def on_screen_start(self):
         tex.load_screen_textures(self.screen_name)
@@ -75,26 +73,26 @@ class LoadScreen(Screen):
         logger.info("Started song hashes loading thread")
 
     def on_screen_end(self, next_screen: str):
-        if self.loading_thread and self.loading_thread.is_alive():
-            self.loading_thread.join(timeout=1.0)
-            logger.info("Joined song hashes loading thread")
-        if self.navigator_thread and self.navigator_thread.is_alive():
-            self.navigator_thread.join(timeout=1.0)
-            logger.info("Joined navigator loading thread")
+        # Not joined, both threads keep going until the songs song select did not wait for are indexed
         return super().on_screen_end(next_screen)
 
     def update(self):
         super().update()
 
-        if self.songs_loaded and not self.navigator_started:
-            self._load_font()
+        # The navigator is built while the songs are indexed, taking each song as it is ready
+        if self.song_stream.scanned.is_set() and not self.navigator_started:
             self.navigator_thread = threading.Thread(target=self._load_navigator)
             self.navigator_thread.daemon = True
             self.navigator_thread.start()
             self.navigator_started = True
             logger.info("Started navigator loading thread")
 
-        if self.loading_complete and self.fade_in is None:
+        if self.loading_complete and not self.font_loaded:
+            # Titles indexed later add their characters to the font as they are drawn
+            self._load_font()
+            self.font_loaded = True
+
+        if self.loading_complete and self.font_loaded and self.fade_in is None:
             self.fade_in = Animation.create_fade(1000, initial_opacity=0.0, final_opacity=1.0, ease_in='cubic')
             self.fade_in.start()
             logger.info("Fade-in animation started")
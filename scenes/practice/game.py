@@ -9,7 +9,7 @@ from libs.animation import Animation
 from libs.audio import audio
 from libs.background import Background
 from libs.global_data import Modifiers, PlayerNum, global_data
-from libs.tja import Balloon, Drumroll, Note, NoteType, TJAParser, apply_modifiers
+from libs.tja import Balloon, Drumroll, Note, NoteColumns, NoteFlag, NoteType, TJAParser, apply_modifiers
 from libs.utils import get_current_ms
 from libs.texture import tex
 from scenes.game import DrumHitEffect, DrumType, GameScreen, JudgeCounter, LaneHitEffect, Player, Side
@@ -84,7 +84,7 @@ class PracticeGameScreen(GameScreen):
             self.player_1.other_notes = deque([note for note in self.player_1.other_notes if note.hit_ms > resume_time])
             self.player_1.draw_note_list = deque([note for note in self.player_1.draw_note_list if note.hit_ms > resume_time])
             self.player_1.draw_bar_list = deque([note for note in self.player_1.draw_bar_list if note.hit_ms > resume_time])
-            self.player_1.total_notes = len([note for note in self.player_1.play_notes if 0 < note.type < 5])
+            self.player_1.total_notes = NoteColumns(self.player_1.play_notes).count_notes()
 
             self.pause_time = start_time
             audio.play_music_stream(self.song_music, 'music')
@@ -212,7 +212,7 @@ class PracticeGameScreen(GameScreen):
             y_position = self.get_position_y(self.current_ms, bar.load_ms, bar.pixels_per_frame_y, bar.pixels_per_frame_x)
             if x_position < tex.skin_config["past_judge_circle"].x or x_position > tex.screen_width:
                 continue
-            if hasattr(bar, 'is_branch_start'):
+            if bar.flags & NoteFlag.BRANCH_START:
                 frame = 1
             else:
                 frame = 0
@@ -11,6 +11,7 @@ from libs.chara_2d import Chara2D
 from libs.file_navigator import Directory, SongBox, SongFile
 from libs.global_data import Difficulty, Modifiers, PlayerNum
 from libs.global_objects import AllNetIcon, CoinOverlay, Nameplate, Indicator, Timer
+from libs.library_watcher import library_watcher
 from libs.screen import Screen
 from libs.texture import tex
 from libs.transition import Transition
@@ -30,6 +31,7 @@ class State:
     BROWSING = 0
     SONG_SELECTED = 1
     DIFF_SORTING = 2
+    SEARCHING = 3
 
 class SongSelectScreen(Screen):
     BOX_CENTER = 444
@@ -65,6 +67,7 @@ class SongSelectScreen(Screen):
         self.screen_init = True
         self.ura_switch_animation = UraSwitchAnimation()
         self.dan_transition = DanTransition()
+        self.search_bar = SearchBar()
 
         session_data = global_data.session_data[global_data.player_num]
         self.player_1 = SongSelectPlayer(global_data.player_num, self.text_fade_in)
@@ -76,7 +79,7 @@ class SongSelectScreen(Screen):
         if str(session_data.selected_song) in self.navigator.all_song_files:
             selected_song = self.navigator.all_song_files[str(session_data.selected_song)]
             if not isinstance(selected_song, DanCourse):
-                self.navigator.mark_crowns_dirty_for_song(selected_song)
+                self.navigator.update_song_crowns(selected_song)
 
         curr_item = self.navigator.get_current_item()
         if isinstance(curr_item, SongFile):
@@ -163,6 +166,40 @@ class SongSelectScreen(Screen):
             if not isinstance(current_box, SongBox):
                 return
             current_box.is_favorite = not current_box.is_favorite
+        elif action == "search":
+            self.state = State.SEARCHING
+            # Keep editing the last query when already looking at its results
+            if not self.navigator.is_in_search():
+                self.search_bar.set_query('')
+
+    def handle_input_search(self):
+        """Handle typing a search query, showing the matching songs after every keystroke."""
+        query = self.search_bar.query
+        char = ray.get_char_pressed()
+        while char > 0:
+            query += chr(char)
+            char = ray.get_char_pressed()
+        if ray.is_key_pressed(ray.KeyboardKey.KEY_BACKSPACE) or ray.is_key_pressed_repeat(ray.KeyboardKey.KEY_BACKSPACE):
+            query = query[:-1]
+
+        if query != self.search_bar.query:
+            self.reset_demo_music()
+            self.search_bar.set_query(query)
+            if query.strip():
+                self.navigator.search(query)
+            else:
+                self.navigator.exit_search()
+            self.last_moved = get_current_ms()
+
+        if ray.is_key_pressed(ray.KeyboardKey.KEY_ENTER):
+            self.state = State.BROWSING
+
+    def _cancel_search(self):
+        """Leave search mode and return to the folder the search was started from"""
+        self.reset_demo_music()
+        self.search_bar.set_query('')
+        self.navigator.exit_search()
+        self.state = State.BROWSING
 
     def handle_input_selected(self):
         """Handle input for selecting difficulty."""
@@ -247,6 +284,9 @@ class SongSelectScreen(Screen):
         if ret_val is not None:
             return ret_val
         current_time = get_current_ms()
+        if self.state == State.BROWSING:
+            for changes in library_watcher.poll_changes():
+                self.navigator.apply_library_changes(changes)
         self.background_move.update(current_time)
         self.move_away.update(current_time)
         self.diff_fade_out.update(current_time)
@@ -313,6 +353,9 @@ class SongSelectScreen(Screen):
                     self.texture_index = current_box.texture_index
 
         if ray.is_key_pressed(global_data.config["keys"]["back_key"]):
+            if self.state == State.SEARCHING:
+                self._cancel_search()
+                return
             logger.info("Back key pressed, returning to ENTRY screen")
             return self.on_screen_end('ENTRY')
 
@@ -345,6 +388,9 @@ class SongSelectScreen(Screen):
         if self.diff_sort_selector is not None:
             self.diff_sort_selector.draw()
 
+        if self.state == State.SEARCHING:
+            self.search_bar.draw()
+
         if (self.player_1.selected_song and self.state == State.SONG_SELECTED):
             tex.draw_texture('global', 'difficulty_select', fade=self.text_fade_in.attribute)
         elif self.state == State.DIFF_SORTING:
@@ -363,7 +409,7 @@ class SongSelectScreen(Screen):
 
         tex.draw_texture('global', 'song_num_bg', fade=0.75)
         tex.draw_texture('global', 'song_num', frame=global_data.songs_played % 4)
-        if self.state == State.BROWSING or self.state == State.DIFF_SORTING:
+        if self.state == State.BROWSING or self.state == State.DIFF_SORTING or self.state == State.SEARCHING:
             self.timer_browsing.draw()
         elif self.state == State.SONG_SELECTED:
             self.timer_selected.draw()
@@ -477,6 +523,11 @@ class SongSelectPlayer:
             audio.play_sound('add_favorite', 'sound')
             return "add_favorite"
 
+        # Search
+        if ray.is_key_pressed(global_data.config["keys"].get("search_key", ray.KeyboardKey.KEY_F3)):
+            audio.play_sound('don', 'sound')
+            return "search"
+
         return None
 
     def handle_input_diff_sort(self, diff_sort_selector):
@@ -507,6 +558,8 @@ class SongSelectPlayer:
             screen.handle_input_selected()
         elif state == State.DIFF_SORTING:
             screen.handle_input_diff_sort()
+        elif state == State.SEARCHING:
+            screen.handle_input_search()
 
     def handle_input_selected(self, current_item):
         """Handle input for selecting difficulty. Returns 'cancel', 'confirm', or None"""
@@ -747,6 +800,27 @@ class UraSwitchAnimation:
     def draw(self):
         tex.draw_texture('diff_select', 'ura_switch', frame=self.texture_change.attribute, fade=self.fade_out.attribute)
 
+class SearchBar:
+    """The query typed in search mode."""
+    def __init__(self):
+        self.query = ''
+        self.text = OutlinedText('検索:', tex.skin_config["song_hori_name"].font_size, ray.WHITE, outline_thickness=5)
+
+    def set_query(self, query: str):
+        if query == self.query:
+            return
+        self.query = query
+        self.text.unload()
+        self.text = OutlinedText(f'検索: {query}', tex.skin_config["song_hori_name"].font_size, ray.WHITE, outline_thickness=5)
+
+    def draw(self):
+        padding = 20 * tex.screen_scale
+        x = (tex.screen_width - self.text.texture.width) // 2
+        y = 100 * tex.screen_scale
+        ray.draw_rectangle(int(x - padding), int(y - padding // 2), int(self.text.texture.width + padding * 2),
+                           int(self.text.texture.height + padding), ray.fade(ray.BLACK, 0.6))
+        self.text.draw(outline_color=ray.BLACK, x=x, y=y)
+
 class DiffSortSelect:
     """The menu for selecting the difficulty sort and level sort."""
     def __init__(self, statistics: dict[int, dict[int, list[int]]], prev_diff: int, prev_level: int):